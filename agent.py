@@ -11,6 +11,24 @@ import time
 import re
 import enum
 import unicodedata
+import difflib
+import heapq
+import plistlib
+import glob
+import selectors
+import signal
+import shlex
+import uuid
+import atexit
+import collections
+import array
+import tempfile
+import itertools
+import fnmatch
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.thread import BrokenThreadPool
 
 # LangChain imports
 from langchain.agents import AgentExecutor, create_openai_tools_agent
@@ -24,40 +42,3396 @@ from langchain_core.callbacks import StreamingStdOutCallbackHandler
 import asyncio
 from langchain_core.callbacks.base import BaseCallbackHandler
 
+import content_search
+
+# 可选依赖：watchdog (macOS上基于FSEvents)，未安装时目录监视退回到轮询
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
 # 全局变量，用于工具访问R1增强器
 intelligent_assistant = None
 
+# 本地数据目录（应用索引等持久化缓存）
+APP_DATA_DIR = os.environ.get("MACOS_COPILOT_HOME", os.path.expanduser("~/.macos_copilot"))
+
+# 应用程序搜索目录
+APPLICATION_SEARCH_PATHS = [
+    '/Applications',
+    '/System/Applications',
+    '/System/Applications/Utilities',
+    os.path.expanduser('~/Applications')
+]
+
+class DirectoryWatcher:
+    """目录变化监视器
+
+    订阅者登记一组目录和回调，目录内容变化时只把发生变化的目录传给对应回调。
+    安装了watchdog时使用原生文件系统事件，否则在后台线程中轮询目录mtime，
+    轮询方式不依赖平台，在Linux上同样可用。
+    """
+
+    def __init__(self, interval: float = 2.0, use_native: bool = True):
+        """初始化监视器
+
+        Args:
+            interval: 轮询间隔(秒)
+            use_native: 是否优先使用watchdog原生事件
+        """
+        self.interval = interval
+        self.use_native = use_native and Observer is not None
+        self._lock = threading.Lock()
+        self._subscriptions = {}   # 订阅名称 -> (目录集合, 回调)
+        self._mtimes = {}          # 目录 -> 上次观察到的mtime
+        self._native_watches = {}  # 目录 -> watchdog监视句柄
+        self._observer = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def backend(self) -> str:
+        """当前使用的监视方式: native / polling"""
+        return "native" if self._observer is not None else "polling"
+
+    @property
+    def is_running(self) -> bool:
+        return self._observer is not None or (self._thread is not None and self._thread.is_alive())
+
+    def watch(self, name: str, paths, callback: Callable[[List[str]], None]):
+        """登记(或替换)一组需要监视的目录
+
+        Args:
+            name: 订阅名称，同名订阅会被替换
+            paths: 目录列表
+            callback: 回调函数，参数为发生变化的目录列表
+        """
+        with self._lock:
+            paths = set(paths)
+            self._subscriptions[name] = (paths, callback)
+            for path in paths:
+                if path not in self._mtimes:
+                    self._mtimes[path] = ApplicationIndex._mtime(path)
+            self._sync_native_watches()
+
+    def unwatch(self, name: str):
+        """取消订阅"""
+        with self._lock:
+            self._subscriptions.pop(name, None)
+            self._sync_native_watches()
+
+    def _watched_paths(self) -> set:
+        paths = set()
+        for sub_paths, _ in self._subscriptions.values():
+            paths |= sub_paths
+        return paths
+
+    def _sync_native_watches(self):
+        """使watchdog的监视目录与订阅保持一致（调用方持有锁）"""
+        watched = self._watched_paths()
+        for path in list(self._mtimes):
+            if path not in watched:
+                del self._mtimes[path]
+        if self._observer is None:
+            return
+        for path in list(self._native_watches):
+            if path not in watched:
+                try:
+                    self._observer.unschedule(self._native_watches.pop(path))
+                except Exception:
+                    pass
+        for path in watched:
+            if path not in self._native_watches and os.path.isdir(path):
+                try:
+                    self._native_watches[path] = self._observer.schedule(
+                        _WatchdogEventHandler(self), path, recursive=False)
+                except Exception:
+                    continue
+
+    def start(self):
+        """启动监视"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        if self.use_native:
+            try:
+                self._observer = Observer()
+                self._observer.start()
+            except Exception as e:
+                print(f"启动原生目录监视失败，改用轮询: {str(e)}")
+                self._observer = None
+        if self._observer is None:
+            self._thread = threading.Thread(target=self._poll_loop, name="DirectoryWatcher", daemon=True)
+            self._thread.start()
+        with self._lock:
+            self._sync_native_watches()
+
+    def stop(self):
+        """停止监视"""
+        self._stop_event.set()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+            except Exception:
+                pass
+            self._observer = None
+            self._native_watches = {}
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _poll_loop(self):
+        while not self._stop_event.wait(self.interval):
+            self.poll_once()
+
+    def poll_once(self) -> List[str]:
+        """比较一次所有被监视目录的mtime，并通知订阅者
+
+        Returns:
+            发生变化的目录列表
+        """
+        with self._lock:
+            paths = list(self._mtimes)
+        changed = []
+        for path in paths:
+            mtime = ApplicationIndex._mtime(path)
+            with self._lock:
+                if path in self._mtimes and self._mtimes[path] != mtime:
+                    self._mtimes[path] = mtime
+                    changed.append(path)
+        if changed:
+            self._dispatch(changed)
+        return changed
+
+    def _dispatch(self, changed: List[str]):
+        with self._lock:
+            subscriptions = list(self._subscriptions.values())
+        for paths, callback in subscriptions:
+            affected = [path for path in changed if path in paths]
+            if affected:
+                try:
+                    callback(affected)
+                except Exception as e:
+                    print(f"目录变化回调失败: {str(e)}")
+
+class _WatchdogEventHandler(FileSystemEventHandler):
+    """把watchdog事件转换为被监视目录的变化通知"""
+
+    def __init__(self, watcher: DirectoryWatcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        paths = {event.src_path, os.path.dirname(event.src_path)}
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            paths |= {dest_path, os.path.dirname(dest_path)}
+        with self.watcher._lock:
+            watched = self.watcher._watched_paths()
+        changed = [path for path in paths if isinstance(path, str) and path in watched]
+        if changed:
+            self.watcher._dispatch(changed)
+
+# 读取应用本地化名称时关注的语言目录
+BUNDLE_NAME_LANGUAGES = ['zh_CN', 'zh-Hans', 'zh_TW', 'zh-Hant', 'zh_HK', 'zh', 'en', 'English', 'Base']
+
+_STRINGS_ENTRY_RE = re.compile(r'"?(CFBundleDisplayName|CFBundleName)"?\s*=\s*"((?:[^"\\]|\\.)*)"\s*;')
+
+def _parse_strings_file(path: str) -> Dict[str, str]:
+    """解析InfoPlist.strings (二进制/XML plist或"key" = "value";文本格式)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        parsed = plistlib.loads(data)
+        if isinstance(parsed, dict):
+            return {k: v for k, v in parsed.items() if isinstance(v, str)}
+    except Exception:
+        pass
+    if data.startswith((b'\xff\xfe', b'\xfe\xff')):
+        text = data.decode('utf-16', errors='ignore')
+    else:
+        text = data.decode('utf-8', errors='ignore')
+    return {key: value.replace('\\"', '"') for key, value in _STRINGS_ENTRY_RE.findall(text)}
+
+def read_bundle_metadata(app_path: str) -> Dict[str, Any]:
+    """读取应用包的Info.plist及本地化名称
+
+    Args:
+        app_path: .app包路径
+
+    Returns:
+        包含bundle_id、bundle_name、display_name和localized_names的字典
+    """
+    contents = os.path.join(app_path, 'Contents')
+    metadata = {"bundle_id": "", "bundle_name": "", "display_name": "", "localized_names": []}
+    try:
+        with open(os.path.join(contents, 'Info.plist'), 'rb') as f:
+            info = plistlib.load(f)
+        metadata["bundle_id"] = str(info.get('CFBundleIdentifier', ''))
+        metadata["bundle_name"] = str(info.get('CFBundleName', ''))
+        metadata["display_name"] = str(info.get('CFBundleDisplayName', ''))
+    except Exception:
+        pass
+
+    names = []
+    resources = os.path.join(contents, 'Resources')
+    for lang in BUNDLE_NAME_LANGUAGES:
+        strings_path = os.path.join(resources, f'{lang}.lproj', 'InfoPlist.strings')
+        if not os.path.exists(strings_path):
+            continue
+        try:
+            strings = _parse_strings_file(strings_path)
+        except Exception:
+            continue
+        names.extend(strings.get(key) for key in ('CFBundleDisplayName', 'CFBundleName'))
+
+    # 新版系统应用把本地化字符串放在InfoPlist.loctable中: {语言: {键: 值}}
+    for loctable_path in glob.glob(os.path.join(resources, '*InfoPlist.loctable')):
+        try:
+            with open(loctable_path, 'rb') as f:
+                table = plistlib.load(f)
+        except Exception:
+            continue
+        for lang in BUNDLE_NAME_LANGUAGES:
+            strings = table.get(lang)
+            if isinstance(strings, dict):
+                names.extend(strings.get(key) for key in ('CFBundleDisplayName', 'CFBundleName'))
+
+    seen = set()
+    for name in names:
+        if isinstance(name, str) and name.strip() and name not in seen:
+            seen.add(name)
+            metadata["localized_names"].append(name.strip())
+    return metadata
+
+class ApplicationIndex:
+    """已安装应用程序的持久化索引
+
+    首次使用时扫描各搜索目录并将每个应用的名称、路径和mtime写入JSON文件，
+    之后通过比较目录mtime增量刷新，只重新扫描发生变化的搜索目录。
+    每个应用的Info.plist元数据(bundle id、显示名称、本地化名称)按Info.plist的mtime缓存，
+    只在构建索引时由线程池并行解析。
+    """
+
+    INDEX_VERSION = 3
+
+    def __init__(self, search_paths: Optional[List[str]] = None, index_path: Optional[str] = None,
+                 check_interval: float = 2.0, max_depth: int = 4, max_workers: int = 4):
+        """初始化应用索引
+
+        Args:
+            search_paths: 应用程序搜索目录
+            index_path: 索引文件路径
+            check_interval: 两次目录mtime检查之间的最小间隔(秒)
+            max_depth: 搜索目录下的最大遍历深度
+            max_workers: 并发扫描搜索目录的线程数
+        """
+        self.search_paths = list(search_paths or APPLICATION_SEARCH_PATHS)
+        self.index_path = index_path or os.path.join(APP_DATA_DIR, "app_index.json")
+        self.check_interval = check_interval
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+
+        self._lock = threading.RLock()
+        self._roots = {}  # 搜索目录 -> {"dirs": {目录: mtime}, "apps": [应用记录]}
+        self._metadata = {}  # 应用路径 -> Info.plist元数据(含plist_mtime)
+        self._apps = []
+        self._loaded = False
+        self._last_check = 0.0
+        # 绑定目录监视器后，目录变化由监视器推送，查询时不再检查mtime
+        self.watcher = None
+        # 索引内容每次变化时递增，供依赖索引的缓存判断是否需要重建
+        self.generation = 0
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _load(self):
+        """从磁盘加载索引文件"""
+        self._loaded = True
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.INDEX_VERSION:
+                self._roots = data.get("roots", {})
+                self._metadata = data.get("metadata", {})
+        except (OSError, ValueError):
+            self._roots = {}
+            self._metadata = {}
+
+    def _save(self):
+        """原子地写入索引文件"""
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": self.INDEX_VERSION, "roots": self._roots, "metadata": self._metadata},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"保存应用索引失败: {str(e)}")
+
+    def scan_root(self, root: str) -> Dict[str, Any]:
+        """扫描单个搜索目录，记录应用及所有被遍历目录的mtime
+
+        使用os.scandir逐层遍历，遇到.app目录即停止，不进入应用包内部，
+        遍历深度受max_depth限制。
+        """
+        return self._scan_tree(root, 0)
+
+    def _scan_tree(self, top: str, depth: int) -> Dict[str, Any]:
+        """从位于depth层的目录top开始扫描"""
+        apps = []
+        dirs = {}
+        stack = [(top, depth)]
+        while stack:
+            path, depth = stack.pop()
+            try:
+                dirs[path] = os.stat(path).st_mtime
+                with os.scandir(path) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.name.endswith('.app'):
+                        if entry.is_dir():
+                            apps.append({
+                                'name': entry.name[:-len('.app')],
+                                'path': entry.path,
+                                'mtime': entry.stat().st_mtime
+                            })
+                    elif depth < self.max_depth and entry.is_dir(follow_symlinks=False) \
+                            and not entry.name.startswith('.'):
+                        stack.append((entry.path, depth + 1))
+                except OSError:
+                    continue
+        return {"dirs": dirs, "apps": apps}
+
+    def _root_changed(self, root: str) -> bool:
+        entry = self._roots.get(root)
+        if entry is None:
+            return True
+        return any(self._mtime(d) != mtime for d, mtime in entry["dirs"].items())
+
+    def refresh(self, force: bool = False) -> bool:
+        """增量刷新索引
+
+        Args:
+            force: 是否忽略mtime强制重新扫描所有目录
+
+        Returns:
+            索引内容是否发生变化
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            changed = False
+            stale_roots = []
+            for root in self.search_paths:
+                if not os.path.isdir(root):
+                    if self._roots.pop(root, None) is not None:
+                        changed = True
+                    continue
+                if force or self._root_changed(root):
+                    stale_roots.append(root)
+            if stale_roots:
+                # 多个搜索目录在小线程池中并发扫描
+                workers = max(1, min(self.max_workers, len(stale_roots)))
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for root, entry in zip(stale_roots, pool.map(self.scan_root, stale_roots)):
+                        self._roots[root] = entry
+                changed = True
+            for root in list(self._roots):
+                if root not in self.search_paths:
+                    del self._roots[root]
+                    changed = True
+            if changed or self.generation == 0:
+                self._rebuild_app_list()
+            if changed:
+                self._save()
+            self._last_check = time.monotonic()
+            return changed
+
+    def _rebuild_app_list(self):
+        paths = []
+        seen = set()
+        records = {}
+        for root in self.search_paths:
+            for app in self._roots.get(root, {}).get("apps", []):
+                if app['path'] in seen:
+                    continue
+                seen.add(app['path'])
+                paths.append(app['path'])
+                records[app['path']] = app
+        self._refresh_metadata(paths)
+
+        apps = []
+        for path in paths:
+            app = records[path]
+            meta = self._metadata.get(path, {})
+            # 优先使用本地化显示名称，供界面展示和匹配
+            names = [meta.get("display_name"), meta.get("bundle_name")] + meta.get("localized_names", [])
+            aliases = []
+            for name in names:
+                if name and name != app['name'] and name not in aliases:
+                    aliases.append(name)
+            localized = meta.get("localized_names") or [app['name']]
+            apps.append({
+                'name': app['name'],
+                'path': path,
+                'display_name': localized[0],
+                'bundle_id': meta.get("bundle_id", ""),
+                'aliases': aliases,
+                'mtime': app['mtime']
+            })
+        self._apps = apps
+        self.generation += 1
+
+    def _refresh_metadata(self, paths: List[str]):
+        """只为新增或Info.plist已变化的应用重新解析元数据"""
+        current = set(paths)
+        for path in list(self._metadata):
+            if path not in current:
+                del self._metadata[path]
+        stale = []
+        for path in paths:
+            plist_mtime = self._mtime(os.path.join(path, 'Contents', 'Info.plist'))
+            cached = self._metadata.get(path)
+            if cached is None or cached.get("plist_mtime") != plist_mtime:
+                stale.append((path, plist_mtime))
+        if not stale:
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for (path, plist_mtime), meta in zip(stale, pool.map(read_bundle_metadata, [p for p, _ in stale])):
+                meta["plist_mtime"] = plist_mtime
+                self._metadata[path] = meta
+
+    def get_applications(self) -> List[Dict[str, Any]]:
+        """获取应用列表
+
+        绑定监视器后直接返回内存中的列表；否则距上次检查超过check_interval时才比较目录mtime。
+        """
+        if self.watcher is not None and self.generation > 0:
+            return list(self._apps)
+        with self._lock:
+            if not self._loaded or time.monotonic() - self._last_check >= self.check_interval:
+                self.refresh()
+            return list(self._apps)
+
+    def watched_dirs(self) -> set:
+        """需要监视的目录：所有搜索目录及扫描时遍历过的目录"""
+        with self._lock:
+            dirs = set(self.search_paths)
+            for entry in self._roots.values():
+                dirs.update(entry["dirs"])
+            return dirs
+
+    def attach_watcher(self, watcher: DirectoryWatcher):
+        """绑定目录监视器：先增量刷新一次，之后只在目录变化时更新受影响的部分"""
+        self.refresh()
+        self.watcher = watcher
+        watcher.watch("app_index", self.watched_dirs(), self.invalidate)
+
+    def invalidate(self, paths: List[str]):
+        """目录发生变化时只更新这些目录下的索引记录
+
+        Args:
+            paths: 发生变化的目录
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            changed = False
+            for path in paths:
+                for root in self.search_paths:
+                    if path != root and not path.startswith(root + os.sep):
+                        continue
+                    if root not in self._roots:
+                        if os.path.isdir(root):
+                            self._roots[root] = self.scan_root(root)
+                            changed = True
+                    elif path == root or path in self._roots[root]["dirs"]:
+                        self._rescan_dir(root, path)
+                        changed = True
+            if changed:
+                self._rebuild_app_list()
+                self._save()
+        if changed and self.watcher is not None:
+            self.watcher.watch("app_index", self.watched_dirs(), self.invalidate)
+
+    def _drop_subtree(self, entry: Dict[str, Any], path: str):
+        prefix = path + os.sep
+        entry["dirs"] = {d: m for d, m in entry["dirs"].items() if d != path and not d.startswith(prefix)}
+        entry["apps"] = [app for app in entry["apps"] if not app['path'].startswith(prefix)]
+
+    def _rescan_dir(self, root: str, path: str):
+        """重新列出单个目录：更新该目录下的应用，只扫描新出现的子目录，移除已删除的子目录"""
+        entry = self._roots[root]
+        try:
+            mtime = os.stat(path).st_mtime
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            if path == root:
+                del self._roots[root]
+            else:
+                self._drop_subtree(entry, path)
+            return
+
+        depth = 0 if path == root else len(os.path.relpath(path, root).split(os.sep))
+        old_dirs = entry["dirs"]
+        apps = [app for app in entry["apps"] if os.path.dirname(app['path']) != path]
+        dirs = dict(old_dirs)
+        dirs[path] = mtime
+        subdirs = set()
+        for item in entries:
+            try:
+                if item.name.endswith('.app'):
+                    if item.is_dir():
+                        apps.append({
+                            'name': item.name[:-len('.app')],
+                            'path': item.path,
+                            'mtime': item.stat().st_mtime
+                        })
+                elif depth < self.max_depth and item.is_dir(follow_symlinks=False) \
+                        and not item.name.startswith('.'):
+                    subdirs.add(item.path)
+                    if item.path not in old_dirs:
+                        subtree = self._scan_tree(item.path, depth + 1)
+                        dirs.update(subtree["dirs"])
+                        apps.extend(subtree["apps"])
+            except OSError:
+                continue
+        entry["dirs"], entry["apps"] = dirs, apps
+        for d in list(old_dirs):
+            if os.path.dirname(d) == path and d != path and d not in subdirs:
+                self._drop_subtree(entry, d)
+
+def normalize_app_name(name: str) -> str:
+    """归一化应用名称用于匹配
+
+    兼容分解后去掉拉丁字母的变音符号(如拼音声调)、转小写，并去除空白和常见分隔符。
+    与旧实现不同，中文等非ASCII字符会被保留。
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"[\s\-_.·]+", "", stripped.casefold())
+
+# 内置应用别名表：应用标识 -> 别名列表（可通过 ~/.macos_copilot/app_aliases.json 补充）
+DEFAULT_APP_ALIASES = {
+    'safari': ['safari', '浏览器', 'web', 'sāfārī', 'sfl', '苹果浏览器'],
+    'chrome': ['chrome', 'google chrome', '谷歌浏览器', 'gǔgē', '谷歌', 'chromium'],
+    'terminal': ['terminal', '终端', '命令行', 'zhōngduān'],
+    'finder': ['finder', '访达', '文件管理器', 'fǎngdá'],
+    'calculator': ['calculator', '计算器', 'calc'],
+    'mail': ['mail', '邮件', '邮箱'],
+    'messages': ['messages', '信息', '短信'],
+    'facetime': ['facetime', '视频通话'],
+    'photos': ['photos', '照片', '相册'],
+    'music': ['music', '音乐', 'itunes'],
+    'tv': ['tv', '电视', '视频'],
+    'podcasts': ['podcasts', '播客'],
+    'books': ['books', '图书', '阅读'],
+    'notes': ['notes', '备忘录', '笔记'],
+    'reminders': ['reminders', '提醒事项'],
+    'calendar': ['calendar', '日历'],
+    'contacts': ['contacts', '通讯录', '联系人'],
+    'maps': ['maps', '地图'],
+    'weather': ['weather', '天气'],
+    'stocks': ['stocks', '股票'],
+    'voice_memos': ['voice memos', '语音备忘录'],
+    'home': ['home', '家庭'],
+    'shortcuts': ['shortcuts', '快捷指令'],
+    'settings': ['settings', 'system settings', 'system preferences', '系统设置', '系统偏好设置', '设置'],
+    'vscode': ['visual studio code', 'vscode', 'vs code', '代码编辑器'],
+    'premiere': ['adobe premiere pro', 'premiere', 'pr', '视频编辑'],
+    'photoshop': ['adobe photoshop', 'photoshop', 'ps', '图像编辑'],
+    'illustrator': ['adobe illustrator', 'illustrator', 'ai', '矢量图'],
+    'after_effects': ['adobe after effects', 'after effects', 'ae', '特效'],
+    'xd': ['adobe xd', 'xd', '设计'],
+    'figma': ['figma', '设计工具'],
+    'sketch': ['sketch', '设计'],
+    'xcode': ['xcode', '开发工具'],
+    'intellij': ['intellij idea', 'intellij', '开发工具'],
+    'pycharm': ['pycharm', 'python开发'],
+    'sublime': ['sublime text', 'sublime', '文本编辑器'],
+    'atom': ['atom', '文本编辑器'],
+    'spotify': ['spotify', '音乐播放器'],
+    'zoom': ['zoom', '视频会议'],
+    'teams': ['microsoft teams', 'teams', '团队协作'],
+    'slack': ['slack', '团队沟通'],
+    'discord': ['discord', '游戏聊天'],
+    'wechat': ['wechat', '微信', 'wēixìn'],
+    'qq': ['qq', '腾讯qq', 'q q'],
+    'alipay': ['alipay', '支付宝'],
+    'taobao': ['taobao', '淘宝'],
+    'jd': ['jd', '京东'],
+    'netflix': ['netflix', '网飞'],
+    'youtube': ['youtube', '油管'],
+    'bilibili': ['bilibili', 'b站', '哔哩哔哩'],
+    'preview': ['preview', '预览'],
+    'appstore': ['app store', 'appstore', '应用商店']
+}
+
+class AppAliasRegistry:
+    """应用别名注册表
+
+    将别名表编译为"归一化别名 -> 应用标识"的反向字典，open_application
+    与_find_matching_apps共用同一份注册表，查询别名只需一次字典查找。
+    """
+
+    def __init__(self, aliases: Dict[str, List[str]]):
+        """编译别名表
+
+        Args:
+            aliases: 应用标识 -> 别名列表
+        """
+        self.aliases_by_key = {}  # 应用标识 -> 归一化别名集合(包含标识本身)
+        self.keys_by_alias = {}   # 归一化别名 -> 应用标识元组(同一别名可能属于多个应用)
+        for key, alias_list in aliases.items():
+            norms = self.aliases_by_key.setdefault(key, set())
+            for alias in [key] + list(alias_list):
+                alias_norm = normalize_app_name(alias)
+                if not alias_norm or alias_norm in norms:
+                    continue
+                norms.add(alias_norm)
+                self.keys_by_alias[alias_norm] = self.keys_by_alias.get(alias_norm, ()) + (key,)
+        self._app_keys = {}
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'AppAliasRegistry':
+        """加载内置别名表，并合并用户可编辑的JSON别名文件
+
+        Args:
+            path: 用户别名文件路径，格式为 {"应用标识": ["别名", ...]}
+
+        Returns:
+            编译后的别名注册表
+        """
+        path = path or os.path.join(APP_DATA_DIR, "app_aliases.json")
+        aliases = {key: list(values) for key, values in DEFAULT_APP_ALIASES.items()}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                user_aliases = json.load(f)
+            for key, values in user_aliases.items():
+                if isinstance(values, str):
+                    values = [values]
+                aliases.setdefault(key, []).extend(values)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"加载应用别名文件失败: {str(e)}")
+        return cls(aliases)
+
+    def resolve(self, name: str) -> Tuple[str, ...]:
+        """返回别名对应的应用标识，未登记时返回空元组"""
+        return self.keys_by_alias.get(normalize_app_name(name), ())
+
+    # 按名称前缀匹配时别名的最短长度，过短的别名(如ps、ai)容易误配
+    MIN_PREFIX_ALIAS = 4
+    # 前缀之后允许出现的版本后缀单词(数字版本号之外)
+    EDITION_WORDS = {"beta", "alpha", "dev", "canary", "nightly", "insiders", "cc", "ce", "ee",
+                     "lite", "community", "edition", "for", "mac", "macos"}
+
+    def classify_app(self, app_name: str) -> Tuple[Optional[str], bool]:
+        """返回已安装应用名称对应的应用标识，以及是否为精确匹配
+
+        归一化名称等于某个别名时为精确匹配；否则检查名称开头的若干个完整单词
+        是否组成一个别名，且其余单词只是版本号或版本后缀(如"Adobe Photoshop 2024"、
+        "Visual Studio Code - Insiders")。不做任意子串匹配，"HomeBank"不会被当作"home"，
+        "Chrome Remote Desktop"也不会被当作"chrome"。结果按应用名称缓存。
+        """
+        if app_name in self._app_keys:
+            return self._app_keys[app_name]
+        keys = self.keys_by_alias.get(normalize_app_name(app_name))
+        result = (keys[0], True) if keys else (None, False)
+        if not keys:
+            tokens = [normalize_app_name(token) for token in re.split(r"[\s\-_.·]+", app_name)]
+            tokens = [token for token in tokens if token]
+            # 从最长的前缀开始检查，优先匹配更具体的别名
+            for n in range(len(tokens) - 1, 0, -1):
+                if not all(re.fullmatch(r"v?\d[\d]*", token) or token in self.EDITION_WORDS for token in tokens[n:]):
+                    continue
+                prefix = "".join(tokens[:n])
+                keys = self.keys_by_alias.get(prefix) if len(prefix) >= self.MIN_PREFIX_ALIAS else None
+                if keys:
+                    result = (keys[0], False)
+                    break
+        self._app_keys[app_name] = result
+        return result
+
+    def key_for_app(self, app_name: str) -> Optional[str]:
+        """返回已安装应用名称对应的应用标识，见classify_app"""
+        return self.classify_app(app_name)[0]
+
+# 导入时编译一次的全局别名注册表
+APP_ALIASES = AppAliasRegistry.load()
+
+class AppMatchIndex:
+    """应用名称模糊匹配索引
+
+    在应用索引刷新时构建一次，保存每个应用的归一化名称、别名以及字符二元组倒排表。
+    查询时先通过二元组重叠挑选少量候选，再用difflib对候选打分，
+    避免每次查询都归一化并遍历全部应用名称。
+    """
+
+    # 进入difflib打分阶段的最大候选数
+    MAX_CANDIDATES = 20
+
+    def __init__(self, apps: List[Dict[str, Any]], aliases: Optional[AppAliasRegistry] = None,
+                 cutoff: float = 0.6):
+        """构建匹配索引
+
+        Args:
+            apps: 应用列表(ApplicationIndex.get_applications的返回值)
+            aliases: 应用别名注册表
+            cutoff: 模糊匹配的最低分数
+        """
+        self.apps = apps
+        self.cutoff = cutoff
+        self.exact = {}       # 归一化名称/别名 -> 应用下标
+        self.entries = []     # (归一化名称/别名, 应用下标, 二元组数量)
+        self.postings = {}    # 二元组 -> 条目下标列表
+        self.ambiguous = {}   # 对应多个已安装应用的归一化别名 -> 应用下标列表
+        self.aliases = aliases
+
+        for i, app in enumerate(apps):
+            self._add(normalize_app_name(app['name']), i)
+        # Info.plist中的显示名称和本地化名称(如"访达")
+        for i, app in enumerate(apps):
+            for name in app.get('aliases', ()):
+                self._add(normalize_app_name(name), i)
+
+        if aliases is not None:
+            # 应用名称本身是某组别名之一(或以其开头)时，整组别名都指向该应用；
+            # 精确匹配优先于前缀匹配。同一别名可能属于多组(如"设计")，
+            # 汇总所有组后对应多个应用的别名记为有歧义，不指定任何一个
+            exact_apps, prefix_apps = {}, {}
+            for i, app in enumerate(apps):
+                key, exact = aliases.classify_app(app['name'])
+                if key is not None:
+                    (exact_apps if exact else prefix_apps).setdefault(key, []).append(i)
+            alias_apps = {}
+            for key in sorted(set(exact_apps) | set(prefix_apps)):
+                candidates = exact_apps.get(key) or prefix_apps[key]
+                for alias_norm in aliases.aliases_by_key[key]:
+                    targets = alias_apps.setdefault(alias_norm, [])
+                    targets.extend(i for i in candidates if i not in targets)
+            for alias_norm, candidates in alias_apps.items():
+                if len(candidates) == 1:
+                    self._add(alias_norm, candidates[0])
+                elif alias_norm not in self.exact:
+                    self.ambiguous[alias_norm] = candidates
+
+    @staticmethod
+    def _grams(text: str) -> set:
+        if len(text) < 2:
+            return {text} if text else set()
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def _add(self, text: str, app_idx: int):
+        if not text or text in self.exact:
+            return
+        self.exact[text] = app_idx
+        entry_id = len(self.entries)
+        grams = self._grams(text)
+        self.entries.append((text, app_idx, len(grams)))
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(entry_id)
+
+    def ambiguous_matches(self, query: str) -> List[Dict[str, Any]]:
+        """查询是对应多个已安装应用的别名时返回这些应用，否则返回空列表"""
+        query_norm = normalize_app_name(query)
+        if query_norm in self.exact:
+            return []
+        return [self.apps[i] for i in self.ambiguous.get(query_norm, ())]
+
+    def lookup_exact(self, query: str) -> Optional[Dict[str, Any]]:
+        """只按归一化名称或别名精确查找应用"""
+        app_idx = self.exact.get(normalize_app_name(query))
+        return self.apps[app_idx] if app_idx is not None else None
+
+    def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """查找与查询最匹配的应用
+
+        Args:
+            query: 应用名称、别名或近似拼写
+
+        Returns:
+            匹配的应用记录，未找到时返回None
+        """
+        query_norm = normalize_app_name(query)
+        if not query_norm:
+            return None
+        if query_norm in self.exact:
+            return self.apps[self.exact[query_norm]]
+        if query_norm in self.ambiguous:
+            return None
+        # 查询是已登记的别名但对应应用未安装时不做模糊匹配，避免"谷歌浏览器"匹配到其他浏览器
+        if self.aliases is not None and self.aliases.resolve(query_norm):
+            return None
+
+        # 通过二元组重叠生成候选
+        query_grams = self._grams(query_norm)
+        overlap = {}
+        for gram in query_grams:
+            for entry_id in self.postings.get(gram, ()):
+                overlap[entry_id] = overlap.get(entry_id, 0) + 1
+        if not overlap:
+            return None
+        candidates = heapq.nlargest(
+            self.MAX_CANDIDATES, overlap,
+            key=lambda e: 2 * overlap[e] / (len(query_grams) + self.entries[e][2])
+        )
+
+        # 仅对候选进行相似度打分
+        best_idx, best_score = None, self.cutoff
+        matcher = difflib.SequenceMatcher(b=query_norm, autojunk=False)
+        for entry_id in candidates:
+            text, app_idx, _ = self.entries[entry_id]
+            if text.startswith(query_norm) or query_norm.startswith(text):
+                score = 0.8
+            else:
+                score = 0.0
+            matcher.set_seq1(text)
+            # 先用廉价的上界过滤，再计算精确相似度
+            if matcher.real_quick_ratio() > max(score, best_score) and matcher.quick_ratio() > max(score, best_score):
+                score = max(score, matcher.ratio())
+            if score > best_score:
+                best_idx, best_score = app_idx, score
+        return self.apps[best_idx] if best_idx is not None else None
+
+class OutputCapture:
+    """有界内存的命令输出捕获
+
+    只在内存中保留固定大小的开头和结尾(环形缓冲)，同时统计总字节数和行数。
+    输出较小时完整保存在内存中，超过阈值后才写入临时文件。返回给代理的是
+    开头+结尾的摘要，被截断的输出会分配一个句柄，可通过read_full_output分页读取完整内容。
+    """
+
+    # 句柄 -> 捕获对象，只保留最近的若干个
+    _registry = collections.OrderedDict()
+    _registry_lock = threading.Lock()
+    _handle_counter = 0
+    MAX_HANDLES = 32
+
+    def __init__(self, head_bytes: int = 4096, tail_bytes: int = 4096,
+                 spool_threshold: int = 256 * 1024, max_spool_bytes: int = 64 * 1024 * 1024):
+        """初始化捕获缓冲区
+
+        Args:
+            head_bytes: 保留的开头字节数
+            tail_bytes: 保留的结尾字节数
+            spool_threshold: 完整输出超过该大小后写入临时文件
+            max_spool_bytes: 临时文件的大小上限，超出部分只计数不保存
+        """
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.spool_threshold = spool_threshold
+        self.max_spool_bytes = max_spool_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.total_lines = 0
+        self.handle = None
+        self._full = bytearray()
+        self._spool = None
+        self._spool_path = None
+        self._stored_bytes = 0
+        self._ends_with_newline = True
+
+    def write(self, data: bytes):
+        """追加输出"""
+        if not data:
+            return
+        self.total_bytes += len(data)
+        self.total_lines += data.count(b"\n")
+        self._ends_with_newline = data.endswith(b"\n")
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+        self.tail += data
+        if len(self.tail) > 2 * self.tail_bytes:
+            del self.tail[:-self.tail_bytes]
+        # 完整输出：先放在内存中，超过阈值后转存到临时文件
+        if self._stored_bytes >= self.max_spool_bytes:
+            return
+        data = data[:self.max_spool_bytes - self._stored_bytes]
+        self._stored_bytes += len(data)
+        if self._spool is None and len(self._full) + len(data) > self.spool_threshold:
+            try:
+                fd, self._spool_path = tempfile.mkstemp(prefix="macos_copilot_output_", suffix=".log")
+                self._spool = os.fdopen(fd, "wb")
+                self._spool.write(self._full)
+                self._full = None
+            except OSError:
+                self._spool = None
+                self._stored_bytes = self.max_spool_bytes
+                return
+        if self._spool is not None:
+            self._spool.write(data)
+        else:
+            self._full += data
+
+    @property
+    def line_count(self) -> int:
+        return self.total_lines + (0 if self._ends_with_newline or not self.total_bytes else 1)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > self.head_bytes + self.tail_bytes
+
+    def getvalue(self) -> str:
+        """获取完整输出(超出临时文件上限的部分除外)"""
+        if self._spool is not None:
+            self._spool.flush()
+            with open(self._spool_path, "rb") as f:
+                return f.read().decode('utf-8', errors='replace')
+        if self._full is not None:
+            return self._full.decode('utf-8', errors='replace')
+        return self.head.decode('utf-8', errors='replace')
+
+    def head_lines(self, count: int) -> List[str]:
+        """返回开头的若干完整行"""
+        text = self.head.decode('utf-8', errors='replace')
+        lines = text.split("\n")
+        if self.total_bytes > len(self.head):
+            lines = lines[:-1]  # 最后一行可能被截断
+        elif not lines[-1]:
+            lines = lines[:-1]
+        return lines[:count]
+
+    def summary(self) -> str:
+        """返回适合交给代理的输出：完整输出或开头+结尾的摘要"""
+        if not self.truncated:
+            return self.getvalue()
+        head = self.head.decode('utf-8', errors='replace')
+        tail = bytes(self.tail[-self.tail_bytes:]).decode('utf-8', errors='replace')
+        # 尽量在行边界处截断
+        if "\n" in head:
+            head = head[:head.rfind("\n") + 1]
+        if "\n" in tail[:-1]:
+            tail = tail[tail.find("\n") + 1:]
+        omitted = self.total_bytes - len(head.encode('utf-8')) - len(tail.encode('utf-8'))
+        handle = self.register()
+        note = f"\n... [输出过长，已省略中间约 {max(omitted, 0)} 字节；共 {self.total_bytes} 字节，{self.line_count} 行"
+        if handle:
+            note += f"；完整输出可用 read_full_output('{handle}') 分页读取"
+        note += "] ...\n"
+        return head + note + tail
+
+    def read_lines(self, start: int = 0, count: int = 200) -> List[str]:
+        """分页读取完整输出"""
+        if self._spool is not None:
+            self._spool.flush()
+            with open(self._spool_path, "rb") as f:
+                return [line.decode('utf-8', errors='replace').rstrip("\n")
+                        for line in itertools.islice(f, start, start + count)]
+        return self.getvalue().split("\n")[start:start + count]
+
+    def register(self) -> Optional[str]:
+        """为截断的输出分配检索句柄"""
+        if self.handle is not None:
+            return self.handle
+        if self._full is None and self._spool is None:
+            return None
+        cls = OutputCapture
+        with cls._registry_lock:
+            cls._handle_counter += 1
+            self.handle = f"out{cls._handle_counter}"
+            cls._registry[self.handle] = self
+            while len(cls._registry) > cls.MAX_HANDLES:
+                cls._registry.popitem(last=False)[1].discard()
+        return self.handle
+
+    @classmethod
+    def get(cls, handle: str) -> Optional["OutputCapture"]:
+        with cls._registry_lock:
+            return cls._registry.get(handle.strip())
+
+    def close(self):
+        """释放未分配句柄的捕获对象的临时文件；已分配句柄的由注册表负责释放"""
+        if self.handle is None:
+            self.discard()
+
+    def __enter__(self) -> "OutputCapture":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def discard(self):
+        """释放完整输出及临时文件"""
+        self._full = None
+        if self._spool is not None:
+            try:
+                self._spool.close()
+                os.remove(self._spool_path)
+            except OSError:
+                pass
+            self._spool = None
+
+    @classmethod
+    def discard_all(cls):
+        with cls._registry_lock:
+            captures = list(cls._registry.values())
+            cls._registry.clear()
+        for capture in captures:
+            capture.discard()
+
+atexit.register(OutputCapture.discard_all)
+
+class ShellSession:
+    """长期运行的shell进程
+
+    命令通过stdin写入同一个bash进程执行，执行完毕后向stdout/stderr打印带随机标记的
+    结束帧(stdout中附带返回码)，因此cd和export等状态会在多次命令之间保留，
+    也省去了每一步重新fork/exec shell的开销。
+    """
+
+    SHELL = '/bin/bash' if os.path.exists('/bin/bash') else '/bin/sh'
+
+    def __init__(self, cwd: Optional[str] = None, env_script: str = ""):
+        """启动shell进程
+
+        Args:
+            cwd: 初始工作目录
+            env_script: 启动后先执行的脚本(用于回收时恢复环境变量)
+        """
+        self.proc = subprocess.Popen(
+            [self.SHELL, '--noprofile', '--norc'] if self.SHELL.endswith('bash') else [self.SHELL],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=cwd if cwd and os.path.isdir(cwd) else None, start_new_session=True
+        )
+        os.set_blocking(self.proc.stdout.fileno(), False)
+        os.set_blocking(self.proc.stderr.fileno(), False)
+        self.lock = threading.Lock()
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.command_count = 0
+        # 写入命令失败(shell已退出)时置位，会话池据此换用新会话重试
+        self.broken = False
+        if env_script:
+            out, err, _, _ = self.run(env_script, timeout=5)
+            out.close()
+            err.close()
+
+    def is_alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, command: str, timeout: float = 10,
+            sink: Optional[Callable[[str, str], None]] = None) -> Tuple[OutputCapture, OutputCapture, Optional[int], bool]:
+        """在会话中执行命令
+
+        Args:
+            command: shell命令
+            timeout: 超时时间(秒)，超时后整个会话会被终止
+            sink: 逐行输出的接收函数
+
+        Returns:
+            (stdout捕获, stderr捕获, 返回码, 是否超时)
+        """
+        marker = f"__MACOS_COPILOT_{uuid.uuid4().hex}__".encode()
+        # eval让语法错误只影响本条命令；stdin重定向防止命令读走后续脚本
+        script = (f"eval {shlex.quote(command)} < /dev/null\n"
+                  f"__copilot_rc=$?\n"
+                  f"printf '\\n%s:%s\\n' '{marker.decode()}' \"$__copilot_rc\"\n"
+                  f"printf '\\n%s\\n' '{marker.decode()}' >&2\n")
+        captures = {"stdout": OutputCapture(), "stderr": OutputCapture()}
+        self.last_used = time.monotonic()
+        self.command_count += 1
+        try:
+            self.proc.stdin.write(script.encode())
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            self.broken = True
+            captures["stderr"].write("shell会话已退出".encode())
+            return captures["stdout"], captures["stderr"], None, False
+
+        done = {"stdout": False, "stderr": False}
+        held = {"stdout": [], "stderr": []}  # 暂缓输出的空行(结束帧开头的换行会在其前面多出一个空行)
+        lines_pending = {"stdout": b"", "stderr": b""}
+        returncode = None
+
+        def output_line(name, line):
+            captures[name].write(line + b"\n")
+            if sink:
+                try:
+                    sink(line.decode('utf-8', errors='replace'), name)
+                except Exception:
+                    pass
+
+        def emit(name, data, final=False):
+            nonlocal returncode
+            lines_pending[name] += data
+            *lines, lines_pending[name] = lines_pending[name].split(b"\n")
+            if final and lines_pending[name]:
+                lines.append(lines_pending[name])
+                lines_pending[name] = b""
+            for line in lines:
+                if line.startswith(marker):
+                    # 只去掉结束帧带来的那一个空行，命令本身输出的空行保留
+                    for text in held[name][:-1]:
+                        output_line(name, text)
+                    held[name] = []
+                    done[name] = True
+                    match = re.match(rb":(-?\d+)", line[len(marker):])
+                    if match:
+                        returncode = int(match.group(1))
+                    continue
+                if not line and not final:
+                    held[name].append(line)
+                    continue
+                for text in held[name] + [line]:
+                    output_line(name, text)
+                held[name] = []
+
+        selector = selectors.DefaultSelector()
+        selector.register(self.proc.stdout, selectors.EVENT_READ, "stdout")
+        selector.register(self.proc.stderr, selectors.EVENT_READ, "stderr")
+        deadline = time.monotonic() + timeout
+        timed_out = False
+        exited = False
+        try:
+            while not (done["stdout"] and done["stderr"]):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                events = selector.select(min(remaining, 0.5))
+                for key, _ in events:
+                    try:
+                        data = os.read(key.fd, 65536)
+                    except BlockingIOError:
+                        continue
+                    name = key.data
+                    if not data:
+                        # shell已退出(例如命令中执行了exit)
+                        done[name] = True
+                        exited = True
+                        selector.unregister(key.fileobj)
+                        continue
+                    emit(name, data)
+                    if done[name]:
+                        selector.unregister(key.fileobj)
+        finally:
+            selector.close()
+
+        if timed_out:
+            self.close()
+        elif exited:
+            # 读到EOF时bash可能尚未退出，等待它结束以取得真实的返回码
+            try:
+                self.proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                pass
+        for name in ("stdout", "stderr"):
+            emit(name, b"", final=True)
+        if returncode is None and not self.is_alive():
+            returncode = self.proc.returncode
+        return captures["stdout"], captures["stderr"], returncode, timed_out
+
+    def health_check(self, timeout: float = 2.0) -> bool:
+        """检查会话能否正常执行命令"""
+        if not self.is_alive():
+            return False
+        out, err, returncode, timed_out = self.run("echo ok", timeout=timeout)
+        with out, err:
+            return not timed_out and returncode == 0 and out.getvalue().strip() == "ok"
+
+    def snapshot(self) -> Tuple[Optional[str], str]:
+        """获取当前工作目录和导出的环境变量，用于回收后恢复会话状态"""
+        cwd, cwd_err, returncode, _ = self.run("pwd", timeout=2)
+        env_script, env_err, _, _ = self.run("export -p", timeout=2)
+        with cwd, cwd_err, env_script, env_err:
+            return (cwd.getvalue().strip() if returncode == 0 else None), env_script.getvalue()
+
+    def close(self):
+        """终止shell进程及其启动的所有子进程"""
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            pass
+        for stream in (self.proc.stdin, self.proc.stdout, self.proc.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+class ShellSessionPool:
+    """按对话划分的shell会话池
+
+    每个对话使用一个持久会话，保留cwd和环境变量。会话在执行一定数量的命令或
+    存活超过一定时间后回收(保留cwd和导出的环境变量)，空闲较久的会话在复用前
+    先做健康检查，超出数量上限时关闭最久未使用的会话。
+    """
+
+    def __init__(self, max_sessions: int = 4, max_commands: int = 200,
+                 max_age: float = 1800, health_check_after: float = 60):
+        """初始化会话池
+
+        Args:
+            max_sessions: 最多保留的会话数
+            max_commands: 单个会话执行多少条命令后回收
+            max_age: 单个会话最长存活时间(秒)
+            health_check_after: 空闲超过该时间(秒)的会话复用前进行健康检查
+        """
+        self.max_sessions = max_sessions
+        self.max_commands = max_commands
+        self.max_age = max_age
+        self.health_check_after = health_check_after
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _get_session(self, key: str) -> ShellSession:
+        # 健康检查、回收和启动新会话都可能耗时数秒，不持有会话池的锁，以免阻塞其他对话
+        with self._lock:
+            session = self._sessions.get(key)
+        now = time.monotonic()
+        stale = False
+        cwd, env_script = None, ""
+        # 健康检查和回收都要在会话中执行命令，必须持有会话锁，避免与同一会话上
+        # 正在执行的命令交错；会话正忙时说明它可用，本次跳过检查
+        if session is not None and session.lock.acquire(blocking=False):
+            try:
+                if not session.is_alive() or (now - session.last_used > self.health_check_after
+                                              and not session.health_check()):
+                    stale = True
+                elif session.command_count >= self.max_commands or now - session.created_at > self.max_age:
+                    # 回收：用旧会话的cwd和环境变量启动新会话
+                    cwd, env_script = session.snapshot()
+                    stale = True
+            finally:
+                session.lock.release()
+        if session is not None and not stale:
+            return session
+        
+        new_session = ShellSession(cwd=cwd, env_script=env_script)
+        to_close = []
+        with self._lock:
+            current = self._sessions.get(key)
+            if current is not session:
+                # 其他线程已经替换了会话，使用它的会话
+                to_close.append(new_session)
+                new_session = current
+            else:
+                if session is not None:
+                    to_close.append(session)
+                self._sessions[key] = new_session
+            # 超出上限时关闭最久未使用的会话
+            while len(self._sessions) > self.max_sessions:
+                oldest = min((k for k in self._sessions if k != key), key=lambda k: self._sessions[k].last_used)
+                to_close.append(self._sessions.pop(oldest))
+        for old in to_close:
+            old.close()
+        return new_session
+
+    def _discard(self, key: str, session: ShellSession):
+        """会话已退出时从池中移除"""
+        with self._lock:
+            if self._sessions.get(key) is session:
+                del self._sessions[key]
+        session.close()
+
+    def run(self, key: str, command: str, timeout: float = 10,
+            sink: Optional[Callable[[str, str], None]] = None) -> Tuple[OutputCapture, OutputCapture, Optional[int], bool]:
+        """在指定对话的会话中执行命令，同一会话内的命令串行执行
+
+        会话在写入命令前已经退出时，换用新会话重试一次。
+        """
+        retried = False
+        while True:
+            session = self._get_session(key)
+            with session.lock:
+                # 取得锁之前会话可能已被其他线程回收或关闭，此时换用新会话
+                if not session.is_alive() and self._sessions.get(key) is not session:
+                    continue
+                result = session.run(command, timeout=timeout, sink=sink)
+            if session.broken and not retried:
+                for capture in result[:2]:
+                    capture.close()
+                self._discard(key, session)
+                retried = True
+                continue
+            break
+        if not session.is_alive():
+            self._discard(key, session)
+        return result
+
+    def get_state(self, key: str) -> Tuple[Optional[str], Optional[Dict[str, str]]]:
+        """获取指定对话会话的当前工作目录和环境变量，会话不存在时返回(None, None)
+
+        用于让会话外启动的进程(后台任务、并行步骤)继承会话中cd和export的结果。
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+        if session is None or not session.is_alive():
+            return None, None
+        with session.lock:
+            if not session.is_alive():
+                return None, None
+            out, err, returncode, timed_out = session.run("pwd && env -0", timeout=2)
+        with out, err:
+            if returncode != 0 or timed_out:
+                return None, None
+            cwd, _, env_text = out.getvalue().partition("\n")
+        env = {}
+        for entry in env_text.rstrip("\n").split("\0"):
+            name, sep, value = entry.partition("=")
+            if sep and name:
+                env[name] = value
+        return cwd.strip() or None, env or None
+
+    def close_session(self, key: str):
+        """关闭指定对话的会话"""
+        with self._lock:
+            session = self._sessions.pop(key, None)
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        """关闭所有会话"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for session in sessions:
+            session.close()
+
+class BackgroundJob:
+    """后台运行的终端命令
+
+    命令在独立的进程组中运行，stdout和stderr合并后由读取线程按行写入有界缓冲区。
+    每行有一个递增的序号作为输出游标，缓冲区超出上限时丢弃最早的行。
+    超过MAX_LINE_BYTES的单行只保留开头部分。
+    """
+
+    MAX_LINE_BYTES = 8192
+
+    def __init__(self, job_id: str, command: str, cwd: Optional[str] = None,
+                 max_buffer_bytes: int = 1024 * 1024, env: Optional[Dict[str, str]] = None):
+        self.job_id = job_id
+        self.command = command
+        self.max_buffer_bytes = max_buffer_bytes
+        self.lines = collections.deque()  # (行文本, 计入缓冲区的字节数)
+        self.first_line = 0      # 缓冲区中第一行的序号
+        self.total_lines = 0     # 已产生的总行数
+        self.buffer_bytes = 0
+        self.state = "running"
+        self.returncode = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.cancel_requested = False
+        self._lock = threading.Lock()
+        self.proc = subprocess.Popen(
+            command, shell=True, executable=ShellSession.SHELL,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            cwd=cwd if cwd and os.path.isdir(cwd) else None, env=env, start_new_session=True
+        )
+        self._reader = threading.Thread(target=self._read_output, name=f"Job-{job_id}", daemon=True)
+        self._reader.start()
+
+    def _read_output(self):
+        """读取进程输出直到结束"""
+        pending = b""
+        truncated = False
+        for chunk in iter(lambda: self.proc.stdout.readline(self.MAX_LINE_BYTES), b""):
+            # readline按长度截断的长行分多次读到，拼接为一行，超出部分丢弃
+            ended = chunk.endswith(b"\n")
+            body = chunk[:-1] if ended else chunk
+            room = self.MAX_LINE_BYTES - len(pending)
+            if len(body) > room:
+                truncated = True
+            pending += body[:room]
+            if not ended:
+                continue
+            self._append_line(pending, truncated)
+            pending, truncated = b"", False
+        if pending:
+            self._append_line(pending, truncated)
+        self.proc.stdout.close()
+        self.returncode = self.proc.wait()
+        with self._lock:
+            self.finished_at = time.time()
+            if self.cancel_requested:
+                self.state = "cancelled"
+            else:
+                self.state = "finished" if self.returncode == 0 else "failed"
+
+    def _append_line(self, raw: bytes, truncated: bool):
+        line = raw.decode('utf-8', errors='replace').rstrip('\r')
+        if truncated:
+            line += " …(行过长，已截断)"
+        with self._lock:
+            # 记录计入的字节数，丢弃时减去同一个数，避免解码、换行符差异导致计数漂移
+            nbytes = len(raw) + 1
+            self.lines.append((line, nbytes))
+            self.total_lines += 1
+            self.buffer_bytes += nbytes
+            while self.buffer_bytes > self.max_buffer_bytes and len(self.lines) > 1:
+                self.buffer_bytes -= self.lines.popleft()[1]
+                self.first_line += 1
+
+    def read(self, cursor: int = 0, max_lines: int = 200) -> Tuple[List[str], int, int]:
+        """从游标位置读取输出
+
+        Returns:
+            (输出行, 下一次读取的游标, 因缓冲区上限被丢弃的行数)
+        """
+        with self._lock:
+            skipped = max(0, self.first_line - cursor)
+            start = max(cursor, self.first_line)
+            end = min(self.total_lines, start + max_lines)
+            lines = [self.lines[i - self.first_line][0] for i in range(start, end)]
+            return lines, end, skipped
+
+    def signal(self, sig: int) -> bool:
+        """向整个进程组发送信号"""
+        try:
+            os.killpg(self.proc.pid, sig)
+            return True
+        except OSError:
+            return False
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "job_id": self.job_id,
+                "command": self.command,
+                "state": self.state,
+                "returncode": self.returncode,
+                "elapsed": end - self.started_at,
+                "total_lines": self.total_lines,
+                "buffered_from": self.first_line,
+            }
+
+class JobManager:
+    """后台任务管理器
+
+    用于编译、brew安装、大文件复制等超过终端命令超时限制的长时间任务。
+    启动后立即返回任务ID，之后通过状态和增量输出轮询，不占用代理的执行线程。
+    """
+
+    def __init__(self, max_jobs: int = 20, max_buffer_bytes: int = 1024 * 1024):
+        """初始化任务管理器
+
+        Args:
+            max_jobs: 最多保留的任务数(超出时清理最早结束的任务)
+            max_buffer_bytes: 每个任务的输出缓冲区上限
+        """
+        self.max_jobs = max_jobs
+        self.max_buffer_bytes = max_buffer_bytes
+        self._jobs = collections.OrderedDict()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def start(self, command: str, cwd: Optional[str] = None,
+              env: Optional[Dict[str, str]] = None) -> BackgroundJob:
+        """启动后台任务"""
+        with self._lock:
+            self._counter += 1
+            job_id = f"job{self._counter}"
+            job = BackgroundJob(job_id, command, cwd=cwd, max_buffer_bytes=self.max_buffer_bytes, env=env)
+            self._jobs[job_id] = job
+            finished = [k for k, j in self._jobs.items() if j.state != "running"]
+            while len(self._jobs) > self.max_jobs and finished:
+                del self._jobs[finished.pop(0)]
+            return job
+
+    def get(self, job_id: str) -> Optional[BackgroundJob]:
+        return self._jobs.get(job_id.strip())
+
+    def list_jobs(self) -> List[BackgroundJob]:
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: str, force: bool = False, grace: float = 3.0) -> bool:
+        """取消任务：先发送SIGTERM，宽限期后仍未退出则发送SIGKILL"""
+        job = self.get(job_id)
+        if job is None or job.state != "running":
+            return False
+        job.cancel_requested = True
+        if force:
+            return job.signal(signal.SIGKILL)
+        sent = job.signal(signal.SIGTERM)
+
+        def escalate():
+            if job.proc.poll() is None:
+                job.signal(signal.SIGKILL)
+
+        timer = threading.Timer(grace, escalate)
+        timer.daemon = True
+        timer.start()
+        return sent
+
+    def shutdown(self):
+        """终止所有仍在运行的任务"""
+        for job in self.list_jobs():
+            if job.state == "running":
+                job.signal(signal.SIGKILL)
+
+class CommandResultCache:
+    """只读系统命令的结果缓存
+
+    只有白名单中的只读命令(sw_vers、uname、sysctl、system_profiler等)会被缓存，
+    每条规则有各自的有效期，会话期间不变的信息有效期为无限。命中时不再启动子进程，
+    也不经过持久shell会话，因此白名单只包含结果与会话的PATH、环境变量和工作目录
+    无关、也不会被会话中的其他命令改变的命令(不包括which、defaults read等)。
+    """
+
+    FOREVER = float("inf")
+    # (命令正则, 有效期秒数)，按顺序匹配
+    READ_ONLY_COMMANDS = [
+        (r"sw_vers(?: -\w+)?", FOREVER),
+        (r"uname(?: -[amnprsv]+)?", FOREVER),
+        (r"arch", FOREVER),
+        # machdep.cpu下的thermal_level等会变化，只把型号视为不变
+        (r"sysctl -n (?:hw|kern\.(?:ostype|osrelease|osversion|version))\.?[\w.]*", FOREVER),
+        (r"sysctl -n machdep\.cpu\.(?:brand_string|vendor|family|model|stepping|core_count|thread_count)", FOREVER),
+        (r"sysctl -n [\w.]+", 5),
+        (r"system_profiler (?:SPPowerDataType|SPNetworkDataType|SPUSBDataType|SPBluetoothDataType|SPAirPortDataType)(?: -\w+)*", 30),
+        (r"system_profiler(?: [\w-]+)*", 300),
+        (r"(?:hostname|whoami|id(?: -\w+)?)", 300),
+        (r"scutil --get \w+", 60),
+        (r"diskutil (?:list|info [\w/]+)", 30),
+        (r"networksetup -list\w+", 60),
+        (r"df(?: -\w+)*(?: /[\w/]*)?", 10),
+    ]
+    # 超过该大小的输出不缓存
+    MAX_RESULT_BYTES = 256 * 1024
+
+    def __init__(self):
+        self.rules = [(re.compile(pattern), ttl) for pattern, ttl in self.READ_ONLY_COMMANDS]
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def ttl_for(self, command: str) -> Optional[float]:
+        """返回命令的缓存有效期，不在白名单中时返回None"""
+        if re.search(r"[|;&<>`$()*?\n]", command):
+            return None
+        try:
+            normalized = " ".join(shlex.split(command))
+        except ValueError:
+            return None
+        for pattern, ttl in self.rules:
+            if pattern.fullmatch(normalized):
+                return ttl
+        return None
+
+    @staticmethod
+    def _key(command: str) -> str:
+        return " ".join(shlex.split(command))
+
+    def get(self, command: str) -> Optional[str]:
+        """查询缓存，返回命令的stdout；未命中或不可缓存时返回None"""
+        if self.ttl_for(command) is None:
+            return None
+        key = self._key(command)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[1]:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, command: str, output: str):
+        """保存成功执行的只读命令输出"""
+        ttl = self.ttl_for(command)
+        if ttl is None or len(output) > self.MAX_RESULT_BYTES:
+            return
+        with self._lock:
+            self._entries[self._key(command)] = (output, time.monotonic() + ttl)
+
+    def put_capture(self, command: str, capture: "OutputCapture"):
+        """保存OutputCapture中的输出；不可缓存或输出过大时不读取完整输出"""
+        if self.ttl_for(command) is None or capture.total_bytes > self.MAX_RESULT_BYTES:
+            return
+        self.put(command, capture.getvalue())
+
+    def run(self, command: str, timeout: float = 10) -> str:
+        """执行白名单中的只读命令(不经过shell)，结果缓存；同一命令的并发未命中只执行一次"""
+        cached = self.get(command)
+        if cached is not None:
+            return cached
+        key = self._key(command)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and time.monotonic() < entry[1]:
+                    return entry[0]
+            result = subprocess.run(shlex.split(command), capture_output=True, text=True, timeout=timeout)
+            if result.returncode == 0:
+                self.put(command, result.stdout)
+            return result.stdout
+
+    def invalidate(self, command: Optional[str] = None):
+        """清除指定命令或全部缓存"""
+        with self._lock:
+            if command is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(command), None)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0,
+                "entries": len(self._entries),
+            }
+
+class FileSearchEngine:
+    """进程内并行文件名搜索
+
+    用多个线程以os.scandir广度优先遍历目录树(scandir在系统调用期间释放GIL)，
+    跳过缓存和版本控制目录，找到足够数量的匹配或超出时间预算后立即停止。
+    支持通配符、子串和大小写不敏感匹配，匹配结果在找到时即可逐个取出。
+    """
+
+    # 不进入的目录
+    PRUNE_DIRS = {
+        ".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".tox",
+        ".mypy_cache", ".pytest_cache", ".cache", "Caches", "DerivedData", ".Trash",
+        ".npm", ".gradle", ".cargo", "site-packages",
+    }
+
+    def __init__(self, workers: int = 8):
+        self.workers = workers
+
+    @staticmethod
+    def build_matcher(query: str, case_sensitive: bool = False) -> Callable[[str], bool]:
+        """根据查询构造文件名匹配函数：包含*?[时按通配符匹配，否则按子串匹配"""
+        if re.search(r"[*?\[]", query):
+            regex = re.compile(fnmatch.translate(query), 0 if case_sensitive else re.IGNORECASE)
+            return lambda name: regex.match(name) is not None
+        if case_sensitive:
+            return lambda name: query in name
+        needle = query.casefold()
+        return lambda name: needle in name.casefold()
+
+    def iter_search(self, query: str, roots: List[str], max_results: int = 10,
+                    time_budget: float = 5.0, case_sensitive: bool = False,
+                    include_dirs: bool = False, include_hidden: bool = False,
+                    stats: Optional[Dict[str, Any]] = None,
+                    should_stop: Optional[Callable[[], bool]] = None) -> Generator[str, None, None]:
+        """搜索文件名，找到匹配时逐个产出路径
+
+        关闭生成器(或迭代结束)时会通知所有工作线程停止。
+
+        Args:
+            query: 通配符或子串
+            roots: 搜索的根目录
+            max_results: 找到多少个匹配后停止(0表示不限)
+            time_budget: 总耗时上限(秒)
+            case_sensitive: 是否区分大小写
+            include_dirs: 是否也匹配目录名
+            include_hidden: 是否进入隐藏目录
+            stats: 如提供，搜索结束时写入目录数、匹配数、耗时和是否超时等统计
+            should_stop: 返回True时停止搜索(用于用户取消或竞速失败)
+        """
+        matcher = self.build_matcher(query, case_sensitive)
+        dirs = queue.Queue()
+        results = queue.Queue()
+        stop = threading.Event()
+        pending = [0]
+        pending_lock = threading.Lock()
+        counters = {"dirs": 0}
+        prune = self.PRUNE_DIRS
+        
+        for root in roots:
+            root = os.path.expanduser(root)
+            if os.path.isdir(root):
+                pending[0] += 1
+                dirs.put(root)
+        
+        def worker():
+            while not stop.is_set():
+                try:
+                    path = dirs.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if path is None:
+                    break
+                try:
+                    with os.scandir(path) as it:
+                        for entry in it:
+                            if stop.is_set():
+                                break
+                            name = entry.name
+                            try:
+                                is_dir = entry.is_dir(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            if is_dir:
+                                if name in prune or (not include_hidden and name.startswith(".")):
+                                    continue
+                                if include_dirs and matcher(name):
+                                    results.put(entry.path)
+                                with pending_lock:
+                                    pending[0] += 1
+                                dirs.put(entry.path)
+                            elif matcher(name):
+                                results.put(entry.path)
+                except OSError:
+                    pass
+                with pending_lock:
+                    counters["dirs"] += 1
+                    pending[0] -= 1
+                    if pending[0] == 0:
+                        # 全部目录已遍历完
+                        results.put(None)
+        
+        start = time.monotonic()
+        threads = []
+        if pending[0]:
+            for i in range(self.workers):
+                thread = threading.Thread(target=worker, name=f"FileSearch-{i}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        
+        deadline = start + time_budget
+        found = 0
+        timed_out = False
+        cancelled = False
+        try:
+            while threads:
+                if should_stop is not None and should_stop():
+                    cancelled = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                try:
+                    path = results.get(timeout=min(remaining, 0.1))
+                except queue.Empty:
+                    continue
+                if path is None:
+                    break
+                found += 1
+                yield path
+                if max_results and found >= max_results:
+                    break
+        finally:
+            stop.set()
+            for _ in threads:
+                dirs.put(None)
+            if stats is not None:
+                stats.update({
+                    "dirs_scanned": counters["dirs"],
+                    "matches": found,
+                    "elapsed": time.monotonic() - start,
+                    "timed_out": timed_out,
+                    "cancelled": cancelled,
+                    "complete": not timed_out and not cancelled and (not max_results or found < max_results),
+                })
+
+    def search(self, query: str, roots: List[str], max_results: int = 10,
+               time_budget: float = 5.0, **kwargs) -> Tuple[List[str], Dict[str, Any]]:
+        """搜索文件名，返回(匹配路径列表, 统计信息)"""
+        stats = {}
+        paths = list(self.iter_search(query, roots, max_results=max_results,
+                                      time_budget=time_budget, stats=stats, **kwargs))
+        return paths, stats
+
+class ContentSearchEngine:
+    """按文件内容搜索
+
+    遍历目录得到候选文本文件，分批交给线程池用mmap扫描(见content_search.py)，
+    依靠嗅探缓冲区跳过二进制文件。不使用进程池：macOS上进程池以spawn方式启动工作进程，
+    工作进程会重新导入__main__(界面程序、PyQt6等)，首次搜索要多付出数秒。匹配结果随批次完成逐个产出，并附带上下文行；
+    扫描的总字节数和总耗时都有上限。
+    """
+
+    # 内容不是纯文本、无法直接搜索的文件类型
+    BINARY_EXTENSIONS = {
+        "pdf", "doc", "docx", "xls", "xlsx", "ppt", "pptx", "pages", "numbers", "key",
+        "jpg", "jpeg", "png", "gif", "heic", "tiff", "bmp", "ico", "icns", "psd", "sketch",
+        "mp3", "m4a", "wav", "aac", "flac", "mp4", "mov", "mkv", "avi",
+        "zip", "gz", "tgz", "bz2", "xz", "rar", "7z", "dmg", "pkg", "iso",
+        "so", "dylib", "o", "a", "pyc", "class", "jar", "exe", "bin", "sqlite", "db", "woff", "woff2", "ttf", "otf",
+    }
+
+    def __init__(self, workers: Optional[int] = None, batch_size: int = 16, max_file_size: int = 20 * 1024 * 1024):
+        """初始化搜索引擎
+
+        Args:
+            workers: 工作线程数，默认为CPU核数(最多4个)
+            batch_size: 每个任务包含的文件数
+            max_file_size: 超过该大小的文件不扫描
+        """
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.batch_size = batch_size
+        self.max_file_size = max_file_size
+        self._executor = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def _get_executor(self, rebuild: bool = False) -> ThreadPoolExecutor:
+        """获取线程池，rebuild为True时丢弃已损坏的线程池并重新创建"""
+        with self._lock:
+            if rebuild and self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ContentSearch")
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def iter_candidates(self, directory: str, file_pattern: Optional[str] = None) -> Generator[Tuple[str, int], None, None]:
+        """深度优先遍历目录，产出(路径, 大小)，跳过缓存、隐藏目录和二进制类型"""
+        name_regex = re.compile(fnmatch.translate(file_pattern), re.IGNORECASE) if file_pattern else None
+        stack = [os.path.expanduser(directory)]
+        while stack:
+            path = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                name = entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if name not in FileSearchEngine.PRUNE_DIRS and not name.startswith("."):
+                            stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False) or name.startswith("."):
+                        continue
+                    if name_regex is not None and not name_regex.match(name):
+                        continue
+                    if os.path.splitext(name)[1].lstrip(".").lower() in self.BINARY_EXTENSIONS:
+                        continue
+                    size = entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+                if 0 < size <= self.max_file_size:
+                    yield entry.path, size
+
+    def iter_search(self, query: str, directory: str, file_pattern: Optional[str] = None,
+                    regex: bool = False, case_sensitive: bool = False, context: int = 1,
+                    max_results: int = 50, byte_budget: int = 256 * 1024 * 1024, time_budget: float = 10.0,
+                    stats: Optional[Dict[str, Any]] = None,
+                    should_stop: Optional[Callable[[], bool]] = None) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+        """搜索文件内容，产出(路径, 匹配)
+
+        Args:
+            query: 要查找的文字(regex为True时为正则表达式)
+            directory: 搜索目录
+            file_pattern: 只搜索文件名匹配该通配符的文件，如*.txt
+            regex: query是否为正则表达式
+            case_sensitive: 是否区分大小写
+            context: 匹配行前后的上下文行数
+            max_results: 最多产出的匹配行数
+            byte_budget: 最多扫描的文件总字节数
+            time_budget: 总耗时上限(秒)
+            stats: 如提供，结束时写入文件数、字节数、耗时及停止原因
+            should_stop: 返回True时停止搜索
+        """
+        pattern = (query if regex else re.escape(query)).encode('utf-8')
+        flags = 0 if case_sensitive else re.IGNORECASE
+        re.compile(pattern, flags)  # 提前暴露正则错误
+        candidates = self.iter_candidates(directory, file_pattern)
+        start = time.monotonic()
+        deadline = start + time_budget
+        pending = {}
+        submitted_bytes = 0
+        counters = {"files": 0, "scanned_bytes": 0, "matched_files": 0, "failed_batches": 0}
+        found = 0
+        reason = "complete"
+        exhausted = False
+
+        def submit_more():
+            nonlocal submitted_bytes, exhausted, reason
+            while not exhausted and len(pending) < self.workers * 2:
+                batch = []
+                for path, size in candidates:
+                    if submitted_bytes + size > byte_budget:
+                        exhausted = True
+                        reason = "byte_budget"
+                        break
+                    submitted_bytes += size
+                    batch.append(path)
+                    if len(batch) >= self.batch_size:
+                        break
+                else:
+                    exhausted = True
+                if batch:
+                    counters["files"] += len(batch)
+                    try:
+                        future = self._get_executor().submit(content_search.scan_files, batch, pattern, flags, context)
+                    except (RuntimeError, BrokenThreadPool):
+                        # 线程池已关闭或损坏，重建后重试一次
+                        future = self._get_executor(rebuild=True).submit(
+                            content_search.scan_files, batch, pattern, flags, context)
+                    pending[future] = batch
+
+        try:
+            submit_more()
+            while pending:
+                if should_stop is not None and should_stop():
+                    reason = "cancelled"
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    reason = "time_budget"
+                    break
+                done, _ = wait(pending, timeout=min(remaining, 0.1), return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = pending.pop(future)
+                    try:
+                        results, scanned = future.result()
+                    except Exception as e:
+                        # 单个批次失败只跳过这一批文件
+                        counters["failed_batches"] += 1
+                        print(f"内容搜索批次失败({batch[0]}等{len(batch)}个文件): {str(e)}")
+                        if isinstance(e, BrokenThreadPool):
+                            self._get_executor(rebuild=True)
+                        continue
+                    counters["scanned_bytes"] += scanned
+                    for path, matches in results:
+                        counters["matched_files"] += 1
+                        for match in matches:
+                            found += 1
+                            yield path, match
+                            if found >= max_results:
+                                reason = "max_results"
+                                return
+                submit_more()
+        finally:
+            for future in pending:
+                future.cancel()
+            candidates.close()
+            if stats is not None:
+                stats.update(counters)
+                stats.update({"matches": found, "elapsed": time.monotonic() - start, "stop_reason": reason})
+
+class FileRelevanceRanker:
+    """文件搜索结果的本地相关度排序
+
+    综合文件名匹配程度、修改时间、路径深度和文件类型先验打分，用大小为k的
+    最小堆保留得分最高的结果，候选集合很大时复杂度仍为O(n log k)。
+    每个得分附带简短的中文说明。
+    """
+
+    # 文件类型先验：(扩展名集合, 加分, 说明)
+    TYPE_PRIORS = [
+        ({"pdf", "doc", "docx", "pages", "xls", "xlsx", "numbers", "ppt", "pptx", "key", "txt", "md", "rtf", "csv"}, 0.15, "文档"),
+        ({"jpg", "jpeg", "png", "heic", "gif", "svg", "mp3", "m4a", "wav", "mp4", "mov", "mkv"}, 0.1, "媒体文件"),
+        ({"zip", "dmg", "pkg", "rar", "7z"}, 0.05, "安装包/压缩包"),
+        ({"py", "js", "ts", "swift", "java", "c", "cpp", "go", "rs", "html", "json"}, 0.05, "源代码"),
+        ({"log", "tmp", "cache", "plist", "pyc", "o", "db", "sqlite", "lock", "ds_store"}, -0.2, "缓存/系统文件"),
+    ]
+    # 路径中出现时降权的目录
+    LOW_PRIORITY_DIRS = {"Library", "Caches", "tmp", "build", "dist", "node_modules", ".Trash"}
+    RECENCY_HALF_LIFE = 30 * 86400
+
+    def __init__(self, query: str, root: str = "/", now: Optional[float] = None):
+        """初始化排序器
+
+        Args:
+            query: 搜索查询(子串或通配符)
+            root: 搜索根目录，用于计算相对深度
+            now: 当前时间戳，默认为time.time()
+        """
+        self.query = query
+        self.needle = query.casefold().strip("*")
+        self.glob = bool(re.search(r"[*?\[]", query))
+        self.glob_regex = re.compile(fnmatch.translate(query), re.IGNORECASE) if self.glob else None
+        # 关键词作为第二个序列只预处理一次，逐个候选只替换第一个序列
+        self._matcher = difflib.SequenceMatcher(None, "", self.needle)
+        self.root = os.path.normpath(os.path.expanduser(root)).rstrip(os.sep) + os.sep
+        self.root_depth = self.root.count(os.sep) - 1
+        self.now = now or time.time()
+        self._priors = {}
+        for extensions, bonus, label in self.TYPE_PRIORS:
+            for ext in extensions:
+                self._priors[ext] = (bonus, label)
+
+    def _name_score(self, name: str) -> Tuple[float, str]:
+        folded = name.casefold()
+        stem = os.path.splitext(folded)[0]
+        if self.glob:
+            if self.glob_regex.match(name):
+                return 0.5, "通配符匹配"
+        elif self.needle:
+            if stem == self.needle or folded == self.needle:
+                return 1.0, "文件名完全匹配"
+            if folded.startswith(self.needle):
+                return 0.8, "文件名开头匹配"
+            index = folded.find(self.needle)
+            if index > 0:
+                # 关键词前是分隔符时视为单词匹配
+                if not folded[index - 1].isalnum():
+                    return 0.65, "文件名单词匹配"
+                return 0.45, "文件名包含关键词"
+        if not self.needle:
+            return 0.3, "符合条件"
+        # 未直接匹配(如R1返回的结果)时用字符重合度近似相似程度，避免完整的序列比对
+        self._matcher.set_seq1(stem)
+        ratio = self._matcher.quick_ratio()
+        return 0.3 * ratio, "文件名相近" if ratio > 0.5 else "文件名不含关键词"
+
+    @staticmethod
+    def _age_text(seconds: float) -> str:
+        days = seconds / 86400
+        if days < 1:
+            return "今天修改"
+        if days < 30:
+            return f"{int(days)}天前修改"
+        if days < 365:
+            return f"{int(days // 30)}个月前修改"
+        return f"{int(days // 365)}年前修改"
+
+    def score(self, path: str, mtime: Optional[float] = None) -> Tuple[float, str]:
+        """计算单个文件的得分及说明"""
+        name = os.path.basename(path)
+        total, name_reason = self._name_score(name)
+        reasons = [name_reason]
+        # 修改时间：半衰期30天的指数衰减
+        if mtime is None:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = None
+        if mtime is not None:
+            age = max(0.0, self.now - mtime)
+            total += 0.25 * 0.5 ** (age / self.RECENCY_HALF_LIFE)
+            reasons.append(self._age_text(age))
+        # 路径越浅得分越高(只看搜索根目录以下的部分)
+        relative = path[len(self.root):] if path.startswith(self.root) else path
+        parts = relative.split(os.sep)
+        depth = len(parts) - 1
+        total += 0.1 / (1 + 0.5 * depth)
+        # 文件类型先验
+        ext = os.path.splitext(name)[1].lstrip(".").lower() or name.lstrip(".").lower()
+        prior = self._priors.get(ext)
+        if prior:
+            total += prior[0]
+            reasons.append(prior[1])
+        if any(part.startswith(".") or part in self.LOW_PRIORITY_DIRS for part in parts[:-1] if part):
+            total -= 0.15
+            reasons.append("位于隐藏或缓存目录")
+        return round(total, 3), "，".join(reasons)
+
+    def rank(self, candidates, k: int = 10) -> List[Dict[str, Any]]:
+        """从候选中选出得分最高的k个
+
+        Args:
+            candidates: 路径，或(路径, 修改时间)元组的可迭代对象
+            k: 返回的结果数
+
+        Returns:
+            按得分从高到低排列的[{"path", "score", "reason"}]
+        """
+        heap = []
+        for order, candidate in enumerate(candidates):
+            path, mtime = candidate if isinstance(candidate, tuple) else (candidate, None)
+            score, reason = self.score(path, mtime)
+            # 同分时先出现的结果优先
+            item = (score, -order, path, reason)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        return [{"path": path, "score": score, "reason": reason}
+                for score, _, path, reason in sorted(heap, reverse=True)]
+
+class FileNameIndex:
+    """基于SQLite FTS5(trigram分词)的持久文件名索引(需主动开启)
+
+    记录文件的路径、名称、大小和修改时间，在后台线程中构建，之后定期比较各目录的
+    mtime，只重新扫描发生变化的目录。文件名使用trigram分词，因此任意位置的子串
+    查询都可以走全文索引；不足3个字符或通配符查询使用LIKE。SQLite不支持trigram时
+    整个索引退化为LIKE查询。
+
+    通过环境变量MACOS_COPILOT_FILE_INDEX开启：设为1时索引主目录，也可以设为用
+    os.pathsep分隔的目录列表。
+    """
+
+    def __init__(self, roots: List[str], db_path: Optional[str] = None, refresh_interval: float = 300):
+        """初始化索引
+
+        Args:
+            roots: 需要索引的根目录
+            db_path: 数据库文件路径，默认保存在APP_DATA_DIR中
+            refresh_interval: 后台增量刷新的间隔(秒)
+        """
+        self.roots = [os.path.realpath(os.path.expanduser(root)) for root in roots]
+        self.db_path = db_path or os.path.join(APP_DATA_DIR, "file_index.sqlite3")
+        self.refresh_interval = refresh_interval
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.fts = True
+        self._init_schema()
+
+    @classmethod
+    def from_environment(cls) -> Optional["FileNameIndex"]:
+        """根据环境变量创建索引，未开启时返回None"""
+        setting = os.environ.get("MACOS_COPILOT_FILE_INDEX", "").strip()
+        if not setting or setting.lower() in ("0", "false", "no", "off"):
+            return None
+        if setting.lower() in ("1", "true", "yes", "on"):
+            roots = [os.path.expanduser("~")]
+        else:
+            roots = [root for root in setting.split(os.pathsep) if root]
+        return cls(roots)
+
+    def _init_schema(self):
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY, path TEXT UNIQUE, dir TEXT, name TEXT, size INTEGER, mtime REAL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_dir ON files(dir)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY, built_at REAL)")
+            try:
+                self._conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+                    name, content='files', content_rowid='id', tokenize='trigram')""")
+                self._conn.executescript("""
+                    CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+                        INSERT INTO files_fts(rowid, name) VALUES (new.id, new.name);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+                        INSERT INTO files_fts(files_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                    END;""")
+            except sqlite3.OperationalError as e:
+                # SQLite版本过旧(trigram需要3.34+)
+                print(f"文件索引不支持FTS5 trigram，使用LIKE查询: {str(e)}")
+                self.fts = False
+
+    def start(self):
+        """在后台线程中构建尚未索引的根目录，并定期增量刷新"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="FileNameIndex", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        ToolWarmup._lower_thread_priority()
+        while not self._stop.is_set():
+            try:
+                for root in self.roots:
+                    if self._stop.is_set():
+                        break
+                    if self.is_built(root):
+                        self.refresh(root)
+                    else:
+                        self.build(root)
+            except Exception as e:
+                print(f"更新文件索引失败: {str(e)}")
+            self._stop.wait(self.refresh_interval)
+
+    def is_built(self, root: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT built_at FROM roots WHERE path = ?", (root,)).fetchone()
+        return bool(row and row[0])
+
+    def covering_root(self, directory: str) -> Optional[str]:
+        """返回包含该目录且已建好索引的根目录"""
+        directory = os.path.realpath(os.path.expanduser(directory))
+        for root in self.roots:
+            if (directory == root or directory.startswith(root.rstrip("/") + "/")) and self.is_built(root):
+                return root
+        return None
+
+    @staticmethod
+    def _scan_dir(path: str) -> Tuple[Optional[float], List[Tuple[str, str, str, int, float]], List[str]]:
+        """扫描单个目录，返回(目录mtime, 文件记录, 子目录)"""
+        try:
+            mtime = os.stat(path).st_mtime
+            files, subdirs = [], []
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in FileSearchEngine.PRUNE_DIRS and not entry.name.startswith("."):
+                                subdirs.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            files.append((entry.path, path, entry.name, st.st_size, st.st_mtime))
+                    except OSError:
+                        continue
+            return mtime, files, subdirs
+        except OSError:
+            return None, [], []
+
+    def _index_tree(self, top: str):
+        """完整扫描一棵目录树并写入索引，每批目录提交一次事务"""
+        stack = [top]
+        batch_files, batch_dirs = [], []
+        while stack and not self._stop.is_set():
+            path = stack.pop()
+            mtime, files, subdirs = self._scan_dir(path)
+            if mtime is None:
+                continue
+            batch_files.extend(files)
+            batch_dirs.append((path, mtime))
+            stack.extend(subdirs)
+            if len(batch_files) >= 5000 or len(batch_dirs) >= 500:
+                self._write_batch(batch_dirs, batch_files)
+                batch_files, batch_dirs = [], []
+        self._write_batch(batch_dirs, batch_files)
+
+    def _write_batch(self, dirs: List[Tuple[str, float]], files: List[Tuple[str, str, str, int, float]]):
+        if not dirs and not files:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM files WHERE dir = ?", [(d,) for d, _ in dirs])
+            self._conn.executemany("INSERT OR REPLACE INTO dirs(path, mtime) VALUES (?, ?)", dirs)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files(path, dir, name, size, mtime) VALUES (?, ?, ?, ?, ?)", files)
+
+    def build(self, root: str):
+        """完整构建一个根目录的索引"""
+        self._delete_subtree(root)
+        self._index_tree(root)
+        if not self._stop.is_set():
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO roots(path, built_at) VALUES (?, ?)", (root, time.time()))
+
+    def _delete_subtree(self, path: str):
+        low, high = path.rstrip("/") + "/", path.rstrip("/") + "0"
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (path, low, high))
+            self._conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+
+    def refresh(self, root: str) -> int:
+        """增量刷新：只重新扫描mtime发生变化的目录，返回重新扫描的目录数"""
+        low, high = root.rstrip("/") + "/", root.rstrip("/") + "0"
+        with self._lock:
+            known = dict(self._conn.execute(
+                "SELECT path, mtime FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (root, low, high)))
+        rescanned = 0
+        for path, mtime in known.items():
+            if self._stop.is_set():
+                break
+            try:
+                current = os.stat(path).st_mtime
+            except OSError:
+                current = None
+            if current == mtime:
+                continue
+            rescanned += 1
+            if current is None:
+                self._delete_subtree(path)
+                continue
+            new_mtime, files, subdirs = self._scan_dir(path)
+            self._write_batch([(path, new_mtime)], files)
+            # 新出现的子目录整体建索引，消失的子目录删除
+            prefix = path.rstrip("/") + "/"
+            old_subdirs = {p for p in known if p.startswith(prefix) and "/" not in p[len(prefix):]}
+            for subdir in set(subdirs) - old_subdirs:
+                self._index_tree(subdir)
+            for subdir in old_subdirs - set(subdirs):
+                self._delete_subtree(subdir)
+        return rescanned
+
+    def query(self, query: str, directory: str, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """在索引中查询文件名，按修改时间从新到旧排列；无法用索引回答时返回None"""
+        if "[" in query:
+            return None
+        directory = os.path.realpath(os.path.expanduser(directory))
+        low, high = directory.rstrip("/") + "/", directory.rstrip("/") + "0"
+        glob_query = bool(re.search(r"[*?]", query))
+        if self.fts and not glob_query and len(query) >= 3:
+            sql = ("SELECT path, size, mtime FROM files WHERE id IN "
+                   "(SELECT rowid FROM files_fts WHERE files_fts MATCH ?) "
+                   "AND (dir = ? OR (dir >= ? AND dir < ?)) ORDER BY mtime DESC LIMIT ?")
+            params = ('"' + query.replace('"', '""') + '"', directory, low, high, limit)
+        else:
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            if glob_query:
+                pattern = escaped.replace("*", "%").replace("?", "_")
+            else:
+                pattern = f"%{escaped}%"
+            sql = ("SELECT path, size, mtime FROM files WHERE name LIKE ? ESCAPE '\\' "
+                   "AND (dir = ? OR (dir >= ? AND dir < ?)) ORDER BY mtime DESC LIMIT ?")
+            params = (pattern, directory, low, high, limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{"path": path, "size": size, "mtime": mtime} for path, size, mtime in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            dirs = self._conn.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+        return {"roots": self.roots, "files": files, "dirs": dirs, "fts": self.fts,
+                "built": [root for root in self.roots if self.is_built(root)]}
+
+class StepDependencyGraph:
+    """多步shell命令的依赖图
+
+    把命令按&&和;拆分为步骤。默认每个步骤都是屏障，与前后所有步骤存在依赖；
+    只有白名单中读写对象明确的命令(mkdir、touch、cp、cat、带重定向的echo等)
+    才按参数中的路径和重定向目标判断依赖：两个步骤涉及同一路径或存在父子目录
+    关系时，后者依赖前者。包含循环、条件、分组等复合结构的命令不拆分。
+    """
+
+    # 参数(选项除外)都是路径的命令
+    PATH_COMMANDS = {"mkdir", "touch", "cp", "mv", "rm", "rmdir", "ln", "cat", "ls", "head", "tail",
+                     "wc", "stat", "file", "du"}
+    # 不读写文件的命令，只有重定向目标是路径
+    PURE_COMMANDS = {"echo", "printf", "sleep", "true", "date", "whoami", "uname"}
+    # 不带路径参数时读取当前目录的命令
+    CWD_COMMANDS = {"ls", "du"}
+    # 各命令中带有非路径取值的选项，其后一个参数不视为路径
+    OPTION_VALUES = {
+        "mkdir": {"-m", "--mode"},
+        "touch": {"-t", "-d", "--date"},
+        "cp": {"-S", "--suffix"},
+        "mv": {"-S", "--suffix"},
+        "ln": {"-S", "--suffix"},
+        "head": {"-n", "-c", "--lines", "--bytes"},
+        "tail": {"-n", "-c", "--lines", "--bytes"},
+        "du": {"-d", "--max-depth"},
+        "stat": {"-f", "-c", "-t", "--format"},
+    }
+    # 可能改变工作目录的命令(cd单独推算)
+    CWD_CHANGING_COMMANDS = {"pushd", "popd", "source", ".", "eval", "exec", "builtin", "command"}
+    # 复合结构的关键字，出现时不拆分命令
+    COMPOUND_KEYWORDS = {"for", "while", "until", "if", "then", "elif", "else", "fi", "case", "esac",
+                         "do", "done", "select", "function"}
+    # 重定向符号
+    REDIRECTIONS = {">", ">>", "<", "2>", "2>>", "&>", "&>>", ">|"}
+
+    def __init__(self, steps: List[str], cwd: Optional[str] = None):
+        """构建依赖图
+
+        Args:
+            steps: 命令步骤
+            cwd: 解析相对路径所用的工作目录，默认为当前进程的工作目录
+        """
+        self.steps = steps
+        self.cwd = cwd or os.getcwd()
+        self.paths = []
+        self.barriers = []
+        step_cwd = self.cwd
+        for step in steps:
+            # cd等步骤之后工作目录未知时，后续步骤都按屏障处理
+            paths = self._step_paths(step, step_cwd) if step_cwd else None
+            self.barriers.append(paths is None)
+            self.paths.append(paths or set())
+            step_cwd = self._next_cwd(step, step_cwd)
+        self.deps = [set() for _ in steps]
+        for j in range(len(steps)):
+            for i in range(j):
+                if self.barriers[i] or self.barriers[j] or self._conflict(self.paths[i], self.paths[j]):
+                    self.deps[j].add(i)
+
+    @staticmethod
+    def _unquoted(command: str) -> str:
+        """去掉引号内的内容和转义字符，用于检查命令结构"""
+        return re.sub(r"""'[^']*'|"(?:\\.|[^"\\])*"|\\.""", " ", command)
+
+    @classmethod
+    def is_compound(cls, command: str) -> bool:
+        """命令是否包含循环、条件、分组、子shell、here文档或多行结构，这类命令不能按;拆分"""
+        text = cls._unquoted(command)
+        if re.search(r"[{}()\n]|<<", text):
+            return True
+        return any(word in cls.COMPOUND_KEYWORDS for word in re.findall(r"[A-Za-z_]+", text))
+
+    @classmethod
+    def split_steps(cls, command: str) -> List[str]:
+        """在引号之外按&&和;拆分命令，复合命令整体作为一个步骤"""
+        if cls.is_compound(command):
+            return [command.strip()] if command.strip() else []
+        steps, current = [], []
+        quote = None
+        i = 0
+        while i < len(command):
+            ch = command[i]
+            if quote:
+                if ch == "\\" and quote == '"' and i + 1 < len(command):
+                    current.append(command[i:i + 2])
+                    i += 2
+                    continue
+                if ch == quote:
+                    quote = None
+            elif ch == "\\" and i + 1 < len(command):
+                current.append(command[i:i + 2])
+                i += 2
+                continue
+            elif ch in ("'", '"'):
+                quote = ch
+            elif command.startswith("&&", i) or ch == ";":
+                steps.append("".join(current).strip())
+                current = []
+                i += 2 if ch == "&" else 1
+                continue
+            current.append(ch)
+            i += 1
+        steps.append("".join(current).strip())
+        return [step for step in steps if step]
+
+    @classmethod
+    def parse(cls, command: str, cwd: Optional[str] = None) -> "StepDependencyGraph":
+        return cls(cls.split_steps(command), cwd)
+
+    @staticmethod
+    def _normalize(token: str, cwd: str) -> str:
+        """把参数转换为绝对路径，相对路径按cwd解析"""
+        # 通配符只保留其前面的目录部分
+        wildcard = re.search(r"[*?\[]", token)
+        if wildcard:
+            token = os.path.dirname(token[:wildcard.start()]) or "."
+        return os.path.normpath(os.path.join(cwd, os.path.expanduser(token)))
+
+    @classmethod
+    def _next_cwd(cls, step: str, cwd: Optional[str]) -> Optional[str]:
+        """推算步骤执行后的工作目录，无法确定时返回None"""
+        if cwd is None:
+            return None
+        try:
+            tokens = shlex.split(step)
+        except ValueError:
+            return None
+        if not tokens:
+            return cwd
+        if tokens[0] == "cd":
+            arguments = [token for token in tokens[1:] if not token.startswith("-")]
+            if "$" in step or "`" in step or len(arguments) > 1 or "-" in tokens[1:]:
+                return None
+            return cls._normalize(arguments[0] if arguments else "~", cwd)
+        if tokens[0] in cls.CWD_CHANGING_COMMANDS:
+            return None
+        return cwd
+
+    @classmethod
+    def _step_paths(cls, step: str, cwd: str) -> Optional[set]:
+        """提取白名单命令涉及的路径，其他命令或无法可靠分析时返回None(屏障)"""
+        if "$" in step or "`" in step or "|" in step or "&" in step.replace("&>", ""):
+            return None
+        try:
+            tokens = shlex.split(step)
+        except ValueError:
+            return None
+        if not tokens:
+            return set()
+        name = tokens[0]
+        if name not in cls.PATH_COMMANDS and name not in cls.PURE_COMMANDS:
+            return None
+        paths = set()
+        arguments = 0
+        redirect_next = False
+        option_value_next = False
+        option_values = cls.OPTION_VALUES.get(name, ())
+        for token in tokens[1:]:
+            if redirect_next:
+                redirect_next = False
+                paths.add(cls._normalize(token, cwd))
+                continue
+            if token in cls.REDIRECTIONS:
+                redirect_next = True
+                continue
+            # 紧贴重定向符号的目标，如 >file
+            match = re.match(r"^(?:\d?>>?|&>>?|<)(.+)$", token)
+            if match:
+                paths.add(cls._normalize(match.group(1), cwd))
+                continue
+            if name in cls.PURE_COMMANDS:
+                continue
+            # 选项的取值(如mkdir -m 755、head -n 5)不视为路径
+            if option_value_next:
+                option_value_next = False
+                continue
+            if token.startswith("-"):
+                option_value_next = token in option_values
+                continue
+            arguments += 1
+            paths.add(cls._normalize(token, cwd))
+        if redirect_next:
+            return None
+        if name in cls.CWD_COMMANDS and not arguments:
+            paths.add(os.path.normpath(cwd))
+        return paths
+
+    @staticmethod
+    def _conflict(a: set, b: set) -> bool:
+        for x in a:
+            for y in b:
+                if x == y or y.startswith(x.rstrip("/") + "/") or x.startswith(y.rstrip("/") + "/"):
+                    return True
+        return False
+
+class MetricsStore:
+    """系统指标的分层时间序列存储
+
+    每一层是按固定分辨率聚合的定长环形缓冲区(array实现，内存占用固定):
+    默认1秒保留1小时、1分钟保留1天、15分钟保留7天。每个桶记录各指标的均值和最大值，
+    以及按进程名汇总的CPU占用最高的若干进程。查询时选用能覆盖时间窗口的最细一层。
+    """
+
+    METRICS = ("cpu_percent", "memory_percent", "disk_percent", "net_sent", "net_recv",
+               "disk_read", "disk_write", "battery_percent")
+    # (分辨率秒数, 桶数)
+    TIERS = ((1, 3600), (60, 1440), (900, 672))
+
+    def __init__(self, tiers=None, top_processes: int = 10, max_names: int = 8192):
+        """初始化存储
+
+        Args:
+            tiers: 各层的(分辨率秒数, 桶数)，默认为TIERS
+            top_processes: 每个桶保留的进程数
+            max_names: 进程名表的容量，超出后新进程名记为"其他"
+        """
+        self.top_processes = top_processes
+        self.max_names = max_names
+        self._names = ["其他"]
+        self._name_ids = {"其他": 0}
+        self._lock = threading.Lock()
+        self.tiers = [self._new_tier(resolution, capacity) for resolution, capacity in (tiers or self.TIERS)]
+
+    def _new_tier(self, resolution: int, capacity: int) -> Dict[str, Any]:
+        width = len(self.METRICS)
+        return {
+            "resolution": resolution,
+            "capacity": capacity,
+            "head": 0,      # 下一个写入位置
+            "count": 0,
+            "times": array.array('d', bytes(8 * capacity)),
+            "means": array.array('d', bytes(8 * capacity * width)),
+            "maxes": array.array('d', bytes(8 * capacity * width)),
+            "proc_ids": array.array('i', bytes(4 * capacity * self.top_processes)),
+            "proc_cpu": array.array('f', bytes(4 * capacity * self.top_processes)),
+            # 正在累积的桶
+            "bucket": None,
+            "samples": 0,
+            "sums": [0.0] * width,
+            "peaks": [float("-inf")] * width,
+            "proc_sums": {},
+        }
+
+    def _name_id(self, name: str) -> int:
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            if len(self._names) >= self.max_names:
+                return 0
+            name_id = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = name_id
+        return name_id
+
+    @staticmethod
+    def _sample_values(sample: Dict[str, Any]) -> List[float]:
+        net = sample.get("net") or {}
+        disk_io = sample.get("disk_io") or {}
+        values = {
+            "cpu_percent": sample.get("cpu_percent"),
+            "memory_percent": sample.get("memory_percent"),
+            "disk_percent": sample.get("disk_percent"),
+            "net_sent": net.get("bytes_sent"),
+            "net_recv": net.get("bytes_recv"),
+            "disk_read": disk_io.get("read_bytes"),
+            "disk_write": disk_io.get("write_bytes"),
+            "battery_percent": sample.get("battery_percent"),
+        }
+        # 缺失的指标记为NaN，聚合时跳过
+        return [float(values[name]) if values[name] is not None else float("nan") for name in MetricsStore.METRICS]
+
+    def add(self, sample: Dict[str, Any], processes: List[Dict[str, Any]]):
+        """写入一次采样
+
+        Args:
+            sample: TelemetrySampler的采样
+            processes: 本次采样的进程表
+        """
+        values = self._sample_values(sample)
+        by_name = {}
+        for proc in processes:
+            cpu = proc.get("cpu_percent") or 0.0
+            if cpu > 0:
+                name = proc.get("name") or "?"
+                by_name[name] = by_name.get(name, 0.0) + cpu
+        with self._lock:
+            proc_ids = {}
+            for name, cpu in by_name.items():
+                name_id = self._name_id(name)
+                proc_ids[name_id] = proc_ids.get(name_id, 0.0) + cpu
+            for tier in self.tiers:
+                bucket = int(sample["time"] // tier["resolution"])
+                if tier["bucket"] is not None and bucket != tier["bucket"]:
+                    self._flush(tier)
+                tier["bucket"] = bucket
+                tier["samples"] += 1
+                sums, peaks = tier["sums"], tier["peaks"]
+                for i, value in enumerate(values):
+                    if value == value:
+                        sums[i] += value
+                        if value > peaks[i]:
+                            peaks[i] = value
+                proc_sums = tier["proc_sums"]
+                for name_id, cpu in proc_ids.items():
+                    proc_sums[name_id] = proc_sums.get(name_id, 0.0) + cpu
+
+    def _flush(self, tier: Dict[str, Any]):
+        """把正在累积的桶写入环形缓冲区（调用方持有锁）"""
+        samples = tier["samples"]
+        if samples:
+            width = len(self.METRICS)
+            slot = tier["head"]
+            tier["times"][slot] = tier["bucket"] * tier["resolution"]
+            for i in range(width):
+                peak = tier["peaks"][i]
+                has_value = peak != float("-inf")
+                tier["means"][slot * width + i] = tier["sums"][i] / samples if has_value else float("nan")
+                tier["maxes"][slot * width + i] = peak if has_value else float("nan")
+            # 进程CPU取桶内均值，只保留最高的若干个
+            top = heapq.nlargest(self.top_processes, tier["proc_sums"].items(), key=lambda item: item[1])
+            base = slot * self.top_processes
+            for j in range(self.top_processes):
+                name_id, total = top[j] if j < len(top) else (-1, 0.0)
+                tier["proc_ids"][base + j] = name_id
+                tier["proc_cpu"][base + j] = total / samples
+            tier["head"] = (slot + 1) % tier["capacity"]
+            tier["count"] = min(tier["count"] + 1, tier["capacity"])
+        tier["samples"] = 0
+        tier["sums"] = [0.0] * len(self.METRICS)
+        tier["peaks"] = [float("-inf")] * len(self.METRICS)
+        tier["proc_sums"] = {}
+
+    def _slots(self, tier: Dict[str, Any], since: float) -> List[int]:
+        """返回时间不早于since的桶位置，从旧到新"""
+        capacity, head = tier["capacity"], tier["head"]
+        slots = []
+        for k in range(tier["count"]):
+            slot = (head - 1 - k) % capacity
+            if tier["times"][slot] < since:
+                break
+            slots.append(slot)
+        slots.reverse()
+        return slots
+
+    def _select_tier(self, seconds: float) -> Dict[str, Any]:
+        """选择能覆盖时间窗口的最细一层，都覆盖不了时用最粗的一层"""
+        for tier in self.tiers:
+            if tier["resolution"] * tier["capacity"] >= seconds:
+                return tier
+        return self.tiers[-1]
+
+    @staticmethod
+    def _percentile(values: List[float], percent: float) -> float:
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, int(round(percent / 100 * len(ordered) + 0.5)) - 1))
+        return ordered[index]
+
+    def query(self, seconds: float, top_k: int = 5, now: Optional[float] = None) -> Dict[str, Any]:
+        """计算最近seconds秒内的聚合值
+
+        Returns:
+            {"resolution", "buckets", "start", "end",
+             "metrics": {指标: {"max", "mean", "p95"}},
+             "top_processes": [{"name", "cpu_percent"}]}
+            进程的cpu_percent是窗口内的平均占用，不在某个桶的前几名时按0计
+        """
+        now = time.time() if now is None else now
+        width = len(self.METRICS)
+        with self._lock:
+            tier = self._select_tier(seconds)
+            # 窗口的起点按分辨率向下取整，包含起点所在的桶
+            since = (now - seconds) // tier["resolution"] * tier["resolution"]
+            slots = self._slots(tier, since)
+            metrics = {}
+            for i, name in enumerate(self.METRICS):
+                means = [tier["means"][slot * width + i] for slot in slots]
+                maxes = [tier["maxes"][slot * width + i] for slot in slots]
+                means = [value for value in means if value == value]
+                maxes = [value for value in maxes if value == value]
+                if means:
+                    metrics[name] = {
+                        "max": max(maxes),
+                        "mean": sum(means) / len(means),
+                        "p95": self._percentile(means, 95),
+                    }
+            totals = {}
+            for slot in slots:
+                base = slot * self.top_processes
+                for j in range(self.top_processes):
+                    name_id = tier["proc_ids"][base + j]
+                    if name_id < 0:
+                        break
+                    totals[name_id] = totals.get(name_id, 0.0) + tier["proc_cpu"][base + j]
+            top = heapq.nlargest(top_k, totals.items(), key=lambda item: item[1])
+            top_processes = [{"name": self._names[name_id], "cpu_percent": total / len(slots)}
+                             for name_id, total in top]
+            return {
+                "resolution": tier["resolution"],
+                "buckets": len(slots),
+                "start": tier["times"][slots[0]] if slots else None,
+                "end": tier["times"][slots[-1]] + tier["resolution"] if slots else None,
+                "metrics": metrics,
+                "top_processes": top_processes,
+            }
+
+    def memory_bytes(self) -> int:
+        """环形缓冲区占用的字节数(不含进程名表)"""
+        total = 0
+        for tier in self.tiers:
+            for key in ("times", "means", "maxes", "proc_ids", "proc_cpu"):
+                total += tier[key].buffer_info()[1] * tier[key].itemsize
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tiers": {f"{tier['resolution']}s": tier["count"] for tier in self.tiers},
+                "process_names": len(self._names) - 1,
+                "memory_kb": self.memory_bytes() // 1024,
+            }
+
+class TelemetrySampler:
+    """后台系统指标采样器
+
+    在低优先级后台线程中按固定间隔采样CPU、内存、磁盘、电池、网络计数器和各进程的CPU占用，
+    最近的采样保存在定长环形缓冲区中，同时写入分层的MetricsStore供查询历史。进程的CPU占用率需要两次采样之间的差值才有意义，
+    采样器持续持有进程对象，工具直接读取最近一次快照即可得到准确值，无需现场采样。
+    """
+
+    def __init__(self, interval: float = 2.0, history: int = 300, battery_interval: float = 30.0):
+        """初始化采样器
+
+        Args:
+            interval: 采样间隔(秒)
+            history: 环形缓冲区保留的采样数
+            battery_interval: 电池信息的采样间隔(秒)，电池状态变化慢，查询也较慢
+        """
+        self.interval = interval
+        self.battery_interval = battery_interval
+        self.samples = collections.deque(maxlen=history)
+        self.store = MetricsStore()
+        self.processes = []     # 最近一次采样的完整进程表
+        self.battery = None
+        self._battery_time = 0.0
+        self._last_net = None
+        self._last_disk_io = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动采样线程"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="TelemetrySampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        ToolWarmup._lower_thread_priority()
+        # 首次采样只建立CPU计数器基准，不作为有效数据
+        self.sample_once(baseline=True)
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample_once()
+            except Exception as e:
+                print(f"系统指标采样失败: {str(e)}")
+
+    @staticmethod
+    def _rate(current, previous, elapsed: float, fields) -> Dict[str, float]:
+        if previous is None or elapsed <= 0:
+            return {field: 0.0 for field in fields}
+        return {field: max(0.0, (getattr(current, field) - getattr(previous, field)) / elapsed) for field in fields}
+
+    def sample_once(self, baseline: bool = False) -> Optional[Dict[str, Any]]:
+        """采样一次
+
+        Args:
+            baseline: 是否只建立计数器基准(不写入缓冲区)
+
+        Returns:
+            本次采样，baseline为True时返回None
+        """
+        now = time.time()
+        cpu = psutil.cpu_percent(interval=None)
+        memory = psutil.virtual_memory()
+        try:
+            disk = psutil.disk_usage('/')
+        except OSError:
+            disk = None
+        try:
+            net = psutil.net_io_counters()
+        except Exception:
+            net = None
+        try:
+            disk_io = psutil.disk_io_counters()
+        except Exception:
+            disk_io = None
+
+        processes = []
+        for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent']):
+            try:
+                info = proc.info
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            info['cpu_percent'] = info.get('cpu_percent') or 0.0
+            info['memory_percent'] = info.get('memory_percent') or 0.0
+            processes.append(info)
+
+        if now - self._battery_time >= self.battery_interval:
+            self._battery_time = now
+            try:
+                self.battery = psutil.sensors_battery()
+            except Exception:
+                self.battery = None
+
+        elapsed = now - self._last_net[0] if self._last_net else 0.0
+        sample = {
+            "time": now,
+            "cpu_percent": cpu,
+            "memory_percent": memory.percent,
+            "memory_used": memory.used,
+            "memory_total": memory.total,
+            "disk_percent": disk.percent if disk else None,
+            "disk_total": disk.total if disk else None,
+            "net": self._rate(net, self._last_net[1] if self._last_net else None, elapsed,
+                              ("bytes_sent", "bytes_recv")) if net else None,
+            "disk_io": self._rate(disk_io, self._last_disk_io, elapsed,
+                                  ("read_bytes", "write_bytes")) if disk_io else None,
+            "battery_percent": self.battery.percent if self.battery else None,
+        }
+        self._last_net = (now, net)
+        self._last_disk_io = disk_io
+        if baseline:
+            return None
+
+        with self._lock:
+            self.samples.append(sample)
+            self.processes = processes
+        self.store.add(sample, processes)
+        self._ready.set()
+        return sample
+
+    def wait_ready(self, timeout: float = 5.0) -> bool:
+        """等待第一次有效采样完成"""
+        return self._ready.wait(timeout)
+
+    def is_fresh(self) -> bool:
+        """最近一次采样是否在三个采样间隔之内"""
+        with self._lock:
+            return bool(self.samples) and time.time() - self.samples[-1]["time"] <= self.interval * 3
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """最近一次采样"""
+        with self._lock:
+            return dict(self.samples[-1]) if self.samples else None
+
+    def process_snapshot(self) -> List[Dict[str, Any]]:
+        """最近一次采样的进程表"""
+        with self._lock:
+            return list(self.processes)
+
+    def history(self, seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+        """最近seconds秒内的采样，为None时返回全部"""
+        with self._lock:
+            samples = list(self.samples)
+        if seconds is None:
+            return samples
+        cutoff = time.time() - seconds
+        return [sample for sample in samples if sample["time"] >= cutoff]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            last = self.samples[-1]["time"] if self.samples else None
+            count = len(self.samples)
+        return {
+            "running": self.is_running,
+            "interval": self.interval,
+            "samples": count,
+            "last_sample_age": round(time.time() - last, 1) if last else None,
+            "store": self.store.stats(),
+        }
+
 class MacOSTools:
     """macOS系统工具集合"""
     
     # 添加一个类变量存储当前的R1增强器
     r1_enhancer = None
     
+    # 已安装应用程序的持久化索引（首次使用时创建）
+    app_index = None
+    
+    # 应用目录监视器，安装或删除应用时增量更新应用索引
+    fs_watcher = None
+    
+    # 工具实时输出（如终端命令的逐行输出）的接收函数，由助手在处理请求时设置
+    output_sink = None
+    
+    # 持久shell会话池及当前对话对应的会话标识
+    shell_pool = None
+    shell_session_key = "default"
+    
+    # 后台任务管理器
+    job_manager = None
+    
+    # 拒绝执行的危险命令片段
+    DANGEROUS_COMMANDS = [
+        "rm -rf", "dd if=", "> /dev/", ":(){ :|:& };:",
+        "chmod -R 777 /", "mv / /dev/null"
+    ]
+    
+    # 后台预热任务
+    warmup = None
+    
+    # 后台系统指标采样器
+    telemetry = None
+    
+    # 进程查询支持的排序依据及其说明
+    PROCESS_SORT_KEYS = {"cpu": "CPU使用率", "rss": "内存占用", "threads": "线程数", "open_files": "打开的文件数"}
+    
+    # 只读系统命令(sw_vers、uname、system_profiler等)的结果缓存
+    command_cache = CommandResultCache()
+    
+    # 进程内并行文件搜索
+    file_search = FileSearchEngine()
+    
+    # 文件内容搜索
+    content_search = ContentSearchEngine()
+    
+    # 持久文件名索引(需通过MACOS_COPILOT_FILE_INDEX开启)
+    file_index = None
+    
+    # 当前请求的取消标志，由助手在处理请求时设置
+    cancel_event = None
+    
+    # 本地搜索无结果时后台运行R1搜索的线程池及各策略的统计
+    _search_executor = None
+    _search_stats = {name: {"runs": 0, "wins": 0, "empty": 0, "total_latency": 0.0}
+                     for name in ("local", "r1")}
+    _search_stats_lock = threading.Lock()
+    # 本地搜索无结果时等待R1搜索的最长时间(秒)
+    R1_SEARCH_WAIT = 30.0
+    # 本地搜索运行超过该时间(秒)仍无结果时才启动R1搜索
+    R1_SEARCH_GRACE = 2.0
+    
+    # 应用匹配索引及其对应的应用索引版本
+    _app_match_index = None
+    _app_match_generation = -1
+    
     @classmethod
     def set_r1_enhancer(cls, enhancer):
         """设置R1增强器"""
         cls.r1_enhancer = enhancer
     
+    @classmethod
+    def get_app_index(cls) -> ApplicationIndex:
+        """获取应用索引，不存在时创建"""
+        if cls.app_index is None:
+            cls.app_index = ApplicationIndex()
+        return cls.app_index
+    
+    @classmethod
+    def start_app_watcher(cls, interval: float = 2.0) -> DirectoryWatcher:
+        """启动应用目录监视，之后查询应用列表不再需要检查目录"""
+        if cls.fs_watcher is None:
+            cls.fs_watcher = DirectoryWatcher(interval=interval)
+            cls.fs_watcher.start()
+            cls.get_app_index().attach_watcher(cls.fs_watcher)
+        return cls.fs_watcher
+    
+    @classmethod
+    def start_file_index(cls) -> Optional[FileNameIndex]:
+        """按环境变量开启文件名索引并在后台构建，未开启时返回None"""
+        if cls.file_index is None:
+            cls.file_index = FileNameIndex.from_environment()
+            if cls.file_index is not None:
+                cls.file_index.start()
+        return cls.file_index
+    
+    @classmethod
+    def set_cancel_event(cls, event: Optional[threading.Event]):
+        """设置当前请求的取消标志，标志被置位后长时间运行的工具应尽快结束"""
+        cls.cancel_event = event
+    
+    @classmethod
+    def is_cancelled(cls) -> bool:
+        return cls.cancel_event is not None and cls.cancel_event.is_set()
+    
+    @classmethod
+    def iter_search_files(cls, query: str, directory: str = "/Users", max_results: int = 200,
+                          time_budget: float = 8.0, stats: Optional[Dict[str, Any]] = None,
+                          cancel_event: Optional[threading.Event] = None) -> Generator[str, None, None]:
+        """逐个产出匹配的文件路径：目录已建立文件名索引时查询索引，否则实时遍历
+
+        索引按间隔增量刷新，最近新建的文件可能尚未收录，因此索引没有结果时仍实时遍历一次。
+        请求被取消或cancel_event被置位时立即停止。stats中会写入结果来源(index/walk)及遍历统计。
+        """
+        stats = stats if stats is not None else {}
+        should_stop = lambda: cls.is_cancelled() or (cancel_event is not None and cancel_event.is_set())
+        index = cls.file_index
+        if index is not None and index.covering_root(directory):
+            indexed = index.query(query, directory, limit=max_results)
+            if indexed:
+                stats.update({"source": "index", "timed_out": False, "complete": len(indexed) < max_results})
+                for item in indexed:
+                    if should_stop():
+                        stats["cancelled"] = True
+                        return
+                    yield item["path"]
+                return
+        stats["source"] = "walk"
+        search = cls.file_search.iter_search(query, [directory], max_results=max_results,
+                                             time_budget=time_budget, stats=stats, should_stop=should_stop)
+        try:
+            for path in search:
+                yield path
+                if should_stop():
+                    break
+        finally:
+            search.close()
+    
+    @classmethod
+    def _record_search(cls, strategy: str, latency: Optional[float] = None,
+                       found: Optional[bool] = None, won: bool = False):
+        """记录搜索策略的耗时、是否有结果以及是否胜出"""
+        with cls._search_stats_lock:
+            entry = cls._search_stats[strategy]
+            if latency is not None:
+                entry["runs"] += 1
+                entry["total_latency"] += latency
+                if not found:
+                    entry["empty"] += 1
+            if won:
+                entry["wins"] += 1
+    
+    @classmethod
+    def get_search_stats(cls) -> Dict[str, Dict[str, Any]]:
+        """各搜索策略的运行次数、胜出次数、胜率和平均耗时"""
+        with cls._search_stats_lock:
+            result = {}
+            total_wins = sum(entry["wins"] for entry in cls._search_stats.values())
+            for name, entry in cls._search_stats.items():
+                result[name] = dict(entry)
+                result[name]["win_rate"] = entry["wins"] / total_wins if total_wins else 0
+                result[name]["avg_latency"] = entry["total_latency"] / entry["runs"] if entry["runs"] else 0
+            return result
+    
+    @classmethod
+    def _start_r1_search(cls, query: str, directory: str, cancel_event: threading.Event):
+        """在后台线程中启动R1搜索，R1不可用时返回None"""
+        enhancer = cls.r1_enhancer
+        if not enhancer or not enhancer.is_available:
+            return None
+        if cls._search_executor is None:
+            cls._search_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="R1Search")
+        
+        def run():
+            start = time.perf_counter()
+            try:
+                results = enhancer.enhance_file_search(query, directory, cancel_event=cancel_event)
+            except Exception as e:
+                print(f"R1文件搜索失败: {str(e)}")
+                results = []
+            # 被取消的运行不计入耗时统计
+            if not cancel_event.is_set():
+                cls._record_search("r1", time.perf_counter() - start, bool(results))
+            return results
+        
+        return cls._search_executor.submit(run)
+    
+    @classmethod
+    def set_output_sink(cls, sink: Optional[Callable[[str, str], None]]):
+        """设置工具实时输出的接收函数，参数为(行文本, "stdout"/"stderr")"""
+        cls.output_sink = sink
+    
+    @classmethod
+    def get_shell_pool(cls) -> ShellSessionPool:
+        """获取shell会话池，不存在时创建"""
+        if cls.shell_pool is None:
+            cls.shell_pool = ShellSessionPool()
+            atexit.register(cls.shell_pool.close_all)
+        return cls.shell_pool
+    
+    @classmethod
+    def get_job_manager(cls) -> JobManager:
+        """获取后台任务管理器，不存在时创建"""
+        if cls.job_manager is None:
+            cls.job_manager = JobManager()
+            atexit.register(cls.job_manager.shutdown)
+        return cls.job_manager
+    
+    @classmethod
+    def _check_dangerous(cls, command: str) -> Optional[str]:
+        """检查命令是否包含危险操作，包含时返回拒绝信息"""
+        for dc in cls.DANGEROUS_COMMANDS:
+            if dc in command:
+                return f"为安全起见，系统拒绝执行包含 '{dc}' 的命令。请确保您的命令是安全的。"
+        return None
+    
+    @classmethod
+    def set_shell_session(cls, key: str):
+        """设置当前对话使用的shell会话"""
+        cls.shell_session_key = key
+    
+    @staticmethod
+    def _run_streaming(command: str, timeout: float = 10, stream: bool = True,
+                       cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                       label: str = "") -> Tuple[OutputCapture, OutputCapture, Optional[int], bool]:
+        """通过非阻塞管道运行shell命令，输出写入有界的OutputCapture，并逐行推送给output_sink
+
+        Args:
+            command: shell命令
+            timeout: 超时时间(秒)，超时后终止整个进程组
+            stream: 是否把输出推送给output_sink
+            cwd: 工作目录
+            env: 环境变量
+            label: 推送给output_sink时每行的前缀
+
+        Returns:
+            (stdout捕获, stderr捕获, 返回码, 是否超时)，超时时为已产生的部分输出
+        """
+        sink = MacOSTools.output_sink if stream else None
+        proc = subprocess.Popen(command, shell=True, executable=ShellSession.SHELL, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                cwd=cwd if cwd and os.path.isdir(cwd) else None, env=env,
+                                start_new_session=True)
+        captures = {"stdout": OutputCapture(), "stderr": OutputCapture()}
+        pending = {"stdout": b"", "stderr": b""}
+        
+        def emit(name, data, final=False):
+            pending[name] += data
+            *lines, pending[name] = pending[name].split(b"\n")
+            if final and pending[name]:
+                lines.append(pending[name])
+                pending[name] = b""
+            if sink:
+                for line in lines:
+                    try:
+                        sink(label + line.decode('utf-8', errors='replace'), name)
+                    except Exception:
+                        pass
+        
+        selector = selectors.DefaultSelector()
+        for fileobj, name in ((proc.stdout, "stdout"), (proc.stderr, "stderr")):
+            os.set_blocking(fileobj.fileno(), False)
+            selector.register(fileobj, selectors.EVENT_READ, name)
+        
+        deadline = time.monotonic() + timeout
+        timed_out = False
+        try:
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                for key, _ in selector.select(min(remaining, 0.5)):
+                    try:
+                        data = os.read(key.fd, 65536)
+                    except BlockingIOError:
+                        continue
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        continue
+                    captures[key.data].write(data)
+                    emit(key.data, data)
+            if not timed_out:
+                try:
+                    proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+                except subprocess.TimeoutExpired:
+                    timed_out = True
+        finally:
+            selector.close()
+            if timed_out:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                proc.wait()
+            proc.stdout.close()
+            proc.stderr.close()
+        
+        emit("stdout", b"", final=True)
+        emit("stderr", b"", final=True)
+        return captures["stdout"], captures["stderr"], proc.returncode, timed_out
+    
+    @classmethod
+    def start_warmup(cls) -> 'ToolWarmup':
+        """在后台启动工具缓存预热，重复调用返回同一个预热任务"""
+        if cls.warmup is None:
+            cls.warmup = ToolWarmup()
+            cls.warmup.start()
+        return cls.warmup
+    
+    @classmethod
+    def start_telemetry(cls, interval: float = 2.0) -> TelemetrySampler:
+        """启动后台系统指标采样，重复调用返回同一个采样器"""
+        if cls.telemetry is None:
+            cls.telemetry = TelemetrySampler(interval=interval)
+        cls.telemetry.start()
+        return cls.telemetry
+    
+    @classmethod
+    def get_telemetry(cls, timeout: float = 5.0) -> Optional[TelemetrySampler]:
+        """返回已有有效采样的采样器；采样器未启动、尚未完成首次采样或已停止更新时返回None"""
+        sampler = cls.telemetry
+        if sampler is None or not sampler.wait_ready(timeout) or not sampler.is_fresh():
+            return None
+        return sampler
+    
+    @classmethod
+    def top_processes(cls, sort_by: str = "cpu", limit: int = 10, name: str = "",
+                      user: str = "") -> List[Dict[str, Any]]:
+        """选出资源占用最高的进程
+        
+        先按名称和用户过滤，每个进程的属性在一次oneshot内读取，只有按打开文件数排序时才查询打开的文件；
+        无权读取的属性为None，进程仍然保留。用堆选出前limit个，不对全部进程排序。
+        后台采样器运行时CPU占用取自采样器的最近一次采样。
+        
+        Args:
+            sort_by: PROCESS_SORT_KEYS中的排序依据
+            limit: 返回的进程数
+            name: 名称过滤(子串，不区分大小写)
+            user: 用户过滤(不区分大小写)
+            
+        Returns:
+            [{"pid", "name", "username", "cpu_percent", "memory_percent", "rss", "num_threads", "open_files"}]
+        """
+        sampler = cls.get_telemetry()
+        if sampler is not None:
+            sampled_cpu = {proc['pid']: proc['cpu_percent'] for proc in sampler.process_snapshot()}
+        else:
+            sampled_cpu = None
+            # 等待预热完成psutil的CPU计数器初始化，否则首次采样全部为0
+            cls.wait_for_warmup("psutil")
+        name = name.strip().lower()
+        user = user.strip().lower()
+        total_memory = psutil.virtual_memory().total
+        
+        attrs = ['memory_info', 'num_threads'] + ([] if sampled_cpu is not None else ['cpu_percent'])
+        if sort_by == "open_files":
+            attrs.append('open_files')
+        
+        def collect():
+            for proc in psutil.process_iter():
+                try:
+                    with proc.oneshot():
+                        # 无权读取的属性记为None(未知)，进程仍参与排序
+                        info = proc.as_dict(attrs=['name', 'username'], ad_value=None)
+                        proc_name = info['name'] or ""
+                        username = info['username'] or ""
+                        if name and name not in proc_name.lower():
+                            continue
+                        if user and user != username.lower():
+                            continue
+                        info.update(proc.as_dict(attrs=attrs, ad_value=None))
+                except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                    continue
+                memory_info = info.get('memory_info')
+                rss = memory_info.rss if memory_info is not None else None
+                if sampled_cpu is not None:
+                    cpu = sampled_cpu.get(proc.pid, 0.0)
+                else:
+                    cpu = info.get('cpu_percent')
+                open_files = info.get('open_files')
+                yield {
+                    "pid": proc.pid,
+                    "name": proc_name,
+                    "username": username,
+                    "cpu_percent": cpu,
+                    "memory_percent": rss * 100.0 / total_memory if rss is not None and total_memory else None,
+                    "rss": rss,
+                    "num_threads": info.get('num_threads'),
+                    "open_files": len(open_files) if open_files is not None else None,
+                }
+        
+        key = {"cpu": "cpu_percent", "rss": "rss", "threads": "num_threads", "open_files": "open_files"}[sort_by]
+        # 未知的值排在已知值之后
+        return heapq.nlargest(limit, collect(), key=lambda proc: -1 if proc[key] is None else proc[key])
+    
+    @classmethod
+    def wait_for_warmup(cls, step: str, timeout: float = 30.0) -> bool:
+        """预热尚未完成指定步骤时等待它完成，未启动预热时立即返回"""
+        if cls.warmup is None:
+            return True
+        return cls.warmup.wait(step, timeout)
+    
+    @classmethod
+    def get_static_system_facts(cls) -> Dict[str, str]:
+        """获取系统版本和CPU型号，结果在会话期间缓存，只在首次调用时执行子进程"""
+        return {
+            "version": cls.command_cache.run("sw_vers"),
+            "cpu": cls.command_cache.run("sysctl -n machdep.cpu.brand_string").strip()
+        }
+    
+    @classmethod
+    def get_app_match_index(cls) -> AppMatchIndex:
+        """获取应用匹配索引，应用索引内容变化后才重新构建"""
+        app_index = cls.get_app_index()
+        apps = app_index.get_applications()
+        if cls._app_match_index is None or cls._app_match_generation != app_index.generation:
+            cls._app_match_index = AppMatchIndex(apps, APP_ALIASES)
+            cls._app_match_generation = app_index.generation
+        return cls._app_match_index
+    
     @staticmethod
     @tool
     def get_system_info() -> str:
         """获取macOS系统信息"""
         try:
-            # 系统版本信息
-            version_info = subprocess.run(['sw_vers'], capture_output=True, text=True)
-            # CPU信息
-            cpu_info = subprocess.run(['sysctl', '-n', 'machdep.cpu.brand_string'], capture_output=True, text=True)
-            # 内存信息
-            memory = psutil.virtual_memory()
-            # 磁盘信息
-            disk = psutil.disk_usage('/')
+            # 系统版本和CPU信息在会话期间不变，只查询一次
+            facts = MacOSTools.get_static_system_facts()
+            sampler = MacOSTools.get_telemetry()
+            if sampler is not None:
+                # 直接读取后台采样器的最近一次采样
+                sample = sampler.latest()
+                memory_total, memory_percent = sample["memory_total"], sample["memory_percent"]
+                disk_total, disk_percent = sample["disk_total"], sample["disk_percent"]
+                cpu_line = f"\nCPU使用率: {sample['cpu_percent']:.1f}%"
+            else:
+                memory = psutil.virtual_memory()
+                disk = psutil.disk_usage('/')
+                memory_total, memory_percent = memory.total, memory.percent
+                disk_total, disk_percent = disk.total, disk.percent
+                cpu_line = ""
             
             info = f"""
 系统信息:
-{version_info.stdout}
-CPU: {cpu_info.stdout.strip()}
-内存: {memory.total // (1024**3)}GB 总内存, {memory.percent}% 使用率
-磁盘: {disk.total // (1024**3)}GB 总空间, {disk.percent}% 使用率
+{facts['version']}
+CPU: {facts['cpu']}{cpu_line}
+内存: {memory_total // (1024**3)}GB 总内存, {memory_percent}% 使用率
+磁盘: {disk_total // (1024**3)}GB 总空间, {disk_percent}% 使用率
             """
             return info
         except Exception as e:
@@ -68,20 +3442,13 @@ CPU: {cpu_info.stdout.strip()}
     def get_running_processes() -> str:
         """获取正在运行的进程列表"""
         try:
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
-                try:
-                    processes.append(proc.info)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    pass
-            
-            # 按CPU使用率排序，取前10个
-            processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
-            top_processes = processes[:10]
+            top_processes = MacOSTools.top_processes("cpu", limit=10)
             
             result = "正在运行的进程 (按CPU使用率排序):\n"
             for proc in top_processes:
-                result += f"PID: {proc['pid']}, 名称: {proc['name']}, CPU: {proc['cpu_percent']:.1f}%, 内存: {proc['memory_percent']:.1f}%\n"
+                cpu = "未知" if proc['cpu_percent'] is None else f"{proc['cpu_percent']:.1f}%"
+                memory = "未知" if proc['memory_percent'] is None else f"{proc['memory_percent']:.1f}%"
+                result += f"PID: {proc['pid']}, 名称: {proc['name']}, CPU: {cpu}, 内存: {memory}\n"
             
             return result
         except Exception as e:
@@ -89,95 +3456,158 @@ CPU: {cpu_info.stdout.strip()}
     
     @staticmethod
     @tool
-    def open_application(app_name: str) -> str:
-        """增强：支持别名、拼音、英文、中文混输，模糊匹配"""
+    def query_processes(sort_by: str = "cpu", limit: int = 10, name: str = "", user: str = "") -> str:
+        """按资源占用查询进程，返回占用最高的若干个进程
+        
+        Args:
+            sort_by: 排序依据: cpu(CPU使用率)、rss(内存占用)、threads(线程数)、open_files(打开的文件数)
+            limit: 返回的进程数
+            name: 只查询名称包含该文字的进程(不区分大小写)，为空时不限
+            user: 只查询该用户的进程，为空时不限
+            
+        Returns:
+            进程列表
+        """
         try:
-            import difflib
-            import unicodedata
-            # 获取所有已安装应用
-            all_apps = MacOSTools._get_all_applications()
-            if not all_apps:
+            sort_by = sort_by.strip().lower()
+            if sort_by not in MacOSTools.PROCESS_SORT_KEYS:
+                return f"不支持的排序依据: {sort_by}，可选: {', '.join(MacOSTools.PROCESS_SORT_KEYS)}"
+            limit = max(1, min(int(limit), 100))
+            processes = MacOSTools.top_processes(sort_by, limit=limit, name=name, user=user)
+            if not processes:
+                return "没有找到符合条件的进程"
+            
+            label = MacOSTools.PROCESS_SORT_KEYS[sort_by]
+            result = f"按{label}排序的前{len(processes)}个进程:\n"
+            
+            def fmt(value, template):
+                return "未知" if value is None else template.format(value)
+            
+            for proc in processes:
+                line = (f"PID: {proc['pid']}, 名称: {proc['name']}, 用户: {proc['username'] or '未知'}, "
+                        f"CPU: {fmt(proc['cpu_percent'], '{:.1f}%')}, "
+                        f"内存: {fmt(None if proc['rss'] is None else proc['rss'] / (1024 ** 2), '{:.1f}MB')}, "
+                        f"线程: {fmt(proc['num_threads'], '{}')}")
+                if sort_by == "open_files":
+                    line += f", 打开文件: {fmt(proc['open_files'], '{}')}"
+                result += line + "\n"
+            return result
+        except Exception as e:
+            return f"查询进程失败: {str(e)}"
+    
+    @staticmethod
+    @tool
+    def get_metrics_history(minutes: float = 60, top_k: int = 5) -> str:
+        """查询过去一段时间的系统负载历史：CPU、内存、磁盘、网络的最大值/平均值/P95，以及最耗CPU的进程
+        
+        Args:
+            minutes: 时间窗口(分钟)，如过去一小时为60
+            top_k: 列出的进程数
+            
+        Returns:
+            时间窗口内的聚合统计（历史从助手启动时开始记录）
+        """
+        try:
+            sampler = MacOSTools.telemetry
+            if sampler is None or not sampler.is_running:
+                return "系统指标采样未运行，没有历史数据"
+            result = sampler.store.query(minutes * 60, top_k=max(1, int(top_k)))
+            if not result["buckets"]:
+                return "暂无历史数据，请稍后再试"
+            
+            covered = (result["end"] - result["start"]) / 60
+            output = f"过去{minutes:g}分钟的系统负载（已记录约{covered:.0f}分钟，精度{result['resolution']}秒）:\n"
+            labels = [
+                ("cpu_percent", "CPU使用率", "%", 1),
+                ("memory_percent", "内存使用率", "%", 1),
+                ("disk_percent", "磁盘使用率", "%", 1),
+                ("net_recv", "网络下行", "KB/s", 1024),
+                ("net_sent", "网络上行", "KB/s", 1024),
+                ("disk_read", "磁盘读取", "KB/s", 1024),
+                ("disk_write", "磁盘写入", "KB/s", 1024),
+                ("battery_percent", "电池电量", "%", 1),
+            ]
+            for key, label, unit, scale in labels:
+                stats = result["metrics"].get(key)
+                if stats:
+                    output += (f"{label}: 最大 {stats['max'] / scale:.1f}{unit}, 平均 {stats['mean'] / scale:.1f}{unit}, "
+                               f"P95 {stats['p95'] / scale:.1f}{unit}\n")
+            if result["top_processes"]:
+                output += "\n平均CPU占用最高的进程:\n"
+                for index, proc in enumerate(result["top_processes"], 1):
+                    output += f"{index}. {proc['name']}: {proc['cpu_percent']:.1f}%\n"
+            return output
+        except Exception as e:
+            return f"获取系统负载历史失败: {str(e)}"
+    
+    @staticmethod
+    @tool
+    def open_application(app_name: Union[str, List[str]]) -> str:
+        """打开一个或多个应用程序。支持别名、拼音、英文、中文混输，模糊匹配。
+        需要同时打开多个应用时，传入名称列表或用"和"、"、"、逗号连接的名称，一次调用全部打开。"""
+        try:
+            MacOSTools.wait_for_warmup("app_index")
+            match_index = MacOSTools.get_app_match_index()
+            if not match_index.apps:
                 return "无法获取应用程序列表"
-            # 别名表
-            aliases = {
-                'safari': ['safari', '浏览器', 'web', 'sāfārī', 'sfl', '苹果浏览器'],
-                'chrome': ['chrome', 'google chrome', '谷歌浏览器', 'gǔgē', '谷歌', 'chromium'],
-                'finder': ['finder', '访达', '文件管理器', 'fǎngdá'],
-                'terminal': ['terminal', '终端', '命令行', 'zhōngduān'],
-                'wechat': ['wechat', '微信', 'wēixìn'],
-                'qq': ['qq', '腾讯qq', 'q q'],
-                'vscode': ['visual studio code', 'vscode', 'vs code', '代码编辑器'],
-                'notes': ['notes', '备忘录', '笔记'],
-                'music': ['music', '音乐', 'itunes'],
-                'photos': ['photos', '照片', '相册'],
-                'mail': ['mail', '邮件', '邮箱'],
-                'messages': ['messages', '信息', '短信'],
-                'calendar': ['calendar', '日历'],
-                'preview': ['preview', '预览'],
-                'appstore': ['app store', 'appstore', '应用商店'],
-                'reminders': ['reminders', '提醒事项'],
-                'calculator': ['calculator', '计算器'],
-                'sublime': ['sublime text', 'sublime', '文本编辑器'],
-                'bilibili': ['bilibili', 'b站', '哔哩哔哩'],
-                'alipay': ['alipay', '支付宝'],
-                'taobao': ['taobao', '淘宝'],
-                'jd': ['jd', '京东'],
-                'netflix': ['netflix', '网飞'],
-                'youtube': ['youtube', '油管'],
-            }
-            # 归一化
-            def norm(s):
-                return unicodedata.normalize('NFKD', s).encode('ascii', 'ignore').decode('ascii').lower()
-            app_name_norm = norm(app_name)
-            # 先查别名
-            for key, alias_list in aliases.items():
-                if app_name_norm in [norm(a) for a in alias_list]:
-                    for app in all_apps:
-                        if norm(app['name']) == norm(key):
-                            subprocess.run(['open', app['path']])
-                            return f"已打开 {app['name']}"
-            # 模糊匹配
-            all_names = [app['name'] for app in all_apps]
-            matches = difflib.get_close_matches(app_name, all_names, n=1, cutoff=0.6)
-            if matches:
-                best = next(app for app in all_apps if app['name'] == matches[0])
-                subprocess.run(['open', best['path']])
-                return f"已打开 {best['name']}"
-                return f"未找到匹配的应用程序: {app_name}"
+            names = MacOSTools._split_app_names(app_name, match_index)
+            
+            # 一次性解析所有名称
+            found, missing, ambiguous = [], [], []
+            for name in names:
+                candidates = match_index.ambiguous_matches(name)
+                if candidates:
+                    ambiguous.append(f"{name}({'、'.join(app['name'] for app in candidates)})")
+                    continue
+                app = match_index.lookup(name)
+                if app is None:
+                    missing.append(name)
+                elif app not in found:
+                    found.append(app)
+            
+            messages = []
+            if found:
+                # 单次open调用启动全部应用
+                result = subprocess.run(['open'] + [app['path'] for app in found],
+                                        capture_output=True, text=True)
+                if result.returncode == 0:
+                    messages.append(f"已打开 {'、'.join(app['name'] for app in found)}")
+                else:
+                    messages.append(f"打开应用程序失败: {result.stderr.strip()}")
+            if missing:
+                messages.append(f"未找到匹配的应用程序: {'、'.join(missing)}")
+            if ambiguous:
+                messages.append(f"以下名称匹配到多个应用程序，请指明要打开哪一个: {'；'.join(ambiguous)}")
+            return "\n".join(messages)
         except Exception as e:
             return f"打开应用程序失败: {str(e)}"
     
+    @staticmethod
+    def _split_app_names(app_name: Union[str, List[str]], match_index: AppMatchIndex) -> List[str]:
+        """把单个字符串或列表形式的应用名称拆分为名称列表
+
+        整个字符串能精确命中某个应用时不拆分，避免误拆名称中本身带分隔符的应用。
+        """
+        if isinstance(app_name, (list, tuple)):
+            raw_names = [str(name) for name in app_name]
+        else:
+            raw_names = [app_name]
+        names = []
+        for raw in raw_names:
+            raw = raw.strip()
+            if not raw:
+                continue
+            if match_index.lookup_exact(raw):
+                names.append(raw)
+                continue
+            parts = [part.strip() for part in re.split(r"\s*(?:和|与|及|、|,|，|\band\b)\s*", raw) if part.strip()]
+            names.extend(parts or [raw])
+        return names
+    
     @staticmethod
     def _get_all_applications():
-        """获取所有已安装的应用程序"""
-        apps = []
-        
-        # 搜索系统应用程序目录
-        search_paths = [
-            '/Applications',
-            '/System/Applications',
-            '/System/Applications/Utilities',
-            os.path.expanduser('~/Applications')
-        ]
-        
-        for search_path in search_paths:
-            if os.path.exists(search_path):
-                try:
-                    result = subprocess.run(['find', search_path, '-name', '*.app', '-type', 'd'], 
-                                          capture_output=True, text=True, timeout=10)
-                    if result.stdout.strip():
-                        for app_path in result.stdout.strip().split('\n'):
-                            if app_path and os.path.exists(app_path):
-                                app_name = os.path.basename(app_path).replace('.app', '')
-                                apps.append({
-                                    'name': app_name,
-                                    'path': app_path,
-                                    'display_name': app_name
-                                })
-                except:
-                    continue
-        
-        return apps
+        """获取所有已安装的应用程序（从持久化索引读取）"""
+        return MacOSTools.get_app_index().get_applications()
     
     @staticmethod
     def _find_matching_apps(query, apps):
@@ -185,6 +3615,9 @@ CPU: {cpu_info.stdout.strip()}
         query_lower = query.lower().strip()
         matches = []
         
+        # 查询命中别名时得到对应的应用标识（只查询一次注册表）
+        query_keys = APP_ALIASES.resolve(query)
+        
         for app in apps:
             app_name_lower = app['name'].lower()
             display_name_lower = app['display_name'].lower()
@@ -213,64 +3646,8 @@ CPU: {cpu_info.stdout.strip()}
                             break
             
             # 特殊处理常见应用程序的别名
-            aliases = {
-                'safari': ['safari', '浏览器', 'web'],
-                'chrome': ['chrome', 'google chrome', '谷歌浏览器'],
-                'terminal': ['terminal', '终端', '命令行'],
-                'finder': ['finder', '访达', '文件管理器'],
-                'calculator': ['calculator', '计算器', 'calc'],
-                'mail': ['mail', '邮件', '邮箱'],
-                'messages': ['messages', '信息', '短信'],
-                'facetime': ['facetime', '视频通话'],
-                'photos': ['photos', '照片', '相册'],
-                'music': ['music', '音乐', 'itunes'],
-                'tv': ['tv', '电视', '视频'],
-                'podcasts': ['podcasts', '播客'],
-                'books': ['books', '图书', '阅读'],
-                'notes': ['notes', '备忘录', '笔记'],
-                'reminders': ['reminders', '提醒事项'],
-                'calendar': ['calendar', '日历'],
-                'contacts': ['contacts', '通讯录', '联系人'],
-                'maps': ['maps', '地图'],
-                'weather': ['weather', '天气'],
-                'stocks': ['stocks', '股票'],
-                'voice_memos': ['voice memos', '语音备忘录'],
-                'home': ['home', '家庭'],
-                'shortcuts': ['shortcuts', '快捷指令'],
-                'settings': ['settings', '系统偏好设置', '设置'],
-                'vscode': ['visual studio code', 'vscode', 'vs code', '代码编辑器'],
-                'premiere': ['adobe premiere pro', 'premiere', 'pr', '视频编辑'],
-                'photoshop': ['adobe photoshop', 'photoshop', 'ps', '图像编辑'],
-                'illustrator': ['adobe illustrator', 'illustrator', 'ai', '矢量图'],
-                'after_effects': ['adobe after effects', 'after effects', 'ae', '特效'],
-                'xd': ['adobe xd', 'xd', '设计'],
-                'figma': ['figma', '设计工具'],
-                'sketch': ['sketch', '设计'],
-                'xcode': ['xcode', '开发工具'],
-                'intellij': ['intellij idea', 'intellij', '开发工具'],
-                'pycharm': ['pycharm', 'python开发'],
-                'sublime': ['sublime text', 'sublime', '文本编辑器'],
-                'atom': ['atom', '文本编辑器'],
-                'spotify': ['spotify', '音乐播放器'],
-                'zoom': ['zoom', '视频会议'],
-                'teams': ['microsoft teams', 'teams', '团队协作'],
-                'slack': ['slack', '团队沟通'],
-                'discord': ['discord', '游戏聊天'],
-                'wechat': ['wechat', '微信'],
-                'qq': ['qq', '腾讯qq'],
-                'alipay': ['alipay', '支付宝'],
-                'taobao': ['taobao', '淘宝'],
-                'jd': ['jd', '京东'],
-                'netflix': ['netflix', '网飞'],
-                'youtube': ['youtube', '油管'],
-                'bilibili': ['bilibili', 'b站', '哔哩哔哩']
-            }
-            
-            # 检查别名匹配
-            for app_key, alias_list in aliases.items():
-                if query_lower in alias_list:
-                    if app_name_lower in alias_list or any(alias in app_name_lower for alias in alias_list):
-                        score = max(score, 90)
+            if query_keys and APP_ALIASES.key_for_app(app['name']) in query_keys:
+                score = max(score, 90)
             
             if score > 0:
                 matches.append((app, score))
@@ -281,33 +3658,247 @@ CPU: {cpu_info.stdout.strip()}
     
     @staticmethod
     @tool
-    def execute_terminal_command(command: str) -> str:
-        """分步执行&&分割的命令，逐步捕获异常"""
+    def execute_terminal_command(command: str, parallel: bool = False) -> str:
+        """分步执行&&分割的命令，逐步捕获异常。命令在对话的持久shell会话中执行(保留cd和export)，
+        输出会实时推送给界面，超时时返回已产生的部分输出。
+        parallel为True时按&&和;拆分步骤，读写对象互不重叠的文件操作步骤(如创建多个不同的文件夹)并发执行，
+        其他命令仍按顺序执行"""
         try:
-            dangerous_commands = [
-                "rm -rf", "dd if=", "> /dev/", ":(){ :|:& };:",
-                "chmod -R 777 /", "mv / /dev/null"
-            ]
-            for dc in dangerous_commands:
-                if dc in command:
-                    return f"为安全起见，系统拒绝执行包含 '{dc}' 的命令。请确保您的命令是安全的。"
-            # 分步执行
-            steps = [c.strip() for c in command.split('&&') if c.strip()]
+            refusal = MacOSTools._check_dangerous(command)
+            if refusal:
+                return refusal
+            # 复合命令(循环、条件等)不能拆分，走串行路径整体执行
+            if parallel and not StepDependencyGraph.is_compound(command):
+                return MacOSTools._execute_parallel(command)
+            # 分步执行，复合命令中的&&属于其内部结构，整体执行
+            if StepDependencyGraph.is_compound(command):
+                steps = [command.strip()]
+            else:
+                steps = [c.strip() for c in command.split('&&') if c.strip()]
             output = ""
+            pool = MacOSTools.get_shell_pool()
             for step in steps:
-                result = subprocess.run(step, shell=True, capture_output=True, text=True, timeout=10)
-                out = result.stdout if result.stdout else ""
-                err = result.stderr if result.stderr else ""
-                if err:
-                    output += f"命令: {step}\n错误: {err}\n"
-                    break
-                output += out
+                # 只读系统命令命中缓存时不再执行
+                cached = MacOSTools._cached_step(step)
+                if cached is not None:
+                    with cached:
+                        output += cached.summary()
+                    continue
+                # 在当前对话的持久会话中执行，cd和export在步骤之间保留
+                out, err, returncode, timed_out = pool.run(
+                    MacOSTools.shell_session_key, step, timeout=10, sink=MacOSTools.output_sink)
+                with out, err:
+                    if not timed_out and not err.total_bytes and returncode == 0:
+                        MacOSTools.command_cache.put_capture(step, out)
+                    # 过长的输出只保留开头和结尾，完整内容通过句柄读取
+                    output += out.summary()
+                    if timed_out:
+                        output += f"\n命令: {step}\n命令超时（执行时间超过10秒），以上为超时前已产生的输出\n"
+                        if err.total_bytes:
+                            output += f"错误: {err.summary()}\n"
+                        break
+                    if err.total_bytes or returncode not in (0, None):
+                        output += f"命令: {step}\n错误: {err.summary() if err.total_bytes else f'返回码 {returncode}'}\n"
+                        break
             return output if output else "命令执行成功"
-        except subprocess.TimeoutExpired:
-            return "命令超时（执行时间超过10秒）"
         except Exception as e:
             return f"执行命令时出错: {str(e)}"
     
+    @staticmethod
+    def _cached_step(step: str, label: str = "") -> Optional[OutputCapture]:
+        """查询只读命令缓存，命中时把缓存的输出推送给output_sink并返回"""
+        cached = MacOSTools.command_cache.get(step)
+        if cached is None:
+            return None
+        capture = OutputCapture()
+        capture.write(cached.encode('utf-8'))
+        sink = MacOSTools.output_sink
+        if sink:
+            for line in cached.splitlines():
+                try:
+                    sink(label + line, "stdout")
+                except Exception:
+                    pass
+        return capture
+    
+    @staticmethod
+    def _execute_parallel(command: str, max_workers: int = 8) -> str:
+        """按依赖图并发执行多步命令，任一步骤失败后不再启动新的步骤
+
+        屏障步骤(cd、export等)在对话的持久会话中执行；其余步骤在独立进程中执行，
+        继承会话当前的工作目录和环境变量。
+        """
+        pool = MacOSTools.get_shell_pool()
+        key = MacOSTools.shell_session_key
+        sink = MacOSTools.output_sink
+        # 相对路径按会话当前的工作目录解析
+        state = pool.get_state(key)
+        graph = StepDependencyGraph.parse(command, cwd=state[0])
+        count = len(graph.steps)
+        if not count:
+            return "命令执行成功"
+        
+        def run_step(index, state):
+            step = graph.steps[index]
+            start = time.perf_counter()
+            cached = MacOSTools._cached_step(step, label=f"[{index + 1}] ")
+            if cached is not None:
+                return cached, OutputCapture(), 0, False, time.perf_counter() - start
+            if graph.barriers[index]:
+                label_sink = (lambda line, stream: sink(f"[{index + 1}] {line}", stream)) if sink else None
+                out, err, returncode, timed_out = pool.run(key, step, timeout=10, sink=label_sink)
+            else:
+                cwd, env = state
+                out, err, returncode, timed_out = MacOSTools._run_streaming(
+                    step, timeout=10, cwd=cwd, env=env, label=f"[{index + 1}] ")
+            return out, err, returncode, timed_out, time.perf_counter() - start
+        
+        results = [None] * count
+        pending = set(range(count))
+        succeeded = set()
+        running = {}
+        failed = False
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(max_workers, count)) as executor:
+            while running or (pending and not failed):
+                if not failed:
+                    for index in sorted(pending):
+                        if graph.deps[index] <= succeeded:
+                            pending.discard(index)
+                            if not graph.barriers[index] and state is None:
+                                state = pool.get_state(key)
+                            running[executor.submit(run_step, index, state)] = index
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = running.pop(future)
+                    results[index] = future.result()
+                    out, err, returncode, timed_out, _ = results[index]
+                    if timed_out or err.total_bytes or returncode not in (0, None):
+                        failed = True
+                    else:
+                        succeeded.add(index)
+                        MacOSTools.command_cache.put_capture(graph.steps[index], out)
+                    if graph.barriers[index]:
+                        # 屏障步骤可能改变了工作目录或环境变量
+                        state = None
+        
+        output = f"并行执行 {count} 个步骤，总耗时 {time.perf_counter() - started:.2f}秒:\n"
+        for index, step in enumerate(graph.steps):
+            if results[index] is None:
+                output += f"[步骤{index + 1}] 未执行（前序步骤失败）: {step}\n"
+                continue
+            out, err, returncode, timed_out, seconds = results[index]
+            if timed_out:
+                status = "超时"
+            elif err.total_bytes or returncode not in (0, None):
+                status = "失败"
+            else:
+                status = "成功"
+            output += f"[步骤{index + 1}] {status} ({seconds:.2f}秒): {step}\n"
+            if out.total_bytes:
+                output += out.summary()
+            if err.total_bytes:
+                output += f"错误: {err.summary()}\n"
+            elif returncode not in (0, None):
+                output += f"错误: 返回码 {returncode}\n"
+            out.close()
+            err.close()
+        return output
+    
+    @staticmethod
+    @tool
+    def start_job(command: str) -> str:
+        """在后台启动长时间运行的终端命令(如编译、brew安装、大文件复制)，立即返回任务ID。
+        之后用job_status查看状态、job_output读取输出、cancel_job取消任务"""
+        try:
+            refusal = MacOSTools._check_dangerous(command)
+            if refusal:
+                return refusal
+            # 在当前对话shell会话的工作目录和环境变量下启动
+            cwd, env = None, None
+            if MacOSTools.shell_pool is not None:
+                cwd, env = MacOSTools.shell_pool.get_state(MacOSTools.shell_session_key)
+            job = MacOSTools.get_job_manager().start(command, cwd=cwd, env=env)
+            return f"后台任务已启动，任务ID: {job.job_id}\n命令: {command}\n请使用job_status或job_output查看进度"
+        except Exception as e:
+            return f"启动后台任务失败: {str(e)}"
+    
+    @staticmethod
+    @tool
+    def job_status(job_id: str = "") -> str:
+        """查看后台任务状态，不传job_id时列出所有任务"""
+        manager = MacOSTools.get_job_manager()
+        state_names = {"running": "运行中", "finished": "已完成", "failed": "失败", "cancelled": "已取消"}
+        if not job_id:
+            jobs = manager.list_jobs()
+            if not jobs:
+                return "当前没有后台任务"
+            result = "后台任务:\n"
+            for job in jobs:
+                info = job.status()
+                result += f"• {info['job_id']} [{state_names[info['state']]}] {info['command']} ({info['elapsed']:.0f}秒)\n"
+            return result
+        job = manager.get(job_id)
+        if job is None:
+            return f"未找到后台任务: {job_id}"
+        info = job.status()
+        result = f"任务 {info['job_id']}: {state_names[info['state']]}\n"
+        result += f"命令: {info['command']}\n"
+        result += f"运行时间: {info['elapsed']:.1f}秒\n"
+        if info['returncode'] is not None:
+            result += f"返回码: {info['returncode']}\n"
+        result += f"输出行数: {info['total_lines']} (下一次读取可从游标 {info['total_lines']} 开始)\n"
+        return result
+    
+    @staticmethod
+    @tool
+    def job_output(job_id: str, cursor: int = 0) -> str:
+        """读取后台任务从游标位置开始的增量输出，返回结果中包含下一次读取使用的游标"""
+        job = MacOSTools.get_job_manager().get(job_id)
+        if job is None:
+            return f"未找到后台任务: {job_id}"
+        lines, next_cursor, skipped = job.read(cursor)
+        result = ""
+        if skipped:
+            result += f"(缓冲区已满，有 {skipped} 行较早的输出已丢弃)\n"
+        result += "\n".join(lines) + "\n" if lines else "(暂无新输出)\n"
+        state = job.status()["state"]
+        result += f"[下一次游标: {next_cursor}，任务状态: {state}]"
+        return result
+    
+    @staticmethod
+    @tool
+    def cancel_job(job_id: str, force: bool = False) -> str:
+        """取消后台任务，force为True时立即强制终止"""
+        manager = MacOSTools.get_job_manager()
+        job = manager.get(job_id)
+        if job is None:
+            return f"未找到后台任务: {job_id}"
+        if job.state != "running":
+            return f"任务 {job_id} 已结束，无需取消"
+        if manager.cancel(job_id, force=force):
+            return f"已向任务 {job_id} 发送{'强制终止' if force else '终止'}信号"
+        return f"取消任务 {job_id} 失败"
+    
+    @staticmethod
+    @tool
+    def read_full_output(handle: str, start_line: int = 0, max_lines: int = 200) -> str:
+        """分页读取被截断的命令输出的完整内容，handle为截断提示中给出的句柄(如out3)"""
+        capture = OutputCapture.get(handle)
+        if capture is None:
+            return f"未找到输出句柄: {handle}（可能已过期）"
+        max_lines = max(1, min(max_lines, 500))
+        lines = capture.read_lines(start_line, max_lines)
+        if not lines:
+            return f"句柄 {handle} 在第 {start_line} 行之后没有更多内容（共 {capture.line_count} 行）"
+        result = "\n".join(lines)
+        end = start_line + len(lines)
+        if end < capture.line_count:
+            result += f"\n[第 {start_line}-{end} 行，共 {capture.line_count} 行；继续读取请使用 start_line={end}]"
+        return result
+    
     @staticmethod
     @tool
     def get_network_info() -> str:
@@ -339,7 +3930,8 @@ CPU: {cpu_info.stdout.strip()}
     def get_battery_info() -> str:
         """获取电池信息"""
         try:
-            battery = psutil.sensors_battery()
+            sampler = MacOSTools.get_telemetry()
+            battery = sampler.battery if sampler is not None else psutil.sensors_battery()
             if battery:
                 plugged = "已连接电源" if battery.power_plugged else "使用电池"
                 percent = battery.percent
@@ -364,41 +3956,193 @@ CPU: {cpu_info.stdout.strip()}
         """搜索文件
         
         Args:
-            query: 搜索查询
+            query: 文件名中包含的文字，或通配符模式(如*.pdf)，不区分大小写
             directory: 搜索目录，默认为/Users
             
         Returns:
             搜索结果
         """
         try:
-            # 尝试使用R1增强器进行搜索
-            if MacOSTools.r1_enhancer and MacOSTools.r1_enhancer.is_available:
-                enhanced_results = MacOSTools.r1_enhancer.enhance_file_search(query, directory)
-                if enhanced_results:
-                    result_text = "查找到以下文件:\n\n"
-                    for item in enhanced_results:
-                        result_text += f"{item['path']} (相关度: {item['relevance']})\n"
-                    return result_text
+            # 本地搜索先行；本地搜索运行超过宽限期仍没有结果，或结束时没有结果，才启动R1搜索
+            # (R1的请求无法中途取消，每次都会消耗推理模型的token)。两边的结果合并后统一排序
+            r1_cancel = threading.Event()
+            local_cancel = threading.Event()
+            candidates = []
+            r1_lock = threading.Lock()
+            r1_state = {"future": None, "local_done": False}
             
-            # 如果R1增强器不可用或未找到结果，使用基本搜索方法
-            result = subprocess.run(["find", directory, "-name", f"*{query}*", "-type", "f"], 
-                                   capture_output=True, text=True, timeout=10)
+            def start_r1():
+                with r1_lock:
+                    if r1_state["future"] is None and not candidates and not MacOSTools.is_cancelled():
+                        r1_state["future"] = MacOSTools._start_r1_search(query, directory, r1_cancel)
+                        if r1_state["future"] is not None:
+                            # R1先返回结果时本地搜索提前结束，已找到的结果仍会合并
+                            r1_state["future"].add_done_callback(
+                                lambda f: local_cancel.set() if not f.cancelled() and f.result() else None)
+                    return r1_state["future"]
             
-            if not result.stdout.strip():
-                return f"在{directory}中未找到包含'{query}'的文件"
+            grace_timer = threading.Timer(MacOSTools.R1_SEARCH_GRACE, start_r1)
+            grace_timer.daemon = True
+            grace_timer.start()
             
-            files = result.stdout.strip().split('\n')
-            return f"找到以下文件:\n\n" + '\n'.join(files[:10]) + (f"\n\n共找到{len(files)}个文件，仅显示前10个" if len(files) > 10 else "")
+            # 边搜索边把结果推送给界面，返回给代理的只有排序后的前10个结果和统计
+            sink = MacOSTools.output_sink
+            stats = {}
+            local_start = time.perf_counter()
+            try:
+                for path in MacOSTools.iter_search_files(query, directory, stats=stats, cancel_event=local_cancel):
+                    candidates.append(path)
+                    if sink:
+                        try:
+                            sink(f"找到: {path}", "stdout")
+                        except Exception:
+                            pass
+            finally:
+                grace_timer.cancel()
+            local_latency = time.perf_counter() - local_start
+            local_found = bool(candidates)
+            
+            r1_future = r1_state["future"] if local_found else start_r1()
+            r1_results = []
+            if r1_future is not None:
+                if not r1_future.done() and local_found:
+                    # 本地已有结果，不再执行R1生成的命令
+                    r1_cancel.set()
+                    r1_future.cancel()
+                else:
+                    # 本地没有结果时等待R1，期间仍响应用户取消
+                    deadline = time.monotonic() + MacOSTools.R1_SEARCH_WAIT
+                    while not r1_future.done() and time.monotonic() < deadline and not MacOSTools.is_cancelled():
+                        time.sleep(0.1)
+                    if r1_future.done() and not r1_future.cancelled():
+                        r1_results = r1_future.result() or []
+                    else:
+                        r1_cancel.set()
+                        r1_future.cancel()
+            
+            # 合并R1结果中本地没有找到的文件
+            known = set(candidates)
+            r1_added = 0
+            for item in r1_results:
+                path = item.get('path')
+                if path and path not in known:
+                    known.add(path)
+                    candidates.append(path)
+                    r1_added += 1
+                    if sink:
+                        try:
+                            sink(f"找到: {path}", "stdout")
+                        except Exception:
+                            pass
+            
+            MacOSTools._record_search("local", local_latency, local_found, won=local_found)
+            if r1_added and not local_found:
+                MacOSTools._record_search("r1", won=True)
+            
+            source = "（来自文件索引）" if stats.get("source") == "index" else ""
+            if r1_added:
+                source += f"（含R1搜索找到的{r1_added}个文件）"
+            user_cancelled = MacOSTools.is_cancelled()
+            if not candidates:
+                if user_cancelled:
+                    return "文件搜索已被用户取消"
+                if stats.get("timed_out"):
+                    return f"在{directory}中搜索'{query}'超时（已扫描{stats.get('dirs_scanned', 0)}个目录），未找到匹配的文件"
+                return f"在{directory}中未找到包含'{query}'的文件{source}"
+            
+            # 按文件名匹配程度、修改时间、路径深度和文件类型排序
+            ranked = FileRelevanceRanker(query, directory).rank(candidates, k=10)
+            result = f"找到以下文件{source}（按相关度排序）:\n\n"
+            result += '\n'.join(f"{item['path']} [{item['score']:.2f} {item['reason']}]" for item in ranked)
+            if len(candidates) > len(ranked):
+                result += f"\n\n共找到{len(candidates)}个文件，仅显示最相关的{len(ranked)}个（完整列表已实时显示给用户）"
+            if user_cancelled:
+                result += "\n\n搜索已被用户取消，结果不完整"
+            elif stats.get("timed_out"):
+                result += f"\n\n搜索已达到时间上限（已扫描{stats.get('dirs_scanned', 0)}个目录），结果可能不完整"
+            elif not stats.get("complete", True):
+                result += "\n\n匹配结果较多，可以提供更具体的名称或目录缩小范围"
+            return result
             
         except Exception as e:
             return f"搜索文件时出错: {str(e)}"
     
+    @staticmethod
+    @tool
+    def search_file_contents(query: str, directory: str = "~/Documents", file_pattern: str = "",
+                             regex: bool = False) -> str:
+        """按内容搜索文本文件，返回包含该文字的文件及匹配行(附上下文)
+        
+        Args:
+            query: 要查找的文字，regex为True时为正则表达式
+            directory: 搜索目录，默认为~/Documents
+            file_pattern: 只搜索文件名匹配的文件，如*.txt、*.md，为空时搜索所有文本文件
+            regex: query是否为正则表达式
+            
+        Returns:
+            搜索结果（PDF、Office文档等非纯文本文件不在搜索范围内）
+        """
+        try:
+            sink = MacOSTools.output_sink
+            directory = os.path.expanduser(directory)
+            if not os.path.isdir(directory):
+                return f"目录不存在: {directory}"
+            stats = {}
+            shown = []
+            total = 0
+            for path, match in MacOSTools.content_search.iter_search(
+                    query, directory, file_pattern=file_pattern or None, regex=regex,
+                    stats=stats, should_stop=MacOSTools.is_cancelled):
+                total += 1
+                if sink:
+                    try:
+                        sink(f"匹配: {path}:{match['line']}: {match['text'].strip()}", "stdout")
+                    except Exception:
+                        pass
+                # 返回给代理的结果控制在20条以内
+                if len(shown) < 20:
+                    shown.append((path, match))
+            
+            reason = stats.get("stop_reason")
+            summary = f"（扫描了{stats.get('files', 0)}个文件，{stats.get('scanned_bytes', 0) // 1024}KB，用时{stats.get('elapsed', 0):.1f}秒）"
+            if not shown:
+                if reason == "cancelled":
+                    return "内容搜索已被用户取消"
+                return f"在{directory}中未找到包含'{query}'的文本文件{summary}"
+            
+            result = f"找到{stats.get('matched_files', 0)}个文件包含'{query}'{summary}:\n"
+            last_path = None
+            for path, match in shown:
+                if path != last_path:
+                    result += f"\n{path}\n"
+                    last_path = path
+                for line in match["before"]:
+                    result += f"    {line}\n"
+                result += f"  {match['line']}: {match['text']}\n"
+                for line in match["after"]:
+                    result += f"    {line}\n"
+            if total > len(shown):
+                result += f"\n共{total}处匹配，仅显示前{len(shown)}处（完整结果已实时显示给用户）"
+            notes = {
+                "max_results": "\n匹配较多，已提前停止，可以缩小目录或指定文件类型",
+                "byte_budget": "\n已达到扫描数据量上限，结果可能不完整",
+                "time_budget": "\n已达到搜索时间上限，结果可能不完整",
+                "cancelled": "\n搜索已被用户取消，结果不完整",
+            }
+            result += notes.get(reason, "")
+            return result
+        except re.error as e:
+            return f"正则表达式无效: {str(e)}"
+        except Exception as e:
+            return f"搜索文件内容时出错: {str(e)}"
+    
     @staticmethod
     @tool
     def get_installed_applications() -> str:
         """获取已安装的应用程序列表"""
         try:
             # 使用新的动态获取方法
+            MacOSTools.wait_for_warmup("app_index")
             all_apps = MacOSTools._get_all_applications()
             
             if not all_apps:
@@ -412,7 +4156,10 @@ CPU: {cpu_info.stdout.strip()}
             
             result = f"已安装的应用程序 (共{len(all_apps)}个，显示前30个):\n"
             for i, app in enumerate(apps_to_show, 1):
-                result += f"{i}. {app['name']}\n"
+                if app.get('display_name') and app['display_name'] != app['name']:
+                    result += f"{i}. {app['display_name']} ({app['name']})\n"
+                else:
+                    result += f"{i}. {app['name']}\n"
             
             if len(all_apps) > 30:
                 result += f"\n... 还有 {len(all_apps) - 30} 个应用程序"
@@ -469,6 +4216,107 @@ CPU: {cpu_info.stdout.strip()}
         now = datetime.now()
         return f"当前时间: {now.strftime('%Y年%m月%d日 %H:%M:%S')}"
 
+class ToolWarmup:
+    """MacOSTools缓存的后台预热
+
+    助手启动时在低优先级后台线程中依次构建应用索引(并启动目录监视)、
+    查询系统静态信息、初始化psutil的CPU计数器。工具首次调用时只有在
+    对应步骤尚未完成的情况下才会等待。
+    """
+
+    STEPS = ["app_index", "system_facts", "psutil"]
+
+    def __init__(self):
+        self.steps = {name: {"status": "pending", "seconds": None, "error": ""} for name in self.STEPS}
+        self._events = {name: threading.Event() for name in self.STEPS}
+        self._thread = None
+
+    def start(self):
+        """启动预热线程"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="ToolWarmup", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _lower_thread_priority():
+        """尽量降低当前线程的调度优先级，避免与界面和请求处理争抢CPU"""
+        try:
+            if sys.platform == "darwin":
+                import ctypes
+                # QOS_CLASS_UTILITY
+                ctypes.CDLL(None).pthread_set_qos_class_self_np(0x11, 0)
+            elif sys.platform.startswith("linux"):
+                # Linux上setpriority作用于单个线程
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except Exception:
+            pass
+
+    def _run(self):
+        self._lower_thread_priority()
+        actions = {
+            "app_index": self._warm_app_index,
+            "system_facts": MacOSTools.get_static_system_facts,
+            "psutil": self._warm_psutil,
+        }
+        for name in self.STEPS:
+            step = self.steps[name]
+            step["status"] = "running"
+            start = time.perf_counter()
+            try:
+                actions[name]()
+                step["status"] = "ready"
+            except Exception as e:
+                step["status"] = "failed"
+                step["error"] = str(e)
+                print(f"预热 {name} 失败: {str(e)}")
+            finally:
+                step["seconds"] = round(time.perf_counter() - start, 3)
+                self._events[name].set()
+
+    @staticmethod
+    def _warm_app_index():
+        MacOSTools.start_app_watcher()
+        MacOSTools.get_app_match_index()
+
+    @staticmethod
+    def _warm_psutil():
+        # cpu_percent(None)的首次调用只建立基准，之后的调用才返回有效值
+        psutil.cpu_percent(interval=None)
+        for proc in psutil.process_iter():
+            try:
+                proc.cpu_percent(interval=None)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+
+    def wait(self, step: str, timeout: float = 30.0) -> bool:
+        """等待指定步骤完成
+
+        Returns:
+            步骤是否已完成(成功或失败)
+        """
+        event = self._events.get(step)
+        return event.wait(timeout) if event is not None else True
+
+    @property
+    def state(self) -> str:
+        """整体状态: idle / running / ready / degraded"""
+        if self._thread is None:
+            return "idle"
+        statuses = [step["status"] for step in self.steps.values()]
+        if any(status in ("pending", "running") for status in statuses):
+            return "running"
+        return "degraded" if "failed" in statuses else "ready"
+
+    def status(self) -> Dict[str, Any]:
+        """返回预热状态，供界面展示"""
+        return {
+            "state": self.state,
+            "completed": sum(1 for step in self.steps.values() if step["status"] in ("ready", "failed")),
+            "total": len(self.steps),
+            "steps": {name: dict(step) for name, step in self.steps.items()}
+        }
+
 class TaskComplexity(enum.Enum):
     """任务复杂度枚举"""
     SIMPLE = 1   # 简单任务：直接查询、单一操作
@@ -494,11 +4342,13 @@ class EnhancedStreamingHandler(BaseCallbackHandler):
     - end_callback: 结束生成时的回调
     - function_call_callback: 函数调用时的回调
     - function_result_callback: 函数返回结果时的回调
+    - tool_output_callback: 工具执行过程中实时输出的回调
     """
     
     def __init__(self, streaming_callback=None, thinking_callback=None, 
                  start_callback=None, end_callback=None,
-                 function_call_callback=None, function_result_callback=None):
+                 function_call_callback=None, function_result_callback=None,
+                 tool_output_callback=None):
         """初始化处理器
         
         Args:
@@ -508,6 +4358,7 @@ class EnhancedStreamingHandler(BaseCallbackHandler):
             end_callback: 结束回调函数
             function_call_callback: 函数调用回调
             function_result_callback: 函数结果回调
+            tool_output_callback: 工具实时输出回调，参数为(行文本, "stdout"/"stderr")
         """
         self.streaming_callback = streaming_callback
         self.thinking_callback = thinking_callback
@@ -515,6 +4366,7 @@ class EnhancedStreamingHandler(BaseCallbackHandler):
         self.end_callback = end_callback
         self.function_call_callback = function_call_callback
         self.function_result_callback = function_result_callback
+        self.tool_output_callback = tool_output_callback
         
         # 内部状态
         self.response_started = False
@@ -551,6 +4403,16 @@ class EnhancedStreamingHandler(BaseCallbackHandler):
         if self.function_result_callback:
             self.function_result_callback(result)
     
+    def on_tool_output(self, line, stream="stdout"):
+        """工具执行过程中产生一行输出时的回调
+        
+        Args:
+            line: 输出行
+            stream: 输出来源(stdout/stderr)
+        """
+        if self.tool_output_callback:
+            self.tool_output_callback(line, stream)
+    
     def on_llm_start(self, *args, **kwargs):
         """LLM开始生成时的回调"""
         if self.start_callback:
@@ -599,6 +4461,11 @@ class EnhancedStreamingHandler(BaseCallbackHandler):
                 self.streaming_callback(self.current_token_buffer)
             self.current_token_buffer = ""
     
+    def emit_text(self, text: str):
+        """直接输出一段完整文本（不经过LLM，例如快速通道的模板回答）"""
+        if self.streaming_callback and text:
+            self.streaming_callback(text)
+    
     def on_llm_end(self, *args, **kwargs):
         """LLM结束生成时的回调"""
         # 发送任何剩余的缓冲区内容
@@ -619,6 +4486,218 @@ class EnhancedStreamingHandler(BaseCallbackHandler):
         self.response_started = False
         self.thinking_buffer = ""
 
+class SearchCommandCache:
+    """按查询形态缓存R1生成的文件搜索命令
+
+    查询被归一化为签名(文件类型、时间和大小限定词，以及关键词的形态)，
+    例如"搜索pdf文件"和"搜索所有PDF"得到相同的签名。验证过(执行成功且有结果)的
+    命令中的关键词和搜索目录被替换为占位符后作为模板保存，相同签名的查询直接
+    填充模板，不再调用推理模型。关键词只在引号内或通配符包围的参数中被替换，
+    目录只按完整的路径前缀替换；关键词在命令其他位置(选项、命令名等)出现时不保存。
+    采用LRU淘汰并持久化到磁盘。
+    """
+
+    KEYWORD = "__KEYWORD__"
+    DIRECTORY = "__DIRECTORY__"
+    # 文件类型词 -> 类型名
+    TYPE_WORDS = {
+        "图片": "image", "照片": "image", "截图": "image", "视频": "video", "影片": "video",
+        "音乐": "audio", "音频": "audio", "歌曲": "audio", "文档": "document", "表格": "spreadsheet",
+        "幻灯片": "presentation", "演示文稿": "presentation", "压缩包": "archive", "安装包": "dmg",
+    }
+    EXTENSIONS = {
+        "pdf", "doc", "docx", "xls", "xlsx", "ppt", "pptx", "txt", "md", "rtf", "csv", "json",
+        "jpg", "jpeg", "png", "gif", "heic", "svg", "mp3", "m4a", "wav", "mp4", "mov", "mkv",
+        "zip", "rar", "7z", "dmg", "pkg", "pages", "numbers", "key", "py", "js", "html", "log",
+    }
+    TIME_WORDS = {"今天": "today", "昨天": "yesterday", "本周": "week", "这周": "week",
+                  "最近": "recent", "本月": "month", "这个月": "month", "今年": "year"}
+    SIZE_WORDS = {"大文件": "large", "较大": "large", "最大": "large", "小文件": "small"}
+    # 参数化所需的最短关键词长度，过短的关键词容易与命令的其他部分重合
+    MIN_KEYWORD_LENGTH = 3
+    FILLER = r"搜索|查找|寻找|查询|找到|找一下|找|帮我|请|所有的|所有|全部的|全部|文件夹|文件|一下|里面的|里的|中的|的|个|\b(?:search|find|all|files?|for|the|my)\b"
+
+    def __init__(self, path: Optional[str] = None, capacity: int = 128):
+        """初始化缓存
+
+        Args:
+            path: 持久化文件路径，默认保存在APP_DATA_DIR中
+            capacity: 最多保存的模板数
+        """
+        self.path = path or os.path.join(APP_DATA_DIR, "search_command_cache.json")
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for signature, template in json.load(f):
+                    self._entries[signature] = template
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"加载搜索命令缓存失败: {str(e)}")
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(list(self._entries.items()), f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"保存搜索命令缓存失败: {str(e)}")
+
+    @classmethod
+    def signature(cls, query: str) -> Tuple[str, str]:
+        """计算查询签名，返回(签名, 关键词)"""
+        text = query.strip().lower()
+        types, qualifiers = set(), set()
+        for word, name in cls.TYPE_WORDS.items():
+            if word in text:
+                types.add(name)
+                text = text.replace(word, " ")
+        for word, name in cls.TIME_WORDS.items():
+            if word in text:
+                qualifiers.add(f"time:{name}")
+                text = text.replace(word, " ")
+        for word, name in cls.SIZE_WORDS.items():
+            if word in text:
+                qualifiers.add(f"size:{name}")
+                text = text.replace(word, " ")
+
+        def take_extension(match):
+            types.add(match.group(1))
+            return " "
+
+        text = re.sub(r"(?<![a-z0-9])(?:\*?\.)?(" + "|".join(sorted(cls.EXTENSIONS, key=len, reverse=True)) + r")(?![a-z0-9])",
+                      take_extension, text)
+        text = re.sub(cls.FILLER, " ", text)
+        keyword = " ".join(text.split()).strip(" ,，。.*")
+        parts = ["types=" + ",".join(sorted(types)), "q=" + ",".join(sorted(qualifiers)),
+                 "kw=" + cls._keyword_shape(keyword)]
+        return "|".join(parts), keyword
+
+    @staticmethod
+    def _keyword_shape(keyword: str) -> str:
+        """关键词的形态：文字类别(ascii/cjk/mixed)与词数，不同形态的关键词不共用模板"""
+        if not keyword:
+            return "0"
+        has_cjk = bool(re.search(r"[\u4e00-\u9fff]", keyword))
+        has_ascii = bool(re.search(r"[A-Za-z0-9]", keyword))
+        script = "mixed" if has_cjk and has_ascii else ("cjk" if has_cjk else "ascii")
+        return f"{script}{len(keyword.split())}"
+
+    @staticmethod
+    def _quoted_spans(command: str) -> List[Tuple[int, int]]:
+        """命令中引号内内容的位置区间"""
+        return [(m.start() + 1, m.end() - 1) for m in re.finditer(r"'[^']*'|\"(?:\\.|[^\"\\])*\"", command)]
+
+    @classmethod
+    def _keyword_slots(cls, command: str, keyword: str) -> Optional[List[Tuple[int, int]]]:
+        """找出关键词可以被参数化的位置
+
+        关键词的每次出现都必须两侧不紧邻字母或数字，并且位于引号内，或位于含通配符的
+        参数中紧邻通配符；只要有一次出现不满足(如出现在选项或命令名中)就返回None。
+        """
+        spans = cls._quoted_spans(command)
+        slots = []
+        for match in re.finditer(re.escape(keyword), command, re.IGNORECASE):
+            start, end = match.span()
+            before = command[start - 1] if start > 0 else ""
+            after = command[end] if end < len(command) else ""
+            if re.match(r"[A-Za-z0-9]", before) or re.match(r"[A-Za-z0-9]", after):
+                return None
+            quoted = any(low <= start and end <= high for low, high in spans)
+            globbed = before in ("*", "?") or after in ("*", "?")
+            if not quoted and not globbed:
+                return None
+            slots.append((start, end))
+        return slots
+
+    @staticmethod
+    def _replace_directory(command: str, directory: str, placeholder: str) -> str:
+        """只替换作为完整参数出现的目录(参数开头，后接参数结尾、"/"或"/*")
+
+        目录的绝对路径写法和以~开头的写法都会被替换。
+        """
+        directory = os.path.expanduser(directory).rstrip("/") or "/"
+        if directory == "/":
+            pattern = r"(?:(?<=^)|(?<=[\s'\"=]))/(?=$|[\s'\"])"
+        else:
+            forms = [re.escape(directory)]
+            home = os.path.expanduser("~").rstrip("/")
+            if directory == home or directory.startswith(home + "/"):
+                forms.append(re.escape("~" + directory[len(home):]))
+            # 目录之后只能是参数结尾或"/"、"/*"，不把目录的子路径(如/Users/ken)参数化为目录
+            pattern = r"(?:(?<=^)|(?<=[\s'\"=]))(?:" + "|".join(forms) + r")(?=/?\*?(?:$|[\s'\"]))"
+        return re.sub(pattern, lambda _: placeholder, command)
+
+    @staticmethod
+    def _safe(value: str) -> bool:
+        """只有不含shell特殊字符的关键词和目录才能代入模板"""
+        return bool(re.fullmatch(r"[\w\u4e00-\u9fff./~+-]+", value))
+
+    def lookup(self, query: str, directory: str) -> Optional[str]:
+        """按查询形态查找命令模板，命中时返回填充后的命令"""
+        signature, keyword = self.signature(query)
+        if (keyword and not self._safe(keyword)) or not self._safe(directory):
+            return None
+        with self._lock:
+            template = self._entries.get(signature)
+            if template is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(signature)
+            self.hits += 1
+        return template.replace(self.KEYWORD, keyword).replace(self.DIRECTORY, directory)
+
+    def store(self, query: str, directory: str, command: str) -> bool:
+        """把验证过的命令参数化后保存，无法参数化时不保存"""
+        signature, keyword = self.signature(query)
+        if (keyword and not self._safe(keyword)) or not self._safe(directory):
+            return False
+        if self.KEYWORD in command or self.DIRECTORY in command:
+            return False
+        template = command
+        if keyword:
+            if len(keyword) < self.MIN_KEYWORD_LENGTH:
+                return False
+            # 关键词必须出现在命令中，且每次出现都位于可参数化的位置
+            slots = self._keyword_slots(template, keyword)
+            if not slots:
+                return False
+            for start, end in reversed(slots):
+                template = template[:start] + self.KEYWORD + template[end:]
+        template = self._replace_directory(template, directory, self.DIRECTORY)
+        # 签名不包含目录，命令中没有出现搜索目录时模板会固定搜索某个目录，不能保存
+        if self.DIRECTORY not in template:
+            return False
+        with self._lock:
+            self._entries[signature] = template
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self._save()
+        return True
+
+    def invalidate(self, query: str):
+        """删除查询形态对应的模板(如模板执行失败)"""
+        signature, _ = self.signature(query)
+        with self._lock:
+            if self._entries.pop(signature, None) is not None:
+                self._save()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "hit_rate": self.hits / total if total else 0}
+
 class DeepSeekR1Enhancer:
     """DeepSeek R1模型增强器
     
@@ -648,6 +4727,9 @@ class DeepSeekR1Enhancer:
         except Exception as e:
             print(f"初始化DeepSeek Reasoner模型失败: {str(e)}")
             self.is_available = False
+        
+        # 按查询形态缓存的搜索命令模板
+        self.search_command_cache = SearchCommandCache()
     
     def is_complex_technical_query(self, query: str) -> bool:
         """判断是否为复杂技术查询
@@ -890,12 +4972,14 @@ class DeepSeekR1Enhancer:
             print(f"分析错误失败: {str(e)}")
             return {"analysis": "", "fix": ""}
     
-    def enhance_file_search(self, query: str, directory: str) -> List[Dict[str, str]]:
+    def enhance_file_search(self, query: str, directory: str,
+                            cancel_event: Optional[threading.Event] = None) -> List[Dict[str, str]]:
         """增强文件搜索功能
         
         Args:
             query: 搜索查询
             directory: 搜索目录
+            cancel_event: 被置位时(如本地搜索已先返回结果)不再执行生成的命令
             
         Returns:
             增强的搜索结果
@@ -904,6 +4988,11 @@ class DeepSeekR1Enhancer:
             return []
             
         try:
+            # 相同形态的查询直接复用验证过的命令模板，跳过推理模型
+            search_command = self.search_command_cache.lookup(query, directory)
+            if search_command is not None:
+                return self._run_search_command(search_command, query, directory, True, cancel_event)
+            
             # 使用R1模型生成更智能的搜索命令
             search_prompt = f"""
 为在macOS上查找以下文件，生成一个高效、准确的find或mdfind命令:
@@ -933,29 +5022,131 @@ class DeepSeekR1Enhancer:
                         search_command = part.strip()
                         break
             
-            # 执行搜索命令并解析结果
-            import subprocess
-            try:
-                result = subprocess.run(search_command, shell=True, capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    files = result.stdout.strip().split('\n')
-                    enhanced_results = []
-                    
-                    for file in files[:10]:  # 限制为前10个结果
-                        if file.strip():
-                            enhanced_results.append({
-                                "path": file.strip(),
-                                "relevance": "高"  # 可以进一步改进相关性评分
-                            })
-                    
-                    return enhanced_results
-            except:
-                pass
+            return self._run_search_command(search_command, query, directory, False, cancel_event)
                 
         except Exception as e:
             print(f"增强文件搜索失败: {str(e)}")
             
         return []
+    
+    def _run_search_command(self, search_command: str, query: str, directory: str, from_cache: bool,
+                            cancel_event: Optional[threading.Event] = None) -> List[Dict[str, str]]:
+        """执行搜索命令并解析结果，验证通过的新命令存入模板缓存"""
+        if cancel_event is not None and cancel_event.is_set():
+            return []
+        if MacOSTools._check_dangerous(search_command):
+            return []
+        try:
+            out, err, returncode, _ = MacOSTools._run_streaming(search_command, timeout=10, stream=False)
+        except Exception:
+            return []
+        with out, err:
+            if returncode != 0:
+                if from_cache:
+                    self.search_command_cache.invalidate(query)
+                return []
+            # 取前200个候选在本地按相关度排序，只保留前10个；自然语言查询只用其中的关键词匹配文件名
+            candidates = [line.strip() for line in out.read_lines(0, 200) if line.strip()]
+        _, keyword = SearchCommandCache.signature(query)
+        enhanced_results = [
+            {"path": item["path"], "relevance": f"{item['score']:.2f}，{item['reason']}"}
+            for item in FileRelevanceRanker(keyword, directory).rank(candidates, k=10)
+        ]
+        if enhanced_results and not from_cache:
+            self.search_command_cache.store(query, directory, search_command)
+        return enhanced_results
+
+class FastPathRouter:
+    """本地快速通道意图路由
+
+    对"打开Safari"、"现在几点"、"设置音量为50%"这类简单且无歧义的指令，
+    直接调用对应工具并用模板生成回答，跳过复杂度评估和Agent的LLM往返。
+    只有置信度达到阈值时才走快速通道，其余请求仍交给完整的Agent流程。
+    """
+
+    # 允许的礼貌前缀和语气后缀
+    PREFIX = r"^(?:请|麻烦|帮我|请帮我|给我|帮忙)?\s*"
+    SUFFIX = r"\s*(?:吧|一下|呢|了)?\s*[。.!！?？]*$"
+
+    def __init__(self, threshold: float = 0.9):
+        """初始化路由规则
+
+        Args:
+            threshold: 走快速通道所需的最低置信度
+        """
+        self.threshold = threshold
+        # (意图名称, 正则, 工具, 参数提取函数, 回答模板)
+        self.rules = [
+            ("open_application",
+             r"(?:打开|启动|打開|開啟)\s*(?P<app>[^，,。；;、和与及并再然后\s][^。；;并再]*?)\s*(?:应用程序|应用|應用|程序|app)?",
+             MacOSTools.open_application,
+             lambda m: {"app_name": m.group("app").strip()},
+             "好的，{result}。"),
+            ("get_current_time",
+             r"(?:现在|當前|当前)?(?:几点(?:钟)?|时间|時間)(?:是多少|是几点)?|(?:查看|显示|获取)(?:一下)?(?:当前|现在的?)?时间",
+             MacOSTools.get_current_time,
+             lambda m: {},
+             "{result}"),
+            ("set_system_volume",
+             r"(?:把)?(?:系统)?(?:设置|调整|调节|调|設置)?(?:系统)?音量(?:设置|调整|调节|调|設置)?(?:为|到|成)?\s*(?P<volume>\d{1,3})\s*%?",
+             MacOSTools.set_system_volume,
+             lambda m: {"volume": int(m.group("volume"))},
+             "好的，{result}。"),
+            ("get_battery_info",
+             r"(?:查看|显示|获取)?(?:一下)?(?:电池(?:状态|信息|电量)?|电量(?:还有多少)?)",
+             MacOSTools.get_battery_info,
+             lambda m: {},
+             "{result}"),
+            ("get_system_info",
+             r"(?:查看|显示|获取)?(?:一下)?系统信息",
+             MacOSTools.get_system_info,
+             lambda m: {},
+             "{result}"),
+        ]
+        self._compiled = [
+            (name, re.compile(self.PREFIX + pattern + self.SUFFIX, re.I), tool, param_fn, template)
+            for name, pattern, tool, param_fn, template in self.rules
+        ]
+
+    def _confidence(self, name: str, params: Dict[str, Any]) -> float:
+        """根据参数是否可直接解析评估置信度"""
+        if name == "open_application":
+            # 只有每个应用名称都能在索引中精确命中时才跳过LLM
+            try:
+                match_index = MacOSTools.get_app_match_index()
+                names = MacOSTools._split_app_names(params["app_name"], match_index)
+                resolved = bool(names) and all(match_index.lookup_exact(n) for n in names)
+            except Exception:
+                resolved = False
+            return 1.0 if resolved else 0.5
+        if name == "set_system_volume":
+            return 1.0 if 0 <= params["volume"] <= 100 else 0.0
+        return 1.0
+
+    def route(self, user_input: str) -> Optional[Tuple[str, Any, Dict[str, Any], str]]:
+        """匹配快速通道
+
+        Args:
+            user_input: 用户输入
+
+        Returns:
+            (意图名称, 工具, 参数, 回答模板)，不满足条件时返回None
+        """
+        text = user_input.strip()
+        if not text or len(text) > 40:
+            return None
+        matches = []
+        for name, regex, tool, param_fn, template in self._compiled:
+            m = regex.match(text)
+            if m:
+                matches.append((name, tool, param_fn(m), template))
+        # 多个意图同时命中视为有歧义
+        if len(matches) != 1:
+            return None
+        name, tool, params, template = matches[0]
+        if self._confidence(name, params) < self.threshold:
+            return None
+        return name, tool, params, template
 
 class IntelligentMacOSAssistant:
     """增强智能的macOS系统助手"""
@@ -979,6 +5170,21 @@ class IntelligentMacOSAssistant:
         # 注册R1增强器到MacOSTools类
         MacOSTools.set_r1_enhancer(self.r1_enhancer)
         
+        # 在后台低优先级预热工具缓存（应用索引与目录监视、系统静态信息、psutil计数器）
+        self.warmup = MacOSTools.start_warmup()
+        
+        # 开启了文件名索引时在后台构建
+        MacOSTools.start_file_index()
+        
+        # 在后台持续采样系统指标，系统信息类工具直接读取最近的采样
+        MacOSTools.start_telemetry()
+        
+        # 本对话使用的持久shell会话标识
+        self.session_id = uuid.uuid4().hex
+        
+        # 当前请求的取消标志
+        self.cancel_event = threading.Event()
+        
         # 初始化use_r1_enhancement标志
         self.use_r1_enhancement = False
         
@@ -986,11 +5192,19 @@ class IntelligentMacOSAssistant:
         self.tools = [
             MacOSTools.get_system_info,
             MacOSTools.get_running_processes,
+            MacOSTools.query_processes,
+            MacOSTools.get_metrics_history,
             MacOSTools.open_application,
             MacOSTools.execute_terminal_command,
+            MacOSTools.start_job,
+            MacOSTools.job_status,
+            MacOSTools.job_output,
+            MacOSTools.cancel_job,
+            MacOSTools.read_full_output,
             MacOSTools.get_network_info,
             MacOSTools.get_battery_info,
             MacOSTools.search_files,
+            MacOSTools.search_file_contents,
             MacOSTools.get_installed_applications,
             MacOSTools.create_note,
             MacOSTools.set_system_volume,
@@ -1020,15 +5234,19 @@ class IntelligentMacOSAssistant:
         # 任务计数器（用于评估成功率）
         self.task_counter = 0
         self.success_counter = 0
+        
+        # 本地快速通道：简单指令直接调用工具，不经过LLM
+        self.fast_path_router = FastPathRouter()
+        self.fast_path_enabled = True
     
     def _init_system_prompts(self):
         """初始化不同模式的系统提示"""
         # 基础提示
         self.base_prompt = """你是一个macOS系统助手，类似于Windows Copilot。你的主要功能包括：
 
-1. 系统信息查询：获取系统状态、进程信息、网络状态、电池信息等
+1. 系统信息查询：获取系统状态、进程信息、系统负载历史、网络状态、电池信息等
 2. 应用程序管理：打开应用程序、查看已安装应用
-3. 文件操作：搜索文件、创建笔记
+3. 文件操作：搜索文件、按内容搜索文件、创建笔记
 4. 系统控制：设置音量、执行终端命令
 5. 时间查询：获取当前时间
 
@@ -1039,6 +5257,12 @@ class IntelligentMacOSAssistant:
 - 对于危险操作，要提醒用户风险
 - 优先使用安全的系统工具
 - 如果用户请求的操作超出你的能力范围，要明确说明
+- 需要同时打开多个应用时，只调用一次open_application并传入全部应用名称
+- 按内存、线程数、打开文件数查看进程，或查看某个应用、某个用户的进程时使用query_processes
+- 询问过去一段时间的系统负载或哪个进程最耗资源时使用get_metrics_history
+- 查找包含某些文字的文件时使用search_file_contents，不要用grep -r等终端命令
+- 多个互不依赖的终端命令(如创建多个文件夹并分别写入文件)可以合并为一次execute_terminal_command调用并设置parallel=True
+- 编译、brew安装、大文件复制等可能超过10秒的命令使用start_job在后台运行，再用job_status/job_output轮询进度，不要反复重试execute_terminal_command
 """
 
         # 思考链COT提示（包含详细的思考步骤）
@@ -1323,6 +5547,38 @@ class IntelligentMacOSAssistant:
         
         return intersection / union if union > 0 else 0.0
     
+    def _run_fast_path(self, user_input: str) -> Optional[Tuple[str, Dict[str, Any], str, str]]:
+        """尝试通过本地快速通道处理请求
+
+        Args:
+            user_input: 用户输入
+
+        Returns:
+            (工具名称, 参数, 工具结果, 回答)，不适用或执行失败时返回None
+        """
+        if not self.fast_path_enabled:
+            return None
+        route = self.fast_path_router.route(user_input)
+        if route is None:
+            return None
+        name, tool, params, template = route
+        try:
+            result = tool.invoke(params)
+        except Exception as e:
+            print(f"快速通道执行失败，回退到Agent: {str(e)}")
+            return None
+        result = str(result).strip()
+        # 工具报告失败时直接返回工具结果，不套用模板
+        if any(marker in result for marker in ("失败", "出错", "无法", "未找到")):
+            answer = result
+        else:
+            answer = template.format(result=result)
+        
+        self.chat_history.append(HumanMessage(content=user_input))
+        self.chat_history.append(AIMessage(content=answer))
+        self.success_counter += 1
+        return name, params, result, answer
+    
     def chat_stream(self, user_input: str) -> Generator[str, None, None]:
         """根据用户输入生成流式AI响应
         
@@ -1338,6 +5594,27 @@ class IntelligentMacOSAssistant:
         try:
             # 任务计数增加
             self.task_counter += 1
+            MacOSTools.set_shell_session(self.session_id)
+            self.cancel_event = threading.Event()
+            MacOSTools.set_cancel_event(self.cancel_event)
+            
+            # 0. 简单指令走本地快速通道
+            fast_result = self._run_fast_path(user_input)
+            if fast_result:
+                name, params, result, answer = fast_result
+                yield f"【快速通道】{name}\n"
+                yield f"\n\n🔧 【工具调用】{name}\n"
+                if params:
+                    yield f"参数：{json.dumps(params, ensure_ascii=False, indent=2)}\n"
+                yield "\n📊 【工具返回 #1】\n"
+                for line in result.strip().split('\n'):
+                    yield f"  {line}\n"
+                yield "\n\n📝 【最终回答】\n"
+                yield answer
+                yield f"\n\n{'-' * 40}\n"
+                yield "✅ 处理完成 | 共调用 1 个工具\n"
+                yield f"{'-' * 40}\n"
+                return
             
             # 1. 评估任务复杂度
             complexity = self._evaluate_task_complexity(user_input)
@@ -1378,7 +5655,9 @@ class IntelligentMacOSAssistant:
             success = True
             is_thinking = False
             thinking_content = ""
-            response_queue = []  # 用于存储需要yield的内容
+            # 需要yield的内容：回调产生的文本和执行器的输出块都放入同一个线程安全队列。
+            # 执行器在工作线程中运行，工具执行期间的实时输出可以立即yield，不必等待下一个输出块
+            response_queue = queue.Queue()
             is_framework_output = False  # 用于标记框架输出
             has_shown_final_response = False  # 标记是否已显示最终回答标题
             
@@ -1414,38 +5693,45 @@ class IntelligentMacOSAssistant:
                 nonlocal is_thinking, thinking_content, response_queue
                 is_thinking = thinking
                 if thinking:
-                    response_queue.append("\n\n🧠 【思考过程】\n")
+                    response_queue.put(("text", "\n\n🧠 【思考过程】\n"))
                 else:
                     if thinking_content.strip():
-                        response_queue.append(f"{thinking_content}\n")
+                        response_queue.put(("text", f"{thinking_content}\n"))
                         # 在思考结束后添加最终回答标记
-                        response_queue.append("\n\n📝 【最终回答】\n")
+                        response_queue.put(("text", "\n\n📝 【最终回答】\n"))
                     thinking_content = ""
             
             # 处理函数调用
             def handle_function_call(name, args):
                 nonlocal response_queue
                 args_str = json.dumps(args, ensure_ascii=False, indent=2) if args else ""
-                response_queue.append(f"\n\n🔧 【工具调用】{name}\n")
+                response_queue.put(("text", f"\n\n🔧 【工具调用】{name}\n"))
                 if args_str:
-                    response_queue.append(f"参数：{args_str}\n")
+                    response_queue.put(("text", f"参数：{args_str}\n"))
             
             # 处理函数返回结果
             def handle_function_result(result):
                 nonlocal response_queue
                 # 使用self的属性而不是nonlocal变量
                 self.function_results.append(result)
-                response_queue.append(f"\n📊 【工具返回 #{len(self.function_results)}】\n")
+                response_queue.put(("text", f"\n📊 【工具返回 #{len(self.function_results)}】\n"))
                 for line in result.strip().split('\n'):
-                    response_queue.append(f"  {line}\n")
+                    response_queue.put(("text", f"  {line}\n"))
+            
+            # 处理工具执行过程中的实时输出
+            def handle_tool_output(line, stream):
+                nonlocal response_queue
+                response_queue.put(("text", f"  │ {line}\n"))
             
             # 创建增强的流式处理器
             streaming_handler = EnhancedStreamingHandler(
                 streaming_callback=token_callback,
                 thinking_callback=handle_thinking_state,
                 function_call_callback=handle_function_call,
-                function_result_callback=handle_function_result
+                function_result_callback=handle_function_result,
+                tool_output_callback=handle_tool_output
             )
+            MacOSTools.set_output_sink(streaming_handler.on_tool_output)
             
             try:
                 # 设置流式响应配置
@@ -1457,45 +5743,62 @@ class IntelligentMacOSAssistant:
                 # 初始时添加最终回答标记，仅当没有思考过程时使用
                 final_response_marked = False
                 
-                for chunk in executor.stream({
-                    "input": enhanced_input,
-                    "chat_history": self.chat_history
-                }, config=stream_config):
-                    # 首先处理queue中的响应
-                    while response_queue:
-                        item = response_queue.pop(0)
-                        # 检查是否为最终回答标记
-                        if "【最终回答】" in item:
-                            final_response_marked = True
-                        yield item
-                        
-                    if "output" in chunk:
-                        # 获取新的文本片段
-                        new_text = chunk["output"]
-                        if new_text and new_text != full_response:
-                            # 只返回新增的部分
-                            delta = new_text[len(full_response):]
-                            full_response = new_text
-                            if delta and not is_thinking:
-                                # 如果没有任何标记，添加一个最终回答标记
-                                if not final_response_marked and not has_shown_final_response:
-                                    has_shown_final_response = True
-                                    yield "\n\n📝 【最终回答】\n"
-                                    final_response_marked = True
-                                yield delta
-                            
-                            # 处理缓冲区中的任何令牌
-                            while buffer and not is_thinking:
-                                token = buffer.pop(0)
-                                if token:  # 避免空令牌
-                                    yield token
+                stop_stream = threading.Event()
+                
+                def run_executor():
+                    try:
+                        for chunk in executor.stream({
+                            "input": enhanced_input,
+                            "chat_history": self.chat_history
+                        }, config=stream_config):
+                            response_queue.put(("chunk", chunk))
+                            if stop_stream.is_set():
+                                break
+                        response_queue.put(("done", None))
+                    except Exception as e:
+                        response_queue.put(("error", e))
                 
-                # 处理任何剩余的response_queue内容
-                while response_queue:
-                    item = response_queue.pop(0)
-                    if "【最终回答】" in item:
-                        final_response_marked = True
-                    yield item
+                worker = threading.Thread(target=run_executor, name="chat-stream-executor", daemon=True)
+                worker.start()
+                finished = False
+                try:
+                    while not finished:
+                        kind, item = response_queue.get()
+                        if kind == "text":
+                            # 检查是否为最终回答标记
+                            if "【最终回答】" in item:
+                                final_response_marked = True
+                            yield item
+                        elif kind == "error":
+                            finished = True
+                            raise item
+                        elif kind == "done":
+                            finished = True
+                        elif "output" in item:
+                            # 获取新的文本片段
+                            new_text = item["output"]
+                            if new_text and new_text != full_response:
+                                # 只返回新增的部分
+                                delta = new_text[len(full_response):]
+                                full_response = new_text
+                                if delta and not is_thinking:
+                                    # 如果没有任何标记，添加一个最终回答标记
+                                    if not final_response_marked and not has_shown_final_response:
+                                        has_shown_final_response = True
+                                        yield "\n\n📝 【最终回答】\n"
+                                        final_response_marked = True
+                                    yield delta
+                                
+                                # 处理缓冲区中的任何令牌
+                                while buffer and not is_thinking:
+                                    token = buffer.pop(0)
+                                    if token:  # 避免空令牌
+                                        yield token
+                finally:
+                    if not finished:
+                        # 调用方提前关闭了生成器：通知执行器和正在运行的工具尽快结束
+                        stop_stream.set()
+                        self.cancel_event.set()
                     
                 # 处理任何剩余的缓冲区内容
                 while buffer and not is_thinking:
@@ -1544,6 +5847,8 @@ class IntelligentMacOSAssistant:
                         yield f"\n【重试失败】{str(retry_e)}\n"
                         # 记录失败
                         self._track_success(complexity, next_architecture, False)
+            finally:
+                MacOSTools.set_output_sink(None)
             
             # 6. 更新聊天历史
             self.chat_history.append(HumanMessage(content=user_input))
@@ -1571,13 +5876,24 @@ class IntelligentMacOSAssistant:
             return error_msg
     
     def reset_chat(self):
-        """重置聊天历史"""
+        """重置聊天历史，并关闭本对话的shell会话"""
         self.chat_history = []
+        if MacOSTools.shell_pool is not None:
+            MacOSTools.shell_pool.close_session(self.session_id)
+        self.session_id = uuid.uuid4().hex
     
     def set_user_preference(self, complexity_level: Optional[ArchitectureType] = None):
         """设置用户偏好"""
         self.user_context["preferred_complexity_level"] = complexity_level
     
+    def cancel_current_task(self):
+        """取消正在处理的请求，正在运行的文件搜索等工具会尽快结束"""
+        self.cancel_event.set()
+    
+    def get_warmup_status(self) -> Dict[str, Any]:
+        """获取后台预热状态"""
+        return self.warmup.status()
+    
     def get_performance_metrics(self) -> Dict[str, Any]:
         """获取性能指标"""
         success_rate = self.success_counter / self.task_counter if self.task_counter > 0 else 0
@@ -1586,7 +5902,11 @@ class IntelligentMacOSAssistant:
             "total_tasks": self.task_counter,
             "successful_tasks": self.success_counter,
             "success_rate": success_rate,
-            "strategy_effectiveness": self.user_context["successful_strategies"]
+            "strategy_effectiveness": self.user_context["successful_strategies"],
+            "command_cache": MacOSTools.command_cache.stats(),
+            "file_search": MacOSTools.get_search_stats(),
+            "telemetry": MacOSTools.telemetry.stats() if MacOSTools.telemetry else None,
+            "search_command_cache": self.r1_enhancer.search_command_cache.stats()
         }
     
     def stream_with_handler(self, user_input: str, custom_handler) -> Generator[str, None, None]:
@@ -1594,6 +5914,22 @@ class IntelligentMacOSAssistant:
         try:
             # 任务计数增加
             self.task_counter += 1
+            MacOSTools.set_shell_session(self.session_id)
+            self.cancel_event = threading.Event()
+            MacOSTools.set_cancel_event(self.cancel_event)
+            
+            # 0. 简单指令走本地快速通道
+            fast_result = self._run_fast_path(user_input)
+            if fast_result:
+                name, params, result, answer = fast_result
+                if hasattr(custom_handler, "on_function_call") and callable(custom_handler.on_function_call):
+                    custom_handler.on_function_call(name, params)
+                if hasattr(custom_handler, "on_function_result") and callable(custom_handler.on_function_result):
+                    custom_handler.on_function_result(result)
+                if hasattr(custom_handler, "emit_text") and callable(custom_handler.emit_text):
+                    custom_handler.emit_text(answer)
+                yield answer
+                return
             
             # 1. 评估任务复杂度
             complexity = self._evaluate_task_complexity(user_input)
@@ -1663,6 +5999,10 @@ class IntelligentMacOSAssistant:
             # 创建函数调用跟踪器
             function_tracker = FunctionCallTracker()
             
+            # 工具的实时输出交给自定义处理器
+            if hasattr(custom_handler, "on_tool_output") and callable(custom_handler.on_tool_output):
+                MacOSTools.set_output_sink(custom_handler.on_tool_output)
+            
             try:
                 # 使用自定义处理器
                 stream_config = {"callbacks": [custom_handler, function_tracker]}
@@ -1714,6 +6054,8 @@ class IntelligentMacOSAssistant:
                         yield f"\n高级架构也失败了: {str(retry_e)}"
                         # 记录失败
                         self._track_success(complexity, next_architecture, False)
+            finally:
+                MacOSTools.set_output_sink(None)
             
             # 6. 更新聊天历史
             self.chat_history.append(HumanMessage(content=user_input))
@@ -1792,6 +6134,7 @@ class IntelligentMacOSAssistant:
 9. set_system_volume(volume)
 10. get_current_time()
 11. get_installed_applications()
+12. start_job(command)
 用户请求：{task_text}
 请判断应该调用哪个工具，并给出参数，返回JSON格式：{{"tool": "...", "params": {{...}}}}
 """
@@ -2138,6 +6481,9 @@ def main():
                 for line in result.strip().split('\n'):
                     print(f"  {line}")
             
+            def on_tool_output(line, stream):
+                print(f"  │ {line}", flush=True)
+            
             # 创建增强的流式处理器
             streaming_handler = EnhancedStreamingHandler(
                 streaming_callback=on_token,
@@ -2145,7 +6491,8 @@ def main():
                 thinking_callback=on_thinking_change,
                 end_callback=lambda: None,  # 不在这里输出处理完成
                 function_call_callback=on_function_call,
-                function_result_callback=on_function_result
+                function_result_callback=on_function_result,
+                tool_output_callback=on_tool_output
             )
             
             # 使用自定义处理器的流式输出
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件内容搜索的工作进程函数
+
+ContentSearchEngine(见agent.py)把候选文件分批交给线程池，由这里的函数用mmap扫描。
+本模块只依赖标准库，不引用agent.py中的任何状态，可以单独导入和测试。
+"""
+
+import os
+import re
+import mmap
+
+# 用于判断二进制文件的嗅探长度
+SNIFF_SIZE = 8192
+# 单行最多保留的字符数
+MAX_LINE_CHARS = 200
+
+
+def _decode_line(data, start, end):
+    text = bytes(data[start:end]).decode('utf-8', errors='replace').rstrip('\r')
+    return text if len(text) <= MAX_LINE_CHARS else text[:MAX_LINE_CHARS] + "…"
+
+
+def find_matches(data, regex, context=1, max_matches=5):
+    """在缓冲区中查找匹配行
+
+    Args:
+        data: bytes或mmap对象
+        regex: 编译好的bytes正则
+        context: 匹配行前后附带的上下文行数
+        max_matches: 最多返回的匹配行数(同一行的多处匹配只算一次)
+
+    Returns:
+        [{"line": 行号, "text": 匹配行, "before": [上文], "after": [下文]}]
+    """
+    matches = []
+    size = len(data)
+    pos = 0
+    line_no = 1
+    counted_to = 0
+    while len(matches) < max_matches:
+        match = regex.search(data, pos)
+        if match is None:
+            break
+        start = data.rfind(b"\n", 0, match.start()) + 1
+        end = data.find(b"\n", match.start())
+        if end < 0:
+            end = size
+        # 行号增量计算，避免每次从文件开头数换行(mmap没有count方法，只复制两次匹配之间的片段)
+        line_no += data[counted_to:start].count(b"\n")
+        counted_to = start
+
+        before = []
+        cursor = start
+        for _ in range(context):
+            if cursor == 0:
+                break
+            prev_start = data.rfind(b"\n", 0, cursor - 1) + 1
+            before.insert(0, _decode_line(data, prev_start, cursor - 1))
+            cursor = prev_start
+        after = []
+        cursor = end
+        for _ in range(context):
+            if cursor >= size:
+                break
+            next_end = data.find(b"\n", cursor + 1)
+            if next_end < 0:
+                next_end = size
+            after.append(_decode_line(data, cursor + 1, next_end))
+            cursor = next_end
+
+        matches.append({"line": line_no, "text": _decode_line(data, start, end),
+                        "before": before, "after": after})
+        pos = end + 1
+        if pos >= size:
+            break
+    return matches
+
+
+def scan_files(paths, pattern, flags=0, context=1, max_matches_per_file=5):
+    """扫描一批文件，跳过二进制文件
+
+    Args:
+        paths: 文件路径列表
+        pattern: bytes正则表达式
+        flags: 正则标志
+        context: 上下文行数
+        max_matches_per_file: 每个文件最多返回的匹配行数
+
+    Returns:
+        ([(路径, 匹配列表)], 实际扫描的字节数)
+    """
+    regex = re.compile(pattern, flags)
+    results = []
+    scanned = 0
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                sniff = f.read(SNIFF_SIZE)
+                # 含NUL字节的视为二进制文件
+                if not sniff or b"\0" in sniff:
+                    continue
+                size = os.fstat(f.fileno()).st_size
+                scanned += size
+                if size <= len(sniff):
+                    matches = find_matches(sniff, regex, context, max_matches_per_file)
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        matches = find_matches(data, regex, context, max_matches_per_file)
+            if matches:
+                results.append((path, matches))
+        except (OSError, ValueError):
+            continue
+    return results, scanned
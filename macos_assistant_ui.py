@@ -172,8 +172,10 @@ class StreamingAssistantWorker(QThread):
         self.streaming_handler = None
 
     def stop(self):
-        """停止流式输出处理"""
+        """停止流式输出处理，并通知助手取消正在运行的工具"""
         self.active = False
+        if hasattr(self.assistant, 'cancel_current_task'):
+            self.assistant.cancel_current_task()
 
     def run(self):
         try:
@@ -185,7 +187,8 @@ class StreamingAssistantWorker(QThread):
                 streaming_callback=lambda token: self.handle_token(token),
                 thinking_callback=lambda is_thinking: self.signals.stream_thinking.emit(is_thinking),
                 start_callback=lambda: self.signals.stream_start.emit(),
-                end_callback=lambda: self.signals.stream_end.emit()
+                end_callback=lambda: self.signals.stream_end.emit(),
+                tool_output_callback=lambda line, stream: self.handle_token(f"> {line}\n")
             )
             
             # 使用流式响应
@@ -1378,6 +1381,33 @@ class MacOSAssistantUI(QMainWindow):
         """)
         button_layout.addWidget(self.clear_button)
         
+        # 停止当前任务按钮(如正在进行的文件搜索)
+        self.stop_button = QPushButton(" ⏹ 停止 ")
+        self.stop_button.clicked.connect(self.stop_current_task)
+        self.stop_button.setEnabled(False)
+        self.stop_button.setToolTip("停止正在处理的请求")
+        self.stop_button.setStyleSheet("""
+            QPushButton {
+                background-color: white;
+                color: #424242;
+                border: 1px solid #d0d0d0;
+                border-radius: 8px;
+                font-size: 13px;
+                font-weight: 600;
+                padding: 8px 16px;
+                min-width: 70px;
+            }
+            QPushButton:hover {
+                background-color: #f0f0f0;
+                border-color: #bababa;
+            }
+            QPushButton:disabled {
+                color: #b0b0b0;
+                border-color: #e5e5e5;
+            }
+        """)
+        button_layout.addWidget(self.stop_button)
+        
         control_panel_layout.addWidget(button_container, 2)
         input_layout.addWidget(control_panel)
         
@@ -1553,6 +1583,27 @@ class MacOSAssistantUI(QMainWindow):
         
         status_layout.addWidget(complexity_status_widget)
         
+        # 工具预热状态指示器
+        warmup_status_widget = QWidget()
+        warmup_status_widget.setStyleSheet("background-color: transparent;")
+        warmup_status_layout = QHBoxLayout(warmup_status_widget)
+        warmup_status_layout.setContentsMargins(8, 0, 8, 0)
+        warmup_status_layout.setSpacing(6)
+        
+        warmup_icon = QLabel("⚡")
+        warmup_icon.setStyleSheet("font-size: 16px;")
+        warmup_status_layout.addWidget(warmup_icon)
+        
+        warmup_label = QLabel("工具预热")
+        warmup_label.setStyleSheet("font-size: 13px; color: #424242; font-weight: 500;")
+        warmup_status_layout.addWidget(warmup_label)
+        
+        self.warmup_status = QLabel("准备中")
+        self.warmup_status.setStyleSheet("font-size: 13px; color: #f0ad4e; font-weight: 500;")
+        warmup_status_layout.addWidget(self.warmup_status)
+        
+        status_layout.addWidget(warmup_status_widget)
+        
         status_layout.addStretch(1)
         
         return status_container
@@ -1694,6 +1745,14 @@ class MacOSAssistantUI(QMainWindow):
         self.assistant_worker.signals.result.connect(self.handle_assistant_response)
         self.assistant_worker.signals.error.connect(self.handle_error)
         self.assistant_worker.start()
+        self.stop_button.setEnabled(True)
+    
+    def stop_current_task(self):
+        """停止正在处理的请求"""
+        if hasattr(self, 'assistant_worker') and self.assistant_worker is not None:
+            self.assistant_worker.stop()
+        self.update_status("已停止")
+        self.on_stream_end()
     
     def on_stream_start(self):
         """流式输出开始时的处理"""
@@ -1704,6 +1763,7 @@ class MacOSAssistantUI(QMainWindow):
         """流式输出结束时的处理"""
         # 流式输出完成后的UI更新
         self.update_status("回答已完成")
+        self.stop_button.setEnabled(False)
         
         # 确保打字指示器被关闭
         if hasattr(self, 'current_assistant_bubble') and self.current_assistant_bubble:
@@ -1972,6 +2032,19 @@ class MacOSAssistantUI(QMainWindow):
     def update_intelligence_indicators(self):
         """更新智能指标显示"""
         try:
+            # 更新工具预热状态
+            if hasattr(self.assistant, 'get_warmup_status') and hasattr(self, 'warmup_status'):
+                warmup = self.assistant.get_warmup_status()
+                if warmup["state"] == "ready":
+                    self.warmup_status.setText("已就绪")
+                    self.warmup_status.setStyleSheet("font-size: 13px; color: #28a745; font-weight: 500;")
+                elif warmup["state"] == "degraded":
+                    self.warmup_status.setText("部分完成")
+                    self.warmup_status.setStyleSheet("font-size: 13px; color: #fd7e14; font-weight: 500;")
+                else:
+                    self.warmup_status.setText(f"预热中 ({warmup['completed']}/{warmup['total']})")
+                    self.warmup_status.setStyleSheet("font-size: 13px; color: #f0ad4e; font-weight: 500;")
+            
             # 获取当前架构信息
             if hasattr(self.assistant, 'user_context'):
                 # 获取最后一次处理的任务架构和复杂度
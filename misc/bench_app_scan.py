@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+应用扫描基准测试：对比 find 子进程与 ApplicationIndex 的 os.scandir 扫描器
+
+在临时目录中生成包含数千个 .app 包的合成目录树，分别计时:
+1. 旧方案: find <root> -name '*.app' -type d
+2. 新方案: ApplicationIndex.scan_root (遇到 .app 即停止，多目录并发)
+
+用法: python misc/bench_app_scan.py [应用数量] [重复次数]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import ApplicationIndex
+
+
+def build_tree(base, app_count, roots=4):
+    """生成合成应用目录树，每个应用包含典型的Contents结构和一个内嵌helper应用"""
+    root_paths = []
+    for r in range(roots):
+        root = os.path.join(base, f"root{r}")
+        root_paths.append(root)
+        os.makedirs(root)
+    for i in range(app_count):
+        root = root_paths[i % roots]
+        # 部分应用放在厂商子目录中
+        parent = os.path.join(root, f"Vendor{i % 50}") if i % 3 == 0 else root
+        app = os.path.join(parent, f"App{i}.app", "Contents")
+        for sub in ("MacOS", "Resources/en.lproj", "Resources/zh_CN.lproj", "Frameworks"):
+            os.makedirs(os.path.join(app, sub), exist_ok=True)
+        os.makedirs(os.path.join(app, "Frameworks", f"Helper{i}.app", "Contents", "MacOS"))
+        with open(os.path.join(app, "Info.plist"), "w") as f:
+            f.write("<plist/>")
+        for n in range(5):
+            with open(os.path.join(app, "Resources", f"asset{n}.png"), "w") as f:
+                f.write("x")
+    return root_paths
+
+
+def bench_find(roots):
+    apps = []
+    for root in roots:
+        result = subprocess.run(['find', root, '-name', '*.app', '-type', 'd'],
+                                capture_output=True, text=True, timeout=60)
+        apps.extend(p for p in result.stdout.strip().split('\n') if p)
+    return apps
+
+
+def bench_scandir(roots, index_path):
+    index = ApplicationIndex(search_paths=roots, index_path=index_path)
+    index.refresh(force=True)
+    return index.get_applications()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    app_count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    base = tempfile.mkdtemp(prefix="bench_app_scan_")
+    try:
+        print(f"生成 {app_count} 个应用包...", flush=True)
+        roots = build_tree(base, app_count)
+        index_path = os.path.join(base, "app_index.json")
+
+        find_time, find_apps = timed(lambda: bench_find(roots), repeat)
+        scan_time, scan_apps = timed(lambda: bench_scandir(roots, index_path), repeat)
+
+        print(f"find:    {find_time * 1000:8.1f} ms  ({len(find_apps)} 个结果，含内嵌helper)")
+        print(f"scandir: {scan_time * 1000:8.1f} ms  ({len(scan_apps)} 个应用)")
+        print(f"加速比:  {find_time / scan_time:.1f}x")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
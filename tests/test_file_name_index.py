@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""FileNameIndex的回归测试"""
+
+import os
+
+from agent import FileNameIndex, MacOSTools
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("x")
+
+
+def _build(tmp_path):
+    root = tmp_path / "root"
+    _touch(str(root / "report.pdf"))
+    _touch(str(root / "sub" / "report2.pdf"))
+    _touch(str(tmp_path / "rootx" / "report3.pdf"))
+    index = FileNameIndex([str(root)], db_path=str(tmp_path / "index.sqlite3"))
+    index.build(str(root))
+    return index, os.path.realpath(str(root))
+
+
+def test_query_includes_direct_children(tmp_path):
+    index, root = _build(tmp_path)
+    paths = {item["path"] for item in index.query("report", root)}
+    assert os.path.join(root, "report.pdf") in paths
+    assert os.path.join(root, "sub", "report2.pdf") in paths
+
+
+def test_query_like_includes_direct_children(tmp_path):
+    index, root = _build(tmp_path)
+    # 不足3个字符及通配符查询走LIKE分支
+    for query in ("re", "*.pdf"):
+        paths = {item["path"] for item in index.query(query, root)}
+        assert os.path.join(root, "report.pdf") in paths
+
+
+def test_query_excludes_sibling_prefix(tmp_path):
+    index, root = _build(tmp_path)
+    paths = {item["path"] for item in index.query("report", root)}
+    assert not any("rootx" in path for path in paths)
+
+
+def test_search_falls_back_to_walk_for_unindexed_files(tmp_path, monkeypatch):
+    index, root = _build(tmp_path)
+    # 建索引之后新建、尚未刷新的文件
+    _touch(os.path.join(root, "fresh_notes.txt"))
+    monkeypatch.setattr(MacOSTools, "file_index", index)
+    stats = {}
+    paths = list(MacOSTools.iter_search_files("fresh_notes", root, stats=stats))
+    assert paths == [os.path.join(root, "fresh_notes.txt")]
+    assert stats["source"] == "walk"
+    stats = {}
+    list(MacOSTools.iter_search_files("report", root, stats=stats))
+    assert stats["source"] == "index"
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""OutputCapture的测试"""
+
+import os
+
+from agent import OutputCapture
+
+
+def spooled_capture():
+    capture = OutputCapture(spool_threshold=1024)
+    capture.write(b"x" * 20000 + b"\n")
+    assert capture._spool_path and os.path.exists(capture._spool_path)
+    return capture
+
+
+def test_close_removes_unregistered_spool():
+    capture = spooled_capture()
+    path = capture._spool_path
+    with capture:
+        assert capture.getvalue().startswith("xxx")
+    assert not os.path.exists(path)
+
+
+def test_close_keeps_registered_spool():
+    capture = spooled_capture()
+    capture.summary()
+    assert capture.handle is not None
+    capture.close()
+    assert os.path.exists(capture._spool_path)
+    assert OutputCapture.get(capture.handle).read_lines(0, 1)[0].startswith("xxx")
+    capture.discard()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""ShellSessionPool的测试"""
+
+import os
+
+import pytest
+
+from agent import ShellSessionPool
+
+
+@pytest.fixture
+def pool():
+    pool = ShellSessionPool()
+    yield pool
+    pool.close_all()
+
+
+def test_cd_and_export_persist(pool, tmp_path):
+    pool.run("k", f"cd {tmp_path}")
+    pool.run("k", "export COPILOT_TEST_VAR=hello")
+    out, _, returncode, _ = pool.run("k", 'pwd; echo "$COPILOT_TEST_VAR"')
+    assert returncode == 0
+    assert out.getvalue().split("\n")[:2] == [os.path.realpath(str(tmp_path)), "hello"]
+    cwd, env = pool.get_state("k")
+    assert cwd == os.path.realpath(str(tmp_path))
+    assert env["COPILOT_TEST_VAR"] == "hello"
+
+
+def test_blank_lines_kept(pool):
+    out, _, _, _ = pool.run("k", "echo; echo")
+    assert out.getvalue() == "\n\n"
+
+
+def test_exit_returns_code_and_replaces_session(pool):
+    _, _, returncode, timed_out = pool.run("k", "exit 3")
+    assert returncode == 3 and not timed_out
+    out, _, returncode, _ = pool.run("k", "echo after")
+    assert returncode == 0
+    assert out.getvalue() == "after\n"
+
+
+def test_timeout_kills_session(pool):
+    _, _, _, timed_out = pool.run("k", "sleep 5", timeout=0.5)
+    assert timed_out
+    out, _, returncode, _ = pool.run("k", "echo after")
+    assert returncode == 0
+    assert out.getvalue() == "after\n"
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""StepDependencyGraph的测试"""
+
+from agent import StepDependencyGraph
+
+
+def test_independent_steps_run_in_parallel():
+    graph = StepDependencyGraph.parse("mkdir a && mkdir b && touch c", cwd="/work")
+    assert graph.deps == [set(), set(), set()]
+    assert not any(graph.barriers)
+
+
+def test_relative_and_absolute_paths_conflict():
+    graph = StepDependencyGraph.parse("mkdir A; touch /work/A/f", cwd="/work")
+    assert graph.deps[1] == {0}
+
+
+def test_relative_paths_resolved_against_cwd():
+    graph = StepDependencyGraph.parse("touch A; cat /other/A", cwd="/work")
+    assert graph.deps[1] == set()
+
+
+def test_option_values_are_not_paths():
+    graph = StepDependencyGraph.parse("mkdir -m 755 A; head -n 5 B", cwd="/work")
+    assert graph.paths == [{"/work/A"}, {"/work/B"}]
+    assert graph.deps[1] == set()
+
+
+def test_numeric_file_names_are_paths():
+    graph = StepDependencyGraph.parse("mkdir 2024; touch 2024/log", cwd="/work")
+    assert graph.deps[1] == {0}
+
+
+def test_cwd_without_arguments():
+    graph = StepDependencyGraph.parse("ls; touch f", cwd="/work")
+    assert graph.deps[1] == {0}
+
+
+def test_cd_updates_cwd_for_later_steps():
+    graph = StepDependencyGraph.parse("cd /tmp; touch a; cat /tmp/a", cwd="/work")
+    assert graph.barriers == [True, False, False]
+    assert graph.deps[2] == {0, 1}
+
+
+def test_unknown_cwd_makes_later_steps_barriers():
+    graph = StepDependencyGraph.parse("pushd /tmp; touch a; touch b", cwd="/work")
+    assert graph.barriers == [True, True, True]
+
+
+def test_unlisted_and_compound_commands_are_barriers():
+    graph = StepDependencyGraph.parse("git status; touch a", cwd="/work")
+    assert graph.barriers == [True, False]
+    assert graph.deps[1] == {0}
+    assert StepDependencyGraph.is_compound("for f in *; do echo $f; done")